@@ -0,0 +1,117 @@
+"""
+统计表 (预先算好的计数)
+
+- work_count：作品按 (作家, 文类, 年份) 分组的篇数
+- material_count：史料按 (作家, 刊物) 分组的条数，first_id 记录每组第一条史料的 id (保持原来的显示顺序)
+
+由 init_db.py / init_materials.py 在导入的同一个事务里重新计算 (refresh)；
+网站读这两张小表就能得到年份下拉框、旭日图和筛选项旁边的计数，不用再扫作品 / 史料表。
+数据库里还没有统计表时 (旧数据库)，直接从原表分组统计，结果一样。
+"""
+from collections import namedtuple
+
+from sqlalchemy import text
+
+WorkCount = namedtuple('WorkCount', ['author', 'genre', 'year', 'n'])
+MaterialCount = namedtuple('MaterialCount', ['author', 'publication', 'n', 'first_id'])
+
+# 分组统计的 SQL (建表和没有统计表时的退路共用)
+_WORK_GROUPS = ("SELECT COALESCE(author, ''), COALESCE(genre, ''), COALESCE(year, 0), COUNT(*) "
+                "FROM work GROUP BY 1, 2, 3")
+_MATERIAL_GROUPS = ("SELECT COALESCE(author, ''), COALESCE(publication, ''), COUNT(*), MIN(id) "
+                    "FROM material GROUP BY 1, 2")
+
+# ============================================
+# 1. 导入脚本调用
+# ============================================
+
+def _has_table(conn, name):
+    row = conn.execute(text("SELECT 1 FROM sqlite_master WHERE type='table' AND name=:name"),
+                       {'name': name}).first()
+    return row is not None
+
+def refresh(conn):
+    """重新计算两张统计表 (表不存在时先建表)"""
+    conn.execute(text('CREATE TABLE IF NOT EXISTS work_count ('
+                      'author TEXT NOT NULL, genre TEXT NOT NULL, year INTEGER NOT NULL, n INTEGER NOT NULL, '
+                      'PRIMARY KEY (author, genre, year)) WITHOUT ROWID'))
+    conn.execute(text('CREATE TABLE IF NOT EXISTS material_count ('
+                      'author TEXT NOT NULL, publication TEXT NOT NULL, n INTEGER NOT NULL, first_id INTEGER NOT NULL, '
+                      'PRIMARY KEY (author, publication)) WITHOUT ROWID'))
+    conn.execute(text('DELETE FROM work_count'))
+    conn.execute(text('DELETE FROM material_count'))
+    if _has_table(conn, 'work'):
+        conn.execute(text(f'INSERT INTO work_count (author, genre, year, n) {_WORK_GROUPS}'))
+    if _has_table(conn, 'material'):
+        conn.execute(text(f'INSERT INTO material_count (author, publication, n, first_id) {_MATERIAL_GROUPS}'))
+
+# ============================================
+# 2. 网站读取
+# ============================================
+
+def work_counts(conn):
+    if _has_table(conn, 'work_count'):
+        rows = conn.execute(text('SELECT author, genre, year, n FROM work_count'))
+    else:
+        rows = conn.execute(text(_WORK_GROUPS))
+    return [WorkCount(*row) for row in rows]
+
+def material_counts(conn):
+    """按每组第一条史料的 id 排序 (和逐条遍历史料时各组出现的顺序一致)"""
+    if _has_table(conn, 'material_count'):
+        rows = conn.execute(text('SELECT author, publication, n, first_id FROM material_count ORDER BY first_id'))
+    else:
+        rows = conn.execute(text(_MATERIAL_GROUPS + ' ORDER BY 4'))
+    return [MaterialCount(*row) for row in rows]
+
+def year_key(year):
+    """年份在筛选参数里的写法：0 / 空 写作 'unknown'"""
+    return str(year) if year else 'unknown'
+
+def facets(rows, filters, key_funcs):
+    """
+    功能：筛选项计数。对每个维度，统计“其他维度按当前筛选、这个维度取各个值”时的条数。
+    filters：{维度: 当前值}，值为 'all' 表示不筛选
+    key_funcs：{维度: 从统计行取出这个维度的值的函数}
+    返回 {维度: {值: 条数}}
+    """
+    result = {dim: {} for dim in key_funcs}
+    for row in rows:
+        keys = {dim: func(row) for dim, func in key_funcs.items()}
+        failed = [dim for dim, value in filters.items() if value != 'all' and keys[dim] != value]
+        for dim in key_funcs:
+            # 只有这个维度本身不满足 (或都满足) 时才计入这个维度的计数
+            if not failed or failed == [dim]:
+                counts = result[dim]
+                counts[keys[dim]] = counts.get(keys[dim], 0) + row.n
+    return result
+
+def sunburst(rows, author_names):
+    """
+    功能：史料旭日图 (作家 -> 刊物) 的 Plotly 数据，rows 是已经筛选过的 material_counts。
+    返回 (ids, labels, parents, values)
+    """
+    stats = {}
+    for row in rows:
+        # 获取中文人名 / 刊物名
+        author_name = author_names.get(row.author, row.author) if row.author else "未知作者"
+        pub_name = row.publication if row.publication else "其他刊物"
+        pubs = stats.setdefault(author_name, {})
+        pubs[pub_name] = pubs.get(pub_name, 0) + row.n
+
+    # (1) 圆心
+    root_id = "总览"
+    ids, labels, parents, values = [root_id], ["史料总览"], [""], [sum(row.n for row in rows)]
+
+    # (2) 作家层 + 刊物层
+    for author, pubs in stats.items():
+        ids.append(author)
+        labels.append(author)
+        parents.append(root_id)
+        values.append(sum(pubs.values()))
+        for pub, count in pubs.items():
+            ids.append(f"{author}-{pub}")
+            labels.append(pub)
+            parents.append(author)
+            values.append(count)
+    return ids, labels, parents, values
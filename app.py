@@ -1,16 +1,103 @@
 import os
 import re
-import zhconv
-from flask import Flask, render_template, request, abort
+import threading
+from collections import OrderedDict
+import aggregates
+import db_config
+import search_index
+import search_query
+import site_search
+import trends
+import snippets
+import zh_convert
+from cache import ResponseCache
+from image_variants import ImageVariants
+from thumbnails import Thumbnails
+from precompress import Precompressed
+from large_files import LargeFiles
+from template_cache import TemplateCache
+from json_api import JsonApi
+import media_index
+from instrumentation import Instrumentation, stage
+import export_site
+from flask import Flask, render_template, request, abort, redirect, stream_template, url_for, jsonify, send_file
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import distinct
+from sqlalchemy import distinct, and_, or_, not_, inspect
 
 app = Flask(__name__)
 CORS(app)  #
 app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///works.db'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# /creation 是否默认流式输出 (也可以在地址里加 ?stream=1)
+app.config['STREAM_WORK_LIST'] = False
+# 检索摘录：每篇最多几段，句子过长时关键词前后各保留几个字
+app.config['SNIPPETS_PER_WORK'] = 1
+app.config['SNIPPET_CONTEXT'] = 50
+# 页面缓存：数据只在导入脚本运行后才变 (见 cache.py)
+app.config['CACHE_ENABLED'] = True
+app.config['CACHE_TTL'] = 3600                      # 秒
+app.config['CACHE_MAX_ENTRIES'] = 512
+app.config['CACHE_MAX_BYTES'] = 64 * 1024 * 1024    # 内存缓存总大小上限
+app.config['CACHE_DIR'] = None                      # 设成目录路径即开启多 worker 共用的磁盘缓存
+app.config['CACHE_DIR_MAX_BYTES'] = 256 * 1024 * 1024  # 磁盘缓存总大小上限，超出后淘汰最久没访问的
+# 缩略图缓存 (默认 instance/thumbs)
+app.config['THUMB_DIR'] = None
+app.config['THUMB_CACHE_MAX_BYTES'] = 512 * 1024 * 1024
+app.config['THUMB_MAX_AGE'] = 365 * 24 * 3600      # 缩略图地址带版本号，浏览器可以一直缓存
+# 预压缩 (默认 instance/precompressed)；`flask --app app precompress` 部署时预先生成这些页面
+app.config['PRECOMPRESS_DIR'] = None
+app.config['PRERENDER_PAGES'] = ['index', 'map', 'yingzi-map', 'yingzi-work-timeline', 'fengyimei-work-timeline',
+                                 'wangyingxia-work-timeline', 'wangying-work-timeline', 'shenzijiu-work-timeline']
+# 模板字节码缓存 (默认 instance/jinja_cache，False 关闭)；TEMPLATE_WARMUP 打开时启动就编译好所有模板、渲染好静态页面
+app.config['TEMPLATE_CACHE_DIR'] = None
+app.config['TEMPLATE_WARMUP'] = False
+# 静态站点导出目录 (默认项目下的 site/)
+app.config['EXPORT_DIR'] = None
+# 请求计时 (Server-Timing 头 + /metrics)；METRICS_DIR 设成目录后多个 worker 合计
+app.config['INSTRUMENTATION_ENABLED'] = True
+app.config['METRICS_DIR'] = None
+# 可以访问 /metrics 的地址 / 网段 (默认只有本机，[] 表示关闭)，例如 ['127.0.0.1', '10.0.0.0/8']
+app.config['METRICS_ALLOW'] = ['127.0.0.1', '::1']
+# 慢请求调用栈采样：超过这么多毫秒的请求存一份采样结果到 PROFILE_DIR (默认 instance/profiles)，None 表示关闭
+app.config['PROFILE_SLOW_MS'] = None
+app.config['PROFILE_DIR'] = None
+# 大文件 (PDF、扫描图、音频)：Range + sendfile；放在 nginx 后面时设成 'x-accel' 交给 nginx 发送 (见 large_files.py)
+app.config['LARGE_FILE_MIN_SIZE'] = 256 * 1024
+app.config['FILE_OFFLOAD'] = None
+app.config['FILE_OFFLOAD_PREFIX'] = '/_static/'
+# 关键词趋势的计数矩阵 (init_db.py 生成，默认 instance/ngrams.npz，见 trends.py)
+app.config['TRENDS_FILE'] = None
+# JSON 数据接口 (/api/v1/...) 的缓存时间 (秒)；地址带 ?v=<数据版本> 时缓存一年 (见 json_api.py)
+app.config['API_MAX_AGE'] = 60
+# 以上配置都可以用 FLASK_ 开头的环境变量覆盖 (值按 JSON 解析)，例如压测时：
+# FLASK_SQLALCHEMY_DATABASE_URI=sqlite:////tmp/works-10x.db FLASK_CACHE_ENABLED=false
+app.config.from_prefixed_env()
+# 数据库连接：readwrite (默认，WAL) / readonly / immutable，连接池大小等见 db_config.py
+db_config.configure(app)
 db = SQLAlchemy(app)
+db_config.init_app(app, db)
+# 数据库 / 检索 / 模板各花了多少时间 (见 instrumentation.py)
+instruments = Instrumentation(app, db)
+response_cache = ResponseCache(app)
+# 图片的 WebP / AVIF 版本 (compress_images.py 生成)，模板里用 picture() / best_variant()
+image_variants = ImageVariants(app)
+# 画廊缩略图 (/thumb/<宽度>/<路径>)，模板里用 thumb_url()
+thumbnails = Thumbnails(app, image_variants)
+# 静态页面只渲染一次 + gzip / brotli，static/ 下的文本文件也发送压缩版本
+precompressed = Precompressed(app)
+# 模板编译结果存到磁盘，所有 worker 共用 (见 template_cache.py)
+template_cache = TemplateCache(app, precompressed)
+# 配图 / 史料文件带内容版本号的地址 (模板里用 static_url())
+versioned_static = media_index.VersionedStatic(app)
+# 大文件支持 Range (拖动进度条、PDF 分段加载)，可以交给 nginx / Apache 发送
+large_files = LargeFiles(app)
+# 关键词趋势 (/trends)：init_db.py 生成的计数矩阵，重建后自动重新加载
+trend_index = trends.Trends(app)
+# JSON 数据接口：ETag 由数据版本号算出，gzip / br 压缩
+json_api = JsonApi(app, response_cache)
+# 静态站点导出：flask --app app export
+app.cli.add_command(export_site.export_command(app))
 
 # ============================================
 # 1. 模型定义
@@ -26,9 +113,29 @@ class Work(db.Model):
     publication = db.Column(db.String(100))
     genre = db.Column(db.String(50))
     source = db.Column(db.String(500))
-    content = db.Column(db.Text)
-    # 【新增】这里加一行，用来存图片路径
+    # 正文默认延迟加载：列表页只取标题等字段，打开文章或需要摘录时才读正文
+    content = db.deferred(db.Column(db.Text))
+    # 配图 (按顺序)，导入时由 init_db.py 写入 work_image 表
+    images = db.relationship('WorkImage', order_by='WorkImage.ordinal', lazy='select')
+    # 旧的配图字段 (逗号分隔的 static/... 路径)：还没建 work_image 表的旧数据库靠它显示配图
     image_path = db.Column(db.String(300))
+    # 导入时的指纹 (表格字段 + 文件夹文件)，init_db.py 靠它判断作品有没有变化
+    import_hash = db.deferred(db.Column(db.String(40)))
+
+    # 和 /creation 的筛选对应：作家 (+文类 +年份)、文类 (+年份)、年份；
+    # 索引里自带 id，筛选后按 id 翻页不用再排序
+    __table_args__ = (
+        db.Index('ix_work_author_genre_year', 'author', 'genre', 'year'),
+        db.Index('ix_work_genre_year', 'genre', 'year'),
+        db.Index('ix_work_year', 'year'),
+    )
+
+# 列表页只需要这几列 (不读正文和图片路径)
+WORK_LIST_COLUMNS = (Work.id, Work.title, Work.author, Work.year, Work.genre)
+
+# 作品列表每页条数 (可用 ?per_page= 调整，但不超过上限)
+WORKS_PER_PAGE = 50
+WORKS_MAX_PER_PAGE = 200
 
 # ... (前面的代码不变)
 
@@ -45,6 +152,72 @@ class Material(db.Model):
     source = db.Column(db.String(200))
     sort_index = db.Column(db.Integer, default=0)
 
+    # 和 /materials 的筛选对应，组内按表格行号 (sort_index) 排好
+    __table_args__ = (
+        db.Index('ix_material_author_publication_sort', 'author', 'publication', 'sort_index'),
+        db.Index('ix_material_publication_sort', 'publication', 'sort_index'),
+    )
+
+# (3) 作品配图：一张图一行，尺寸、大小、内容哈希在导入时算好 (见 media_index.py)
+class WorkImage(media_index.SizedFile, db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    work_id = db.Column(db.Integer, db.ForeignKey('work.id'), nullable=False)
+    ordinal = db.Column(db.Integer, nullable=False)     # 第几张 (从 0 开始)
+    path = db.Column(db.String(500), nullable=False)    # 相对 static/ 的路径
+    width = db.Column(db.Integer)
+    height = db.Column(db.Integer)
+    bytes = db.Column(db.Integer)
+    hash = db.Column(db.String(40))                     # 文件内容的 SHA-1
+
+    # 打开文章时按顺序取配图；“哪些作品有配图” (检索框里的 has:图片) 也只查这个索引
+    __table_args__ = (
+        db.Index('ix_work_image_work_ordinal', 'work_id', 'ordinal'),
+    )
+
+# (4) 史料文件夹里的文件 (包括子文件夹)，由 init_materials.py 写入
+class MaterialFile(media_index.SizedFile, db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    material_id = db.Column(db.Integer, db.ForeignKey('material.id'), nullable=False)
+    dir = db.Column(db.String(500), nullable=False, default='')   # 子文件夹 (相对史料文件夹，最外层为空)
+    name = db.Column(db.String(300), nullable=False)
+    ordinal = db.Column(db.Integer, nullable=False)                # 文件夹内自然排序的位置
+    kind = db.Column(db.String(10))                                # image / pdf / txt / other
+    path = db.Column(db.String(500), nullable=False)               # 相对 static/ 的路径
+    width = db.Column(db.Integer)
+    height = db.Column(db.Integer)
+    bytes = db.Column(db.Integer)
+    hash = db.Column(db.String(40))
+
+    __table_args__ = (
+        db.Index('ix_material_file_material_dir', 'material_id', 'dir', 'ordinal'),
+    )
+
+# (5) 全站检索里史料这边的“文档”：每条史料一条 (文件夹名、刊物、时间、来源)，
+#     文件夹里的 txt / pdf 各一条 (导入时抽出的文字)；全文索引在 material_fts (见 site_search.py)
+class MaterialDoc(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    material_id = db.Column(db.Integer, db.ForeignKey('material.id'), nullable=False)
+    kind = db.Column(db.String(10))                 # material / txt / pdf
+    dir = db.Column(db.String(500), default='')     # 文件所在的子文件夹
+    name = db.Column(db.String(300))                # 文件名 (史料本身为空)
+    path = db.Column(db.String(500))                # 文件相对 static/ 的路径
+    hash = db.Column(db.String(40))
+    title = db.Column(db.String(300))
+    author = db.Column(db.String(50))
+    publication = db.Column(db.String(200))
+    content = db.deferred(db.Column(db.Text))
+
+@versioned_static.hash_loader
+def indexed_file_hash(path):
+    """static/ 下的文件在 work_image / material_file 里记的内容哈希 (核对 ?v= 用)"""
+    for model in (WorkImage, MaterialFile):
+        if not has_table(model.__tablename__):
+            continue
+        file_hash = db.session.query(model.hash).filter(model.path == path).limit(1).scalar()
+        if file_hash:
+            return file_hash
+    return None
+
 # ... (后面的代码不变)
 # 2. 辅助工具：文件扫描与排序 (保持不变)
 # ============================================
@@ -53,137 +226,180 @@ def natural_sort_key(s):
     return [int(text) if text.isdigit() else text.lower()
             for text in re.split('([0-9]+)', s)]
 
-def get_files_in_folder(base_path, sub_path=''):
-    full_path = os.path.join(base_path, sub_path)
-    if not os.path.exists(full_path):
-        return [], []
-
-    dirs = []
-    all_files = [] # 统一存放所有文件，避免分堆导致排序断层
-
-    try:
-        items = os.listdir(full_path)
-    except OSError:
-        return [], []
-
-    for item in items:
-        item_path = os.path.join(full_path, item)
-        # 1. 排除隐藏文件
-        if item.startswith('.'): 
-            continue
-
-        # 2. 文件夹和文件分开存放
-        if os.path.isdir(item_path):
-            dirs.append(item)
-        else:
-            # 只要是文件，不管后缀是什么（.jpg, .pdf, .txt），全部丢进一个列表
-            # 这样 1.jpg 和 10.jpg 才能在一个列表里根据数字比大小
-            all_files.append(item)
+class FolderIndex:
+    """
+    功能：文件夹列表缓存。
+    第一次访问时用 os.scandir 扫一遍 (不用逐个 stat)，排好序存起来；
+    之后每次只 stat 一下文件夹本身，修改时间 (mtime) 没变就直接用缓存。
+    文件夹里增删、改名文件都会改变 mtime，所以不会读到过期的列表。
+    """
 
-    # 3. 对文件夹进行自然排序
-    dirs.sort(key=natural_sort_key)
-    
-    # 4. 对所有文件进行统一的自然排序
-    # 这一步保证了 1.jpg, 2.pdf, 3.jpg 这种混合排列也是正确的
-    all_files.sort(key=natural_sort_key)
+    def __init__(self, max_entries=2048):
+        self.max_entries = max_entries
+        self._data = OrderedDict() # 路径 -> (mtime, 文件夹列表, 文件列表)
+        self._lock = threading.Lock()
+
+    def list(self, full_path):
+        try:
+            mtime = os.stat(full_path).st_mtime_ns
+        except OSError:
+            return (), ()
+
+        with self._lock:
+            cached = self._data.get(full_path)
+            if cached is not None and cached[0] == mtime:
+                self._data.move_to_end(full_path)
+                return cached[1], cached[2]
+
+        dirs = []
+        all_files = [] # 统一存放所有文件，避免分堆导致排序断层
+        try:
+            with os.scandir(full_path) as entries:
+                for entry in entries:
+                    # 1. 排除隐藏文件
+                    if entry.name.startswith('.'):
+                        continue
+                    # 2. 文件夹和文件分开存放 (is_dir 直接用目录项里的类型，不额外 stat)
+                    # 只要是文件，不管后缀是什么（.jpg, .pdf, .txt），全部丢进一个列表
+                    # 这样 1.jpg 和 10.jpg 才能在一个列表里根据数字比大小
+                    if entry.is_dir():
+                        dirs.append(entry.name)
+                    else:
+                        all_files.append(entry.name)
+        except OSError:
+            return (), ()
+
+        # 3. 自然排序 (排序键每个名字只算一次)
+        # 这一步保证了 1.jpg, 2.pdf, 3.jpg 这种混合排列也是正确的
+        dirs = tuple(sorted(dirs, key=natural_sort_key))
+        all_files = tuple(sorted(all_files, key=natural_sort_key))
+
+        with self._lock:
+            self._data[full_path] = (mtime, dirs, all_files)
+            self._data.move_to_end(full_path)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+        return dirs, all_files
+
+folder_index = FolderIndex()
 
-    # 5. 直接返回，不要再加来加去了
-    return dirs, all_files
+def get_files_in_folder(base_path, sub_path=''):
+    full_path = os.path.normpath(os.path.join(base_path, sub_path))
+    # 不允许用 ../ 跳出史料文件夹
+    if full_path != base_path and not full_path.startswith(base_path + os.sep):
+        return (), ()
+    return folder_index.list(full_path)
 
 # ============================================
 # 3. 模板过滤器 (Template Filters)
 # ============================================
 
 @app.template_filter('highlight')
-def highlight_filter(text, keyword):
-    if not keyword or not text:
-        return text
-    # 将关键词同时转为简体和繁体
-    k_simp = zhconv.convert(keyword, 'zh-cn')
-    k_trad = zhconv.convert(keyword, 'zh-tw')
-    
-    # 用正则同时匹配简体或繁体
-    pattern = re.compile(f'({re.escape(k_simp)}|{re.escape(k_trad)})', re.IGNORECASE)
-    return pattern.sub(r'<span class="highlight">\1</span>', text)
 def highlight_filter(text, keyword):
     """
-    功能：给文本中的关键词加上红色高亮标签
+    功能：给文本中的关键词 (简繁体都算) 加上红色高亮标签
     """
-    if not keyword or not text:
-        return text
-    # re.IGNORECASE 让搜索不区分大小写
-    pattern = re.compile(f'({re.escape(keyword)})', re.IGNORECASE)
-    return pattern.sub(r'<span class="highlight">\1</span>', text)
+    return snippets.highlight(text, keyword)
 
 @app.template_filter('extract_sentence')
 def extract_sentence_filter(content, keyword):
     """
     功能：在正文中找到关键词所在的句子，并截取出来。
     """
-    if not keyword or not content:
-        return None
-    
-    # 1. 为了查找方便，统一转小写找位置 (但截取时用原文本)
-   # 分别找简体和繁体的位置，哪个找到了就用哪个
-    k_simp = zhconv.convert(keyword, 'zh-cn').lower()
-    k_trad = zhconv.convert(keyword, 'zh-tw').lower()
-    content_lower = content.lower()
-    
-    idx = content_lower.find(k_simp)
-    if idx == -1:
-        idx = content_lower.find(k_trad)
-    
-    if idx == -1:
-        return None # 正文里没这个词，返回 None
-    
-    # 2. 向前找句号（确定句子开头）
-    # 往回找最近的 。 ！ ？ 换行符 或者 字符串开头
-    start = idx
-    while start > 0:
-        char = content[start]
-        if char in ['。', '！', '？', '\n', '!', '?']:
-            start += 1 # 找到标点后，往后挪一位才是文字开始
-            break
-        start -= 1
-        
-    # 3. 向后找句号（确定句子结尾）
-    end = idx
-    total_len = len(content)
-    while end < total_len:
-        char = content[end]
-        if char in ['。', '！', '？', '\n', '!', '?']:
-            end += 1 # 把标点符号也带上
-            break
-        end += 1
-    
-    # 4. 截取这句话
-    sentence = content[start:end].strip()
-    
-    # 5. 防御性截断：万一这句话特别长（比如几百字没标点），强行截取关键词前后
-    if len(sentence) > 150:
-        snippet_start = max(0, idx - 50)
-        snippet_end = min(total_len, idx + 50)
-        sentence = "..." + content[snippet_start:snippet_end] + "..."
-
-    return sentence
+    return snippets.extract_sentence(content, keyword, app.config['SNIPPET_CONTEXT'])
 
 
 # ============================================
 # 3. 路由
 # ============================================
 
+# 作品 / 史料的分组计数 (统计表由导入脚本维护，见 aggregates.py)
+def get_work_counts():
+    return aggregates.work_counts(db.session)
+
+def get_material_counts():
+    return aggregates.material_counts(db.session)
+
+def has_table(name):
+    """
+    导入脚本后来加的表 (work_image / material_file ...) 在还没重新导入过的旧数据库里不存在，
+    这时页面改用旧的数据。数据版本变了 (导入过) 才重新检查。
+    """
+    return response_cache.memo(('has_table', name), lambda: inspect(db.engine).has_table(name), size=64)
+
+def legacy_images(work):
+    """旧数据库：从 image_path 得到和 work.images 一样用法的配图列表 (没有尺寸和哈希)"""
+    paths = [p.strip() for p in (work.image_path or '').split(',') if p.strip()]
+    return [WorkImage(path=p.replace('static/', '', 1), ordinal=i) for i, p in enumerate(paths)]
+
+def get_available_years():
+    work_counts = response_cache.memo('work_counts', get_work_counts)
+    return sorted({row.year for row in work_counts if row.year})
+
+def get_available_publications():
+    material_counts = response_cache.memo('material_counts', get_material_counts)
+    return list(dict.fromkeys(row.publication for row in material_counts if row.publication))
+
 @app.route('/')
 def index():
-    return render_template('index.html')
-
-@app.route('/creation')
-def creation():
-    keyword = request.args.get('q', '').strip()
-    author_filter = request.args.get('author', 'all')
-    genre_filter = request.args.get('genre', 'all')
-    year_filter = request.args.get('year', 'all')
+    return precompressed.page('index')
+
+def apply_query_filters(query, filters):
+    """把检索框里的 author: / genre: / year: / has: 筛选加到作品查询上"""
+    if 'author' in filters: query = query.filter_by(author=filters['author'])
+    if 'genre' in filters: query = query.filter_by(genre=filters['genre'])
+    if 'year' in filters:
+        start, end = filters['year']
+        query = query.filter(Work.year.between(start, end))
+    # 有配图：EXISTS 子查询，走 work_image 的索引 (旧数据库没有这张表时看 image_path)
+    if filters.get('images'):
+        if has_table('work_image'): query = query.filter(Work.images.any())
+        else: query = query.filter(Work.image_path != None, Work.image_path != '')
+    return query
+
+def like_rule(expr):
+    """
+    功能：没有全文索引时，把检索语法树翻译成 LIKE 条件 (每个词同时找简体和繁体)。
+    """
+    if isinstance(expr, search_query.Term):
+        k_simp, k_trad = zh_convert.keyword_forms(expr.text)
+        return (Work.title.contains(k_simp) | Work.content.contains(k_simp) |
+                Work.title.contains(k_trad) | Work.content.contains(k_trad))
+    if isinstance(expr, search_query.And):
+        return and_(*[like_rule(item) for item in expr.items])
+    if isinstance(expr, search_query.Or):
+        return or_(*[like_rule(item) for item in expr.items])
+    return not_(like_rule(expr.item))
+
+def search_hits(parsed, query):
+    """
+    功能：检索词命中的作品 {work_id: Hit}。
+    优先走全文索引 (init_db.py 建立)，没有索引时退回 LIKE，只在 query 的范围内逐篇找。
+    只有 NOT / -词、没有正向检索词的查询没有结果 (没有可以高亮、计数的命中)，直接返回，不读正文。
+    """
+    if not parsed.terms:
+        return {}
+    hits = search_index.search(db.session, parsed)
+    if hits is None:
+        # 没有索引时只能把正文读出来逐篇找
+        rows = query.filter(like_rule(parsed.expr)).with_entities(Work.id, Work.title, Work.content)
+        hits = search_index.scan(rows, parsed)
+    return hits
+
+def find_works(args, annotate=True):
+    """
+    功能：作品的 筛选 + 检索 + 分页 (/creation 和 /api/v1/works 共用)。
+    args 是请求参数；返回 dict：works (当前页)、keyword、total、results (检索结果，没有检索词时为 None)、
+    hits (检索词命中的全部作品，不受侧栏筛选限制，传给 work_facets；没有检索词时为 None)、
+    chart_x / chart_y (词频前 20 名)、after、next_after (下一页的 after，没有下一页时为 None)、
+    以及 author / genre / year 三个筛选值。annotate=False 时不生成高亮和摘录。
+    """
+    keyword = args.get('q', '').strip()
+    author_filter = args.get('author', 'all')
+    genre_filter = args.get('genre', 'all')
+    year_filter = args.get('year', 'all')
 
-    query = Work.query
+    query = Work.query.options(db.load_only(*WORK_LIST_COLUMNS))
     if author_filter != 'all': query = query.filter_by(author=author_filter)
     if genre_filter != 'all': query = query.filter_by(genre=genre_filter)
     if year_filter != 'all':
@@ -192,96 +408,155 @@ def creation():
             try: query = query.filter_by(year=int(year_filter))
             except: pass
 
-    # ... 前面的代码不变 ...
-
-    # 初始化词频统计列表
-    chart_data = []
-
-    # ... (前面的代码不变)
+    # 检索框支持 AND / OR / NOT、"短语" 和 author: / genre: / year: / has: 筛选 (见 search_query.py)
+    parsed = search_query.parse(keyword)
+    query = apply_query_filters(query, parsed.filters)
 
     # 初始化两个空列表，准备传给图表
     chart_x = [] # 存标题
     chart_y = [] # 存数量
+    results = None # 检索结果 (命中位置、高亮标题、摘录)
+    # 有检索词时默认按相关度排序，?sort=id 按编号排序
+    sort = args.get('sort', 'relevance')
 
-    if keyword:
-        # 1. 数据库筛选
+    hits = None # 检索词 (连同检索框里的筛选) 命中的全部作品，不受侧栏筛选限制；筛选项计数也用它
+    if parsed.expr is not None:
+        # 1. 数据库筛选 (同时找简体和繁体)
+        with stage('search'):
+            hits = search_hits(parsed, apply_query_filters(Work.query, parsed.filters))
+        # 命中的 id 放在临时表里 (不会超过 SQLite 的参数个数上限)；下面用到 query 的查询都在这个函数里执行完
+        query = query.filter(Work.id.in_(search_index.hit_ids(db.session, hits)))
+
+        # 2. 命中位置只算一次：词频图用全部命中，高亮和摘录只算当前页
+        with stage('rank'):
+            titles = dict(query.with_entities(Work.id, Work.title))
+            results = search_index.SearchResult(keyword, {i: h for i, h in hits.items() if i in titles}, titles)
+            total = len(results)
+
+            # 3. 词频前 20 名 (防止柱子太多太挤)，拆分数据给 Plotly 用
+            chart_x, chart_y = results.chart(20)
+    else:
+        # 只数 id：query.count() 会把所有列 (包括延迟加载的列) 放进子查询
+        total = query.with_entities(db.func.count(Work.id)).scalar()
+
+    # 4. 分页：after = 上一页最后一篇的 id，每页只查 per_page 条
+    after = args.get('after', 0, type=int)
+    per_page = min(max(args.get('per_page', WORKS_PER_PAGE, type=int), 1), WORKS_MAX_PER_PAGE)
+    if results is not None and sort == 'relevance':
+        # 按相关度排序：在排好序的 id 列表里找到 after 的位置，往后取一页
+        ranked = results.ranked_ids()
+        start = ranked.index(after) + 1 if after in ranked else 0
+        page_ids = ranked[start:start + per_page + 1]
+        by_id = {w.id: w for w in query.filter(Work.id.in_(page_ids))}
+        works = [by_id[i] for i in page_ids if i in by_id]
+    else:
+        # 按 id 翻页 (keyset)
+        works = query.filter(Work.id > after).order_by(Work.id).limit(per_page + 1).all()
+
+    next_after = None
+    if len(works) > per_page:
+        works = works[:per_page]
+        next_after = works[-1].id
+
+    if results is not None and annotate:
+        with stage('snippets'):
+            results.annotate(works, db.session, app.config['SNIPPETS_PER_WORK'], app.config['SNIPPET_CONTEXT'])
+
+    return dict(works=works, keyword=keyword, total=total, results=results, hits=hits,
+                chart_x=chart_x, chart_y=chart_y,
+                after=after, next_after=next_after,
+                author=author_filter, genre=genre_filter, year=year_filter)
+
+def get_matching_work_counts(keyword, hits=None):
+    """
+    功能：检索词 (连同检索框里的 author: / has: 等筛选) 命中的作品，按 (作家, 文类, 年份) 分组的篇数，
+    格式和 work_count 统计表一样。侧栏的筛选不在这里加，由 aggregates.facets() 处理。
+    hits 是 find_works() 已经查到的命中 (不用再检索一遍)；没有时 (单独请求计数的接口) 才自己检索。
+    """
+    parsed = search_query.parse(keyword)
+    query = apply_query_filters(Work.query, parsed.filters)
+    if parsed.expr is not None:
+        if hits is None:
+            hits = search_hits(parsed, query)
+        query = query.filter(Work.id.in_(search_index.hit_ids(db.session, hits)))
+    keys = (db.func.coalesce(Work.author, ''), db.func.coalesce(Work.genre, ''), db.func.coalesce(Work.year, 0))
+    rows = query.with_entities(*keys, db.func.count(Work.id)).group_by(*keys)
+    return [aggregates.WorkCount(*row) for row in rows]
+
+def work_facets(author_filter, genre_filter, year_filter, keyword='', hits=None):
+    """
+    筛选项旁边的计数：其他筛选条件不变时，选这一项能得到多少篇。
+    有检索词时只数命中的作品 (和结果列表一致，hits 见 find_works)，没有时直接用统计表。
+    """
+    facet_filters = {'author': author_filter, 'genre': genre_filter, 'year': year_filter}
+    if year_filter not in ('all', 'unknown') and not year_filter.isdigit():
+        facet_filters['year'] = 'all' # 和 find_works() 一样，年份写错了就当作不筛选
+    with stage('facets'):
+        keyword = keyword.strip()
         if keyword:
-        # 将关键词转为简繁双份
-            k_simp = zhconv.convert(keyword, 'zh-cn')
-            k_trad = zhconv.convert(keyword, 'zh-tw')
+            counts = response_cache.memo(('work_counts', keyword), lambda: get_matching_work_counts(keyword, hits))
+        else:
+            counts = response_cache.memo('work_counts', get_work_counts)
+        return aggregates.facets(counts, facet_filters,
+                                 {'author': lambda row: row.author, 'genre': lambda row: row.genre,
+                                  'year': lambda row: aggregates.year_key(row.year)})
 
-        # 1. 数据库筛选 (同时找简体和繁体)
-        rule = (
-            Work.title.contains(k_simp) | Work.content.contains(k_simp) |
-            Work.title.contains(k_trad) | Work.content.contains(k_trad)
-        )
-        query = query.filter(rule)
-        
-        works = query.order_by(Work.id).all()
-
-        # 2. 统计词频逻辑 (同时统计简体和繁体出现的次数)
-        stats = []
-        for work in works:
-            c_title = (work.title.count(k_simp) + work.title.count(k_trad)) if work.title else 0
-            c_content = (work.content.count(k_simp) + work.content.count(k_trad)) if work.content else 0
-            total = c_title + c_content
-            
-            if total > 0:
-                stats.append({'title': work.title, 'count': total})
-        query = query.filter(rule)
-        
-        works = query.order_by(Work.id).all()
-
-        # 2. 【新增】统计词频逻辑
-        stats = []
-        for work in works:
-            # 统计标题和正文里关键词出现的总次数
-            c_title = work.title.count(keyword) if work.title else 0
-            c_content = work.content.count(keyword) if work.content else 0
-            total = c_title + c_content
-            
-            if total > 0:
-                stats.append({'title': work.title, 'count': total})
-        
-        # 3. 【新增】排序：按数量从大到小
-        stats.sort(key=lambda x: x['count'], reverse=True)
-        
-        # 4. 只取前 20 名 (防止柱子太多太挤)
-        stats = stats[:20]
-        
-        # 5. 拆分数据给 Plotly 用
-        chart_x = [item['title'] for item in stats]
-        chart_y = [item['count'] for item in stats]
+@app.route('/creation')
+@response_cache.view
+def creation():
+    found = find_works(request.args)
 
-    else:
-        works = query.order_by(Work.id).all()
+    next_url = None
+    if found['next_after'] is not None:
+        page_args = request.args.to_dict()
+        page_args['after'] = found['next_after']
+        next_url = url_for('creation', **page_args)
 
-    years_db = db.session.query(distinct(Work.year)).order_by(Work.year).all()
-    available_years = [y[0] for y in years_db if y[0] and y[0] != 0]
+    first_url = None
+    if found['after']:
+        page_args = request.args.to_dict()
+        page_args.pop('after')
+        first_url = url_for('creation', **page_args)
+
+    available_years = response_cache.memo('available_years', get_available_years)
+    facets = work_facets(found['author'], found['genre'], found['year'], found['keyword'], found['hits'])
 
     # 【修改】return 这里一定要把 chart_x 和 chart_y 传出去
-    return render_template('creation.html', works=works, keyword=keyword, 
-                           current_author=author_filter, current_genre=genre_filter,
-                           current_year=year_filter, available_years=available_years,
-                           chart_x=chart_x, chart_y=chart_y) # <--- 重点看这里
+    context = dict(works=found['works'], keyword=found['keyword'], total=found['total'],
+                   current_author=found['author'], current_genre=found['genre'],
+                   current_year=found['year'], available_years=available_years, facets=facets,
+                   chart_x=found['chart_x'], chart_y=found['chart_y'], results=found['results'], # <--- 重点看这里
+                   next_url=next_url, first_url=first_url)
+
+    # 流式输出：边渲染边发送，首字节不用等整页渲染完
+    if app.config['STREAM_WORK_LIST'] or request.args.get('stream') == '1':
+        return stream_template('creation.html', **context)
+    return render_template('creation.html', **context)
 
 @app.route('/article/<int:work_id>')
+@response_cache.view
 def article(work_id):
-    work = Work.query.get_or_404(work_id)
+    if has_table('work_image'):
+        work = Work.query.options(db.undefer(Work.content), db.selectinload(Work.images)).get_or_404(work_id)
+        images = work.images
+    else:
+        work = Work.query.options(db.undefer(Work.content)).get_or_404(work_id)
+        images = legacy_images(work)
     
     # 【新增】获取 URL 里的关键词 (比如 ?q=黄河)
     keyword = request.args.get('q', '') 
     
     # 【修改】把 keyword 传给 article.html
-    return render_template('article.html', work=work, keyword=keyword)
+    return render_template('article.html', work=work, images=images, keyword=keyword)
 
-# --- 【修改】南洋史料路由 ---
-@app.route('/materials')
-def materials():
-    # 1. 【修复关键】显式定义筛选变量
-    author_filter = request.args.get('author', 'all')
-    pub_filter = request.args.get('publication', 'all')
+# 作家 id -> 中文名 (旭日图的标签)
+AUTHOR_NAMES = {
+    'yingzi': '莹姿', 'fengyimei': '冯伊湄',
+    'wangyingxia': '王映霞', 'wangying': '王莹', 'shenzijiu': '沈兹九'
+}
 
+def find_materials(author_filter, pub_filter):
+    """筛选后的全部史料 (/materials 和 /api/v1/materials 共用)"""
     # 2. 建立基础查询 (请确保 Material 是你存放史料的模型名)
     query = Material.query 
 
@@ -292,77 +567,47 @@ def materials():
     if pub_filter != 'all':
         query = query.filter(Material.publication == pub_filter)
 
-    # 4. 获取筛选后的所有数据
-    materials = query.all()
+    # 4. 获取筛选后的所有数据：作家按表格里的先后 (每位作家第一条史料的 id)，作家内按表格行号
+    author_order = db.func.min(Material.id).over(partition_by=Material.author)
+    return query.order_by(author_order, Material.sort_index, Material.id).all()
 
-    # 5. 获取数据库中所有刊物列表 (用于下拉菜单)
-    # distinct 需要从 sqlalchemy 导入: from sqlalchemy import distinct
-    pubs_db = db.session.query(distinct(Material.publication)).all()
-    available_publications = [p[0] for p in pubs_db if p[0]]
+def material_charts(author_filter, pub_filter):
+    """
+    功能：旭日图数据 + 筛选项计数 (都从统计表 material_count 来，不用遍历史料)。
+    返回 (facets, (ids, labels, parents, values))
+    """
+    with stage('facets'):
+        material_counts = response_cache.memo('material_counts', get_material_counts)
+        filtered_counts = [row for row in material_counts
+                           if (author_filter == 'all' or row.author == author_filter)
+                           and (pub_filter == 'all' or row.publication == pub_filter)]
+        sunburst = aggregates.sunburst(filtered_counts, AUTHOR_NAMES)
+        facets = aggregates.facets(material_counts, {'author': author_filter, 'publication': pub_filter},
+                                   {'author': lambda row: row.author, 'publication': lambda row: row.publication})
+    return facets, sunburst
 
-    # ==========================================
-    # 旭日图数据处理逻辑 (Sunburst)
-    # ==========================================
-    
-    author_map = {
-        'yingzi': '莹姿', 'fengyimei': '冯伊湄',
-        'wangyingxia': '王映霞', 'wangying': '王莹', 'shenzijiu': '沈兹九'
-    }
+# --- 【修改】南洋史料路由 ---
+@app.route('/materials')
+@response_cache.view
+def materials():
+    # 1. 【修复关键】显式定义筛选变量
+    author_filter = request.args.get('author', 'all')
+    pub_filter = request.args.get('publication', 'all')
 
-    stats = {}
-    
-    for m in materials:
-        # 获取中文人名
-        author_name = author_map.get(m.author, m.author) if m.author else "未知作者"
-        # 获取刊物名
-        pub_name = m.publication if m.publication else "其他刊物"
-        
-        if author_name not in stats:
-            stats[author_name] = {}
-        
-        if pub_name not in stats[author_name]:
-            stats[author_name][pub_name] = 0
-            
-        stats[author_name][pub_name] += 1
-
-    # 构建 Plotly 数据
-    sb_ids = []
-    sb_labels = []
-    sb_parents = []
-    sb_values = []
-
-    # (1) 圆心
-    root_id = "总览"
-    sb_ids.append(root_id)
-    sb_labels.append("史料总览")
-    sb_parents.append("")
-    sb_values.append(len(materials))
-
-    # (2) 填充数据
-    for author, pubs in stats.items():
-        # 作家层
-        author_total = sum(pubs.values())
-        sb_ids.append(author) 
-        sb_labels.append(author)
-        sb_parents.append(root_id)
-        sb_values.append(author_total)
-
-        # 刊物层
-        for pub, count in pubs.items():
-            child_id = f"{author}-{pub}"
-            sb_ids.append(child_id)
-            sb_labels.append(pub)
-            sb_parents.append(author)
-            sb_values.append(count)
-    
-    # ==========================================
+    materials = find_materials(author_filter, pub_filter)
+
+    # 5. 获取数据库中所有刊物列表 (用于下拉菜单)
+    available_publications = response_cache.memo('available_publications', get_available_publications)
+
+    # 旭日图数据 + 筛选项计数
+    facets, (sb_ids, sb_labels, sb_parents, sb_values) = material_charts(author_filter, pub_filter)
 
     # 6. 返回模板 (变量名现在已经对齐了)
     return render_template('materials.html', 
                            materials=materials, 
                            current_author=author_filter,        # 对应上面定义的变量
                            current_publication=pub_filter,      # 对应上面定义的变量
-                           available_publications=available_publications,
+                           available_publications=available_publications, facets=facets,
                            sb_ids=sb_ids, sb_labels=sb_labels, 
                            sb_parents=sb_parents, sb_values=sb_values)
 @app.route('/material/<int:id>')
@@ -371,6 +616,10 @@ def material_detail(id, subpath=''):
     material = Material.query.get_or_404(id)
     base_folder = os.path.join(app.root_path, 'static', 'materials', material.author, material.folder_name)
     dirs, files = get_files_in_folder(base_folder, subpath)
+    # 导入时记下的尺寸 / 内容哈希 (导入之后才放进来的文件没有，照常显示)
+    file_info = {}
+    if has_table('material_file'):
+        file_info = {f.name: f for f in MaterialFile.query.filter_by(material_id=id, dir=subpath.strip('/'))}
     
     breadcrumbs = []
     if subpath:
@@ -382,13 +631,189 @@ def material_detail(id, subpath=''):
             breadcrumbs.append({'name': part, 'path': accumulated})
 
     return render_template('material_detail.html', material=material, subpath=subpath,
-                           dirs=dirs, files=files, breadcrumbs=breadcrumbs)
+                           dirs=dirs, files=files, file_info=file_info, breadcrumbs=breadcrumbs)
+
+# --- 全站检索：作品 + 史料 (索引由 init_db.py / init_materials.py 建好，见 site_search.py) ---
+@app.route('/search')
+@response_cache.view
+def site_search_view():
+    keyword = request.args.get('q', '').strip()
+    filters = {dim: request.args.get(dim, 'all') for dim in site_search.FACETS}
+    start = max(request.args.get('start', 0, type=int), 0)
+
+    parsed = search_query.parse(keyword)
+    results = None
+    entries = []
+    if parsed.expr is not None:
+        with stage('search'):
+            results = site_search.search(db.session, parsed, filters, keyword)
+        if results is not None:
+            with stage('snippets'):
+                entries = results.page(db.session, start, site_search.PER_PAGE,
+                                       app.config['SNIPPETS_PER_WORK'], app.config['SNIPPET_CONTEXT'])
+
+    prev_url = next_url = None
+    if results is not None:
+        page_args = request.args.to_dict()
+        if start + site_search.PER_PAGE < len(results):
+            next_url = url_for('site_search_view', **dict(page_args, start=start + site_search.PER_PAGE))
+        if start:
+            prev_url = url_for('site_search_view', **dict(page_args, start=max(start - site_search.PER_PAGE, 0)))
+
+    return render_template('site_search.html', keyword=keyword, filters=filters, results=results,
+                           entries=entries, start=start, prev_url=prev_url, next_url=next_url)
+
+# --- 关键词趋势：按年份 / 作家，每万字出现几次 (见 trends.py) ---
+@app.route('/trends')
+@response_cache.view
+def keyword_trends():
+    keywords = trends.split_keywords(request.args.get('q', ''))
+    index = trend_index.get()
+    by_year = by_author = None
+    if index is not None and keywords:
+        with stage('trends'):
+            by_year = index.trend(keywords, 'year', db.session)
+            by_author = index.trend(keywords, 'author', db.session)
+    return render_template('trends.html', keywords=keywords, keyword=' '.join(keywords),
+                           ready=index is not None, by_year=by_year, by_author=by_author)
+
+# ============================================
+# JSON 数据接口 (前端按需取数据；序列化、ETag、压缩见 json_api.py)
+# ============================================
+
+def _api_next(endpoint, name, value):
+    """下一页的地址 (其他参数不变)"""
+    if value is None:
+        return None
+    return url_for(endpoint, **dict(request.args.to_dict(), **{name: value}))
+
+def _api_result(result):
+    """检索结果的高亮标题和摘录 (HTML 字符串)"""
+    if result is None:
+        return {}
+    return {'title_html': str(result.title_html) if result.title_html else None,
+            'snippets': [str(snippet) for snippet in result.snippets]}
+
+@app.route('/api/v1/works')
+@json_api.view
+def api_works():
+    # 参数和 /creation 一样：q / author / genre / year / sort / after / per_page
+    found = find_works(request.args)
+    results = found['results']
+    items = []
+    for work in found['works']:
+        item = {'id': work.id, 'title': work.title, 'author': work.author, 'genre': work.genre, 'year': work.year,
+                'url': url_for('article', work_id=work.id, q=found['keyword'] or None)}
+        item.update(_api_result(results.get(work.id) if results else None))
+        items.append(item)
+    return {'total': found['total'], 'after': found['after'], 'next_after': found['next_after'],
+            'next': _api_next('api_works', 'after', found['next_after']), 'items': items}
+
+@app.route('/api/v1/works/facets')
+@json_api.view
+def api_work_facets():
+    args = request.args
+    facets = work_facets(args.get('author', 'all'), args.get('genre', 'all'), args.get('year', 'all'),
+                         args.get('q', ''))
+    return {'facets': facets, 'years': response_cache.memo('available_years', get_available_years)}
+
+@app.route('/api/v1/works/chart')
+@json_api.view
+def api_work_chart():
+    # 检索词的词频前 20 名 (和 /creation 的柱状图一样)
+    found = find_works(request.args, annotate=False)
+    return {'keyword': found['keyword'], 'total': found['total'], 'x': found['chart_x'], 'y': found['chart_y']}
+
+@app.route('/api/v1/materials')
+@json_api.view
+def api_materials():
+    author_filter = request.args.get('author', 'all')
+    pub_filter = request.args.get('publication', 'all')
+    items = [{'id': m.id, 'title': m.folder_name, 'author': m.author, 'publication': m.publication,
+              'publish_time': m.publish_time, 'url': url_for('material_detail', id=m.id)}
+             for m in find_materials(author_filter, pub_filter)]
+    return {'total': len(items), 'items': items}
+
+@app.route('/api/v1/materials/facets')
+@json_api.view
+def api_material_facets():
+    facets, _ = material_charts(request.args.get('author', 'all'), request.args.get('publication', 'all'))
+    return {'facets': facets,
+            'publications': response_cache.memo('available_publications', get_available_publications)}
+
+@app.route('/api/v1/materials/sunburst')
+@json_api.view
+def api_material_sunburst():
+    _, (ids, labels, parents, values) = material_charts(request.args.get('author', 'all'),
+                                                        request.args.get('publication', 'all'))
+    return {'ids': ids, 'labels': labels, 'parents': parents, 'values': values}
+
+@app.route('/api/v1/search')
+@json_api.view
+def api_site_search():
+    # 参数和 /search 一样：q / type / author / publication / start
+    keyword = request.args.get('q', '').strip()
+    filters = {dim: request.args.get(dim, 'all') for dim in site_search.FACETS}
+    start = max(request.args.get('start', 0, type=int), 0)
+    parsed = search_query.parse(keyword)
+    results = site_search.search(db.session, parsed, filters, keyword) if parsed.expr is not None else None
+    if results is None:
+        return {'total': 0, 'start': start, 'next': None, 'facets': {}, 'items': []}
+
+    items = []
+    for entry in results.page(db.session, start, site_search.PER_PAGE,
+                              app.config['SNIPPETS_PER_WORK'], app.config['SNIPPET_CONTEXT']):
+        item = {'type': entry.type, 'kind': entry.kind, 'id': entry.id, 'title': entry.title,
+                'author': entry.author, 'publication': entry.publication,
+                'url': entry.url(keyword), 'file_url': entry.file_url()}
+        item.update(_api_result(entry.result))
+        items.append(item)
+    next_start = start + site_search.PER_PAGE if start + site_search.PER_PAGE < len(results) else None
+    return {'total': len(results), 'start': start, 'next': _api_next('api_site_search', 'start', next_start),
+            'facets': results.facets, 'items': items}
+
+@app.route('/api/v1/trends')
+@json_api.view
+def api_trends():
+    keywords = trends.split_keywords(request.args.get('q', ''))
+    index = trend_index.get()
+    if index is None or not keywords:
+        return {'keywords': keywords, 'by_year': None, 'by_author': None}
+    return {'keywords': keywords, 'by_year': index.trend(keywords, 'year', db.session),
+            'by_author': index.trend(keywords, 'author', db.session)}
+
+@app.route('/thumb/<int:size>/<path:filename>')
+def thumbnail(size, filename):
+    # 第一次请求时生成缩略图，之后直接读磁盘缓存；If-None-Match 命中时返回 304
+    found = thumbnails.get(filename, size)
+    if found is None:
+        abort(404)
+    path, etag = found
+    if etag is None:
+        # 原图 Pillow 打不开 (损坏 / 格式不认识)：改发原图
+        return redirect(url_for('static', filename=filename))
+    response = send_file(path, mimetype='image/webp', etag=etag, conditional=True,
+                         max_age=app.config['THUMB_MAX_AGE'])
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+@app.route('/cache-stats')
+def cache_stats():
+    # 缓存命中情况 (内存 / 磁盘)，用来确认缓存是否生效
+    return jsonify(dict(response_cache.stats(), thumbnails=thumbnails.stats()))
 
 @app.route('/<page_name>')
 def static_page(page_name):
     if page_name.endswith('.html'): page_name = page_name[:-5]
-    try: return render_template(f'{page_name}.html')
-    except: return f"页面 {page_name} 不存在", 404
+    # 先查路由表 (启动时建好)，不存在的页面不用去找模板
+    if page_name not in precompressed.known_pages():
+        return f"页面 {page_name} 不存在", 404
+    return precompressed.page(page_name)
+
+# 启动预热：路由、过滤器都注册好之后再编译模板 (gunicorn.conf.py 默认打开，preload_app 时只在主进程做一次)
+if app.config['TEMPLATE_WARMUP']:
+    template_cache.warm_up()
 
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
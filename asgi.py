@@ -0,0 +1,184 @@
+"""
+ASGI 入口
+
+    uvicorn asgi:application --workers 2
+    gunicorn                                  (gunicorn 管理进程 + uvicorn worker，见 gunicorn.conf.py)
+
+Flask 的视图是同步的，这里把每个请求放进线程池 (ASGI_THREADS，默认 16 个线程) 里执行，
+事件循环只管收发数据：
+- asgiref 自带的 WsgiToAsgi 默认把所有请求排在同一个线程里 (thread_sensitive)，
+  一个慢请求 (很大的史料文件夹、很长的检索) 会挡住后面所有请求，所以不用它
+- SQLite 查询、os.scandir、读文件都会释放 GIL，慢请求在自己的线程里跑，不影响其他请求
+- send_file 的大文件也是在线程里分块读的，事件循环不会被磁盘读写卡住
+- 响应结束后调用响应体的 close() (stream_template 等流式响应靠它收尾)
+WSGI 和 ASGI 之间的转换 (environ、start_response) 写在这里，只用 asgiref 公开的
+sync_to_async / async_to_sync，不依赖 WsgiToAsgi 的内部实现，升级 asgiref 不会坏。
+"""
+import os
+import sys
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from tempfile import SpooledTemporaryFile
+
+from asgiref.sync import async_to_sync, sync_to_async
+
+from app import app
+
+ASGI_THREADS = int(os.environ.get('ASGI_THREADS', 16))
+
+# 同名请求头最多几个，超过返回 400
+DUPLICATE_HEADER_LIMIT = 100
+
+# 请求体超过这么大时写到临时文件里
+BODY_SPOOL_SIZE = 64 * 1024
+
+def build_environ(scope, body):
+    """
+    功能：ASGI scope + 请求体 → WSGI environ。
+    同名请求头太多时抛出 ValueError。
+    """
+    script_name = scope.get('root_path', '').encode('utf-8').decode('latin1')
+    path_info = scope['path'].encode('utf-8').decode('latin1')
+    if path_info.startswith(script_name):
+        path_info = path_info[len(script_name):]
+    server_name, server_port = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': script_name,
+        'PATH_INFO': path_info,
+        'QUERY_STRING': scope['query_string'].decode('ascii'),
+        'SERVER_NAME': server_name,
+        'SERVER_PORT': str(server_port),
+        'SERVER_PROTOCOL': 'HTTP/' + scope['http_version'],
+        'SERVER_SOFTWARE': 'asgi',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client') is not None:
+        environ['REMOTE_ADDR'] = scope['client'][0]
+
+    headers = defaultdict(list)
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin1')
+        if name == 'content-length':
+            key = 'CONTENT_LENGTH'
+        elif name == 'content-type':
+            key = 'CONTENT_TYPE'
+        else:
+            key = 'HTTP_' + name.upper().replace('-', '_')
+        if len(headers[key]) >= DUPLICATE_HEADER_LIMIT:
+            raise ValueError(f'重复的请求头太多：{key}')
+        headers[key].append(value.decode('latin1'))
+    for key, values in headers.items():
+        # 多个 Cookie 头按 RFC 6265 用 "; " 拼起来 (用逗号拼会被当成同一个 cookie 的值)
+        environ[key] = ('; ' if key == 'HTTP_COOKIE' else ',').join(values)
+    return environ
+
+class WsgiRequest:
+    """一个请求：在线程池里执行 WSGI 应用，通过 send 把响应发回事件循环"""
+
+    def __init__(self, wsgi_application, scope, send):
+        self.wsgi_application = wsgi_application
+        self.scope = scope
+        self.send = async_to_sync(send)
+        self.response_start = None
+        self.response_started = False
+        self.content_length = None
+
+    def start_response(self, status, response_headers, exc_info=None):
+        if exc_info is not None:
+            try:
+                if self.response_started:
+                    # 响应头已经发出去了，只能中断
+                    raise exc_info[1].with_traceback(exc_info[2])
+            finally:
+                exc_info = None
+        elif self.response_start is not None:
+            raise ValueError('start_response 只能调用一次 (除非带 exc_info)')
+        self.content_length = None
+        for name, value in response_headers:
+            if name.lower() == 'content-length':
+                self.content_length = int(value)
+        self.response_start = {
+            'type': 'http.response.start',
+            'status': int(status.split(' ', 1)[0]),
+            'headers': [(name.lower().encode('ascii'), value.encode('latin1')) for name, value in response_headers],
+        }
+
+    def _start(self):
+        if not self.response_started:
+            self.response_started = True
+            self.send(self.response_start)
+
+    def run(self, body):
+        try:
+            environ = build_environ(self.scope, body)
+        except ValueError:
+            self.send({'type': 'http.response.start', 'status': 400,
+                       'headers': [(b'content-type', b'text/plain')]})
+            self.send({'type': 'http.response.body', 'body': b'Bad Request'})
+            return
+        result = self.wsgi_application(environ, self.start_response)
+        try:
+            sent = 0
+            for output in result:
+                if not output:
+                    continue
+                self._start()
+                # 不超过 Content-Length
+                if self.content_length is not None:
+                    output = output[:self.content_length - sent]
+                self.send({'type': 'http.response.body', 'body': output, 'more_body': True})
+                sent += len(output)
+                if sent == self.content_length:
+                    break
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        self._start()
+        self.send({'type': 'http.response.body'})
+
+class ThreadedWsgiToAsgi:
+    def __init__(self, wsgi_application, threads=ASGI_THREADS):
+        self.wsgi_application = wsgi_application
+        self.threads = threads
+        self.executor = None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            raise ValueError(f"不支持的 ASGI 连接类型：{scope['type']}")
+        if self.executor is None:
+            # 每个 worker 进程各自建线程池 (不能在 fork 之前建)
+            self.executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix='asgi')
+        with SpooledTemporaryFile(max_size=BODY_SPOOL_SIZE) as body:
+            while True:
+                message = await receive()
+                if message['type'] == 'http.disconnect':
+                    return
+                body.write(message.get('body', b''))
+                if not message.get('more_body'):
+                    break
+            body.seek(0)
+            request = WsgiRequest(self.wsgi_application, scope, send)
+            await sync_to_async(request.run, thread_sensitive=False, executor=self.executor)(body)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self.executor is not None:
+                    self.executor.shutdown(wait=True)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+application = ThreadedWsgiToAsgi(app)
@@ -0,0 +1,540 @@
+"""
+网站路由压测：合成语料 (1x / 10x / 100x) + 测试客户端 / gunicorn 两种跑法
+
+用法 (在项目根目录)：
+    python -m benchmarks.bench_routes                                # 1x 10x 100x，测试客户端
+    python -m benchmarks.bench_routes --scales 1 10 --server gunicorn --workers 2 --threads 4
+    python -m benchmarks.bench_routes --scales 10 --server gunicorn-sync gunicorn asgi --concurrency 8 --only mixed
+    python -m benchmarks.bench_routes --compare 旧结果.json 新结果.json   # 对比两次结果，变慢的标出来
+
+- 合成语料：以 instance/works.db (由 作品统计.xlsx 导入) 为样本，把作品和史料复制成 N 份
+  (作家 / 文类 / 年份 / 刊物的分布和真实数据一样)，再像 init_db.py 一样建全文索引、统计表和索引。
+  生成的数据库放在 instance/bench/，样本没变时直接复用
+- 场景：/creation (筛选、简体检索、繁体检索)、/article/<id>、/materials、/material/<id>/<子文件夹>、/search (全站检索)，
+  以及 mixed：慢请求 (检索) 和快请求 (文章页) 按 1:4 混在一起，另外单独统计其中快请求的延迟 (mixed_fast)，
+  看慢请求会不会拖慢别人 (要配合 --concurrency)；mixed_io 的慢请求换成慢速客户端 (SLOW_CLIENT_RATE)
+  下载最大的一张扫描图，只在 gunicorn / asgi 下跑
+- 服务方式：client (测试客户端)、gunicorn (gthread)、gunicorn-sync (sync worker)、asgi (uvicorn worker + asgi.py)
+- 每个场景报告 p50 / p95 / p99 延迟、吞吐量 (请求/秒)，以及压测期间的内存峰值 (RSS，gunicorn 时是所有进程之和)
+- 页面缓存默认关掉 (测的是真正的查询和渲染)，--cache 打开
+- 结果存成 JSON (默认 benchmarks/results/<时间>-<提交>.json)，用 --compare 对比不同提交
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import socket
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote, urlencode
+
+warnings.filterwarnings('ignore')
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SOURCE_DB = os.path.join(ROOT, 'instance', 'works.db')
+CORPUS_DIR = os.path.join(ROOT, 'instance', 'bench')
+RESULTS_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+MATERIALS_DIR = os.path.join(ROOT, 'static', 'materials')
+
+# 检索用的关键词 (简体)；繁体场景用同一组词转成繁体
+KEYWORDS = ['南洋', '国家', '妇女', '战争', '香港', '孩子', '学校', '新加坡']
+# mixed_io 里慢速客户端的下载速度 (字节/秒) 和接收缓冲区大小
+SLOW_CLIENT_RATE = 1024 * 1024
+SLOW_CLIENT_BUFFER = 16 * 1024
+# 对比时 p50 / p95 慢了这么多就算退步
+REGRESSION_THRESHOLD = 0.2
+
+# ============================================
+# 1. 合成语料
+# ============================================
+
+def corpus_path(scale):
+    return os.path.join(CORPUS_DIR, f'works-{scale}x.db')
+
+def _source_stamp(source):
+    st = os.stat(source)
+    return f'{st.st_size}-{st.st_mtime_ns}'
+
+def _copy_children(conn, table, key, id_map):
+    """把 table 里属于原来那批 id 的行复制一份，key 列换成对应的新 id"""
+    cols = [row[1] for row in conn.execute(f'PRAGMA table_info({table})') if row[1] not in ('id', key)]
+    rows = conn.execute(f"SELECT {key}, {', '.join(cols)} FROM {table} WHERE {key} <= ? ORDER BY id",
+                        (max(id_map, default=0),)).fetchall()
+    conn.executemany(f"INSERT INTO {table} ({key}, {', '.join(cols)}) VALUES ({', '.join('?' * (len(cols) + 1))})",
+                     [(id_map[row[0]],) + tuple(row[1:]) for row in rows if row[0] in id_map])
+
+def build_corpus(scale, source=SOURCE_DB, fts=True):
+    """
+    功能：生成 scale 倍大小的数据库，返回路径。
+    第 i 份 (i >= 1) 的标题加上 “(i)”，其余字段 (包括正文、图片、史料文件夹) 和样本一样。
+    """
+    path = corpus_path(scale)
+    stamp = f'{_source_stamp(source)}-fts{int(fts)}'
+    stamp_path = path + '.stamp'
+    if os.path.exists(path) and os.path.exists(stamp_path):
+        with open(stamp_path) as f:
+            if f.read() == stamp:
+                return path
+
+    os.makedirs(CORPUS_DIR, exist_ok=True)
+    for suffix in ('', '-wal', '-shm', '.stamp'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    print(f'🔨 生成 {scale}x 语料 -> {path}')
+    started = time.perf_counter()
+
+    # 用 backup 复制 (样本库可能是 WAL 模式)
+    src = sqlite3.connect(source)
+    dst = sqlite3.connect(path)
+    src.backup(dst)
+    src.close()
+
+    work_cols = [row[1] for row in dst.execute('PRAGMA table_info(work)') if row[1] not in ('id', 'title')]
+    material_cols = [row[1] for row in dst.execute('PRAGMA table_info(material)') if row[1] not in ('id', 'sort_index')]
+    max_work = dst.execute('SELECT MAX(id) FROM work').fetchone()[0] or 0
+    max_sort = dst.execute('SELECT MAX(sort_index) + 1 FROM material').fetchone()[0] or 0
+    work_ids = [row[0] for row in dst.execute('SELECT id FROM work ORDER BY id')]
+    material_ids = [row[0] for row in dst.execute('SELECT id FROM material ORDER BY id')]
+    tables = {row[0] for row in dst.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    for i in range(1, scale):
+        last_work = dst.execute('SELECT MAX(id) FROM work').fetchone()[0] or 0
+        last_material = dst.execute('SELECT MAX(id) FROM material').fetchone()[0] or 0
+        dst.execute(f"INSERT INTO work (title, {', '.join(work_cols)}) "
+                    f"SELECT title || ' ({i})', {', '.join(work_cols)} FROM work WHERE id <= ? ORDER BY id", (max_work,))
+        dst.execute(f"INSERT INTO material (sort_index, {', '.join(material_cols)}) "
+                    f"SELECT sort_index + ?, {', '.join(material_cols)} FROM material "
+                    f"WHERE id <= ? ORDER BY id", (max_sort * i, material_ids[-1] if material_ids else 0))
+        # 配图 / 史料文件记录跟着复制 (按 id 顺序一一对应到新插入的行)
+        if 'work_image' in tables:
+            new_ids = [row[0] for row in dst.execute('SELECT id FROM work WHERE id > ? ORDER BY id', (last_work,))]
+            _copy_children(dst, 'work_image', 'work_id', dict(zip(work_ids, new_ids)))
+        new_ids = [row[0] for row in dst.execute('SELECT id FROM material WHERE id > ? ORDER BY id', (last_material,))]
+        for table in ('material_file', 'material_doc'):
+            if table in tables:
+                _copy_children(dst, table, 'material_id', dict(zip(material_ids, new_ids)))
+    dst.commit()
+    dst.close()
+
+    # 全文索引、统计表、索引：和导入脚本用同一套代码
+    from sqlalchemy import create_engine
+
+    import aggregates
+    import db_config
+    import search_index
+    import site_search
+    from app import db
+
+    engine = create_engine(f'sqlite:///{path}')
+    with engine.begin() as conn:
+        if fts:
+            rows = conn.exec_driver_sql('SELECT id, title, content FROM work').fetchall()
+            search_index.rebuild(conn, rows)
+            if 'material_doc' in tables:
+                rows = conn.exec_driver_sql('SELECT id, title, content FROM material_doc').fetchall()
+                search_index.rebuild(conn, rows, site_search.MATERIAL_FTS)
+        aggregates.refresh(conn)
+    db_config.optimize(db, engine)
+    engine.dispose()
+
+    with open(stamp_path, 'w') as f:
+        f.write(stamp)
+    works = sqlite3.connect(path).execute('SELECT COUNT(*) FROM work').fetchone()[0]
+    print(f'   ✅ {works} 篇作品，{os.path.getsize(path) / 1e6:.1f} MB，用时 {time.perf_counter() - started:.1f} 秒')
+    return path
+
+# ============================================
+# 2. 场景 (每个场景是一组地址，压测时轮流请求)
+# ============================================
+
+def _deep_folders(author, folder):
+    """史料文件夹下最深的几层子文件夹 (相对路径)"""
+    base = os.path.join(MATERIALS_DIR, author, folder)
+    found = []
+    for root, dirs, _ in os.walk(base):
+        if root != base and not dirs:
+            found.append(os.path.relpath(root, base).replace(os.sep, '/'))
+    return found
+
+def scenarios(path, seed=0):
+    import zh_convert
+
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    groups = conn.execute('SELECT author, genre, year FROM work_count').fetchall()
+    work_ids = [row[0] for row in conn.execute('SELECT id FROM work')]
+    materials = conn.execute('SELECT id, author, folder_name, publication FROM material').fetchall()
+    conn.close()
+
+    filters = ['/creation']
+    for author, genre, year in rng.sample(groups, min(20, len(groups))):
+        filters.append('/creation?' + urlencode({'author': author or 'all', 'genre': genre or 'all'}))
+        filters.append('/creation?' + urlencode({'genre': genre or 'all', 'year': year or 'unknown'}))
+
+    def search_urls(keywords):
+        return ['/creation?' + urlencode({'q': k}) for k in keywords] + \
+               ['/creation?' + urlencode({'q': k, 'author': rng.choice(groups)[0] or 'all'}) for k in keywords]
+
+    material_urls = ['/materials']
+    for _, author, _, publication in rng.sample(materials, min(20, len(materials))):
+        material_urls.append('/materials?' + urlencode({'author': author}))
+        material_urls.append('/materials?' + urlencode({'publication': publication}))
+
+    deep = []
+    by_folder = {}
+    for material_id, author, folder, _ in materials:
+        by_folder.setdefault((author, folder), material_id)
+    for (author, folder), material_id in by_folder.items():
+        for sub in _deep_folders(author, folder):
+            deep.append(f'/material/{material_id}/{quote(sub)}')
+    if not deep:
+        deep = [f'/material/{material_id}' for material_id in by_folder.values()]
+
+    plan = {
+        'creation_filter': filters,
+        'creation_search_simplified': search_urls(KEYWORDS),
+        'creation_search_traditional': search_urls([zh_convert.convert(k, 'zh-tw') for k in KEYWORDS]),
+        'article': [f'/article/{i}' for i in rng.sample(work_ids, min(50, len(work_ids)))],
+        'materials': material_urls,
+        'material_deep': deep,
+        'site_search': ['/search?' + urlencode({'q': k}) for k in KEYWORDS] +
+                       ['/search?' + urlencode({'q': k, 'type': 'material'}) for k in KEYWORDS],
+    }
+    # 慢 : 快 = 1 : 4
+    slow, fast = plan['creation_search_simplified'], plan['article']
+    plan['mixed'] = _interleave(slow, fast)
+    plan['mixed_io'] = _interleave([f'/static/{largest_scan()}#slow'] * len(slow), fast)
+    return plan
+
+def _interleave(slow, fast, ratio=4):
+    return [url for i, s in enumerate(slow) for url in [s] + fast[i * ratio % len(fast):][:ratio]]
+
+def largest_scan():
+    """作品 / 史料里最大的文件 (相对 static/ 的路径，已转义)"""
+    best = (0, None)
+    for top in ('works', 'materials'):
+        for root, _, names in os.walk(os.path.join(ROOT, 'static', top)):
+            for name in names:
+                path = os.path.join(root, name)
+                best = max(best, (os.path.getsize(path), path))
+    return quote(os.path.relpath(best[1], os.path.join(ROOT, 'static')).replace(os.sep, '/'))
+
+# mixed 场景里的快请求 (单独统计延迟)
+def is_fast(url):
+    return url.startswith('/article/')
+
+# ============================================
+# 3. 统计
+# ============================================
+
+def percentile(sorted_values, p):
+    """最近秩法"""
+    if not sorted_values:
+        return None
+    k = max(0, min(len(sorted_values), math.ceil(p / 100 * len(sorted_values))) - 1)
+    return sorted_values[k]
+
+def summarize(latencies, errors, wall):
+    values = sorted(latencies)
+    return {
+        'requests': len(values),
+        'errors': errors,
+        'p50_ms': round(percentile(values, 50) * 1000, 3) if values else None,
+        'p95_ms': round(percentile(values, 95) * 1000, 3) if values else None,
+        'p99_ms': round(percentile(values, 99) * 1000, 3) if values else None,
+        'mean_ms': round(sum(values) / len(values) * 1000, 3) if values else None,
+        'rps': round(len(values) / wall, 2) if wall else None,
+    }
+
+def _rss_kb(pid):
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+def _children(pid):
+    try:
+        with open(f'/proc/{pid}/task/{pid}/children') as f:
+            return [int(p) for p in f.read().split()]
+    except OSError:
+        return []
+
+class RssSampler:
+    """后台线程每隔 interval 秒统计一次进程 (及其子进程) 的 RSS，记下最大值"""
+
+    def __init__(self, pid, interval=0.05):
+        self.pid = pid
+        self.interval = interval
+        self.peak_kb = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while True:
+            total = _rss_kb(self.pid) + sum(_rss_kb(child) for child in _children(self.pid))
+            self.peak_kb = max(self.peak_kb, total)
+            if self._stop.wait(self.interval):
+                return
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    @property
+    def peak_mb(self):
+        return round(self.peak_kb / 1024, 1)
+
+# ============================================
+# 4. 压测
+# ============================================
+
+def drive(fetch, urls, requests, concurrency, warmup):
+    """用 concurrency 个线程轮流请求 urls，共 requests 次；返回 ([(地址, 延迟)], 出错次数, 总用时)"""
+    for url in urls[:warmup]:
+        fetch(url)
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+
+    def one(i):
+        url = urls[i % len(urls)]
+        start = time.perf_counter()
+        ok = fetch(url)
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append((url, elapsed))
+            if not ok:
+                errors[0] += 1
+
+    started = time.perf_counter()
+    if concurrency <= 1:
+        for i in range(requests):
+            one(i)
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(one, range(requests)))
+    return latencies, errors[0], time.perf_counter() - started
+
+def run_scenarios(fetch, plan, args, pid):
+    results = []
+    for name, urls in plan.items():
+        if args.only and name not in args.only:
+            continue
+        with RssSampler(pid) as rss:
+            latencies, errors, wall = drive(fetch, urls, args.requests, args.concurrency, args.warmup)
+        rows = [dict(scenario=name, **summarize([t for _, t in latencies], errors, wall), peak_rss_mb=rss.peak_mb)]
+        if name in ('mixed', 'mixed_io'):
+            fast = [t for url, t in latencies if is_fast(url)]
+            rows.append(dict(scenario=f'{name}_fast', **summarize(fast, 0, wall), peak_rss_mb=rss.peak_mb))
+        for row in rows:
+            results.append(row)
+            _print_row(row)
+    return results
+
+def _print_row(row):
+    name, errors = row['scenario'], row['errors']
+    print(f"   {name:<30} p50 {row['p50_ms']:>8.2f} ms  p95 {row['p95_ms']:>8.2f} ms  "
+          f"p99 {row['p99_ms']:>8.2f} ms  {row['rps']:>8.1f} 次/秒  RSS {row['peak_rss_mb']} MB"
+          + (f'  ⚠️ 出错 {errors} 次' if errors else ''), flush=True)
+
+def app_env(path, cache):
+    env = dict(os.environ)
+    env['FLASK_SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+    env['FLASK_CACHE_ENABLED'] = 'true' if cache else 'false'
+    return env
+
+def run_client(path, args):
+    """测试客户端：在子进程里跑 (每个规模一个干净的进程，内存峰值互不影响)"""
+    cmd = [sys.executable, '-m', 'benchmarks.bench_routes', '--_client', path,
+           '--requests', str(args.requests), '--concurrency', str(args.concurrency),
+           '--warmup', str(args.warmup), '--seed', str(args.seed)] + (['--only'] + args.only if args.only else [])
+    output = subprocess.run(cmd, cwd=ROOT, env=app_env(path, args.cache), check=True,
+                            stdout=subprocess.PIPE, text=True).stdout
+    # 最后一行是 JSON 结果，前面是进度
+    lines = output.rstrip().splitlines()
+    print('\n'.join(lines[:-1]))
+    return json.loads(lines[-1])
+
+def client_main(path, args):
+    from app import app
+
+    local = threading.local()
+
+    def fetch(url):
+        # 测试客户端不是线程安全的，每个线程一个
+        client = getattr(local, 'client', None)
+        if client is None:
+            client = local.client = app.test_client()
+        response = client.get(url)
+        response.get_data()
+        return response.status_code == 200
+
+    plan = scenarios(path, args.seed)
+    plan.pop('mixed_io')  # 测试客户端没有网络传输，慢速客户端没有意义
+    results = run_scenarios(fetch, plan, args, os.getpid())
+    print(json.dumps(results))
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def slow_download(port, url):
+    """慢速客户端：接收缓冲区很小，按 SLOW_CLIENT_RATE 的速度一块一块读"""
+    sock = socket.socket()
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SLOW_CLIENT_BUFFER)
+    try:
+        sock.settimeout(120)
+        sock.connect(('127.0.0.1', port))
+        sock.sendall(f'GET {url} HTTP/1.0\r\nHost: 127.0.0.1\r\n\r\n'.encode())
+        chunk = SLOW_CLIENT_BUFFER
+        first = b''
+        while True:
+            data = sock.recv(chunk)
+            if not data:
+                break
+            first = first or data
+            time.sleep(len(data) / SLOW_CLIENT_RATE)
+        return first.startswith(b'HTTP/1.1 200') or first.startswith(b'HTTP/1.0 200')
+    except OSError:
+        return False
+    finally:
+        sock.close()
+
+# 各种服务方式的 gunicorn 参数 (项目根目录的 gunicorn.conf.py 也会生效，这里的参数优先)
+SERVER_ARGS = {
+    'gunicorn': ['--worker-class', 'gthread', 'app:app'],
+    'gunicorn-sync': ['--worker-class', 'sync', 'app:app'],
+    'asgi': ['--worker-class', 'uvicorn_worker.UvicornWorker', 'asgi:application'],
+}
+
+def run_server(server_type, path, args):
+    port = _free_port()
+    cmd = [sys.executable, '-m', 'gunicorn', '--bind', f'127.0.0.1:{port}', '--workers', str(args.workers),
+           '--threads', str(args.threads), '--log-level', 'warning'] + SERVER_ARGS[server_type]
+    env = app_env(path, args.cache)
+    env['ASGI_THREADS'] = str(args.threads)
+    server = subprocess.Popen(cmd, cwd=ROOT, env=env)
+    base = f'http://127.0.0.1:{port}'
+
+    def fetch(url):
+        if url.endswith('#slow'):
+            return slow_download(port, url[:-len('#slow')])
+        try:
+            with urllib.request.urlopen(base + url, timeout=60) as response:
+                response.read()
+                return response.status == 200
+        except OSError:
+            return False
+
+    try:
+        deadline = time.monotonic() + 30
+        while not fetch('/'):
+            if server.poll() is not None or time.monotonic() > deadline:
+                raise RuntimeError(f'{server_type} 没有启动成功')
+            time.sleep(0.2)
+        return run_scenarios(fetch, scenarios(path, args.seed), args, server.pid)
+    finally:
+        server.terminate()
+        server.wait()
+
+# ============================================
+# 5. 结果
+# ============================================
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+def compare(old_path, new_path):
+    """对比两份结果，p50 或 p95 慢了 REGRESSION_THRESHOLD 以上的标 ⚠️；有退步时返回 1"""
+    def load(p):
+        with open(p) as f:
+            data = json.load(f)
+        return data['meta'], {(r['scale'], r['server'], r['scenario']): r for r in data['results']}
+
+    old_meta, old = load(old_path)
+    new_meta, new = load(new_path)
+    print(f"对比 {old_meta['commit']} -> {new_meta['commit']}")
+    regressions = 0
+    for key in sorted(old.keys() & new.keys()):
+        a, b = old[key], new[key]
+        changes = {m: (b[m] - a[m]) / a[m] for m in ('p50_ms', 'p95_ms') if a[m] and b[m] is not None}
+        flag = any(c > REGRESSION_THRESHOLD for c in changes.values())
+        regressions += flag
+        scale, server, scenario = key
+        print(f"{'⚠️' if flag else '  '} {scale:>4}x {server:<13} {scenario:<30} "
+              f"p50 {a['p50_ms']:.2f} -> {b['p50_ms']:.2f} ms ({changes.get('p50_ms', 0):+.0%})  "
+              f"p95 {a['p95_ms']:.2f} -> {b['p95_ms']:.2f} ms ({changes.get('p95_ms', 0):+.0%})")
+    print(f"{'⚠️' if regressions else '✅'} 变慢的场景: {regressions} 个")
+    return 1 if regressions else 0
+
+def main():
+    parser = argparse.ArgumentParser(description='网站路由压测')
+    parser.add_argument('--scales', type=int, nargs='+', default=[1, 10, 100], help='语料规模 (样本的倍数)')
+    parser.add_argument('--server', nargs='+', choices=['client'] + list(SERVER_ARGS), default=['client'],
+                        help='服务方式 (可以写多个)')
+    parser.add_argument('--only', nargs='+', help='只跑这几个场景')
+    parser.add_argument('--requests', type=int, default=200, help='每个场景请求多少次')
+    parser.add_argument('--concurrency', type=int, default=1, help='同时发请求的线程数')
+    parser.add_argument('--warmup', type=int, default=5, help='正式计时前先请求几次')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn worker 数')
+    parser.add_argument('--threads', type=int, default=4, help='每个 worker 的线程数 (gthread / asgi)')
+    parser.add_argument('--cache', action='store_true', help='打开页面缓存')
+    parser.add_argument('--no-fts', action='store_true', help='不建全文索引 (测 LIKE 全表扫描)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', help='结果文件 (默认 benchmarks/results/<时间>-<提交>.json)')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='对比两份结果')
+    parser.add_argument('--_client', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.compare:
+        sys.exit(compare(*args.compare))
+    if args._client:
+        client_main(args._client, args)
+        return
+
+    results = []
+    for scale in args.scales:
+        path = build_corpus(scale, fts=not args.no_fts)
+        for server in args.server:
+            print(f'🚀 {scale}x / {server}', flush=True)
+            rows = run_client(path, args) if server == 'client' else run_server(server, path, args)
+            results.extend(dict(row, scale=scale, server=server) for row in rows)
+
+    commit = git_commit()
+    meta = {
+        'commit': commit,
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'cpus': os.cpu_count(),
+        'platform': platform.platform(),
+        'args': {k: v for k, v in vars(args).items() if k not in ('compare', '_client', 'out')},
+    }
+    out = args.out or os.path.join(RESULTS_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{commit}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, 'w') as f:
+        json.dump({'meta': meta, 'results': results}, f, ensure_ascii=False, indent=2)
+    print(f'✅ 结果已保存: {out}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+"""
+worker 冷启动测量：加载应用要多久、新 fork 出来的 worker 第一个请求要多久
+
+用法 (在项目根目录)：
+    python -m benchmarks.bench_startup                 # 三种配置各跑 3 次，取中位数
+    python -m benchmarks.bench_startup --runs 5 --out 结果.json
+
+每次都在新的 Python 进程里：
+1. import app (和 gunicorn 的 preload_app 一样，在“主进程”里加载应用)，记下耗时
+2. fork 一个子进程当作新 worker，依次请求 FIRST_URLS，每个地址记下第一次和第二次请求的耗时
+   (第一次要编译模板、建连接、加载简繁转换表 ...，第二次是正常情况)
+配置：
+- no-cache：不用字节码缓存、不预热 (每个 worker 第一次用到模板时从源码编译)
+- bytecode：字节码缓存 (template_cache.py)，缓存已经生成好，不预热
+- warmup：字节码缓存 + TEMPLATE_WARMUP (gunicorn.conf.py 的默认配置)
+页面缓存关掉 (测的是真正的渲染)；数据库用 bench_routes 的 1x 语料 (有统计表、全文索引)。
+最后按 BUDGET_MS 检查 warmup 配置，超出预算时返回 1。
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 新 worker 要请求的地址 (大模板、列表页、详情页、不存在的页面)
+FIRST_URLS = ['/', '/map', '/yingzi-work-timeline', '/article/1', '/creation?author=yingzi',
+              '/materials', '/material/1', '/no-such-page']
+
+# 预算 (毫秒)：加载应用；新 worker 的任意一个第一次请求
+BUDGET_MS = {'import': 3000, 'first_request': 150}
+
+CONFIGS = {
+    'no-cache': {'FLASK_TEMPLATE_CACHE_DIR': 'false', 'FLASK_TEMPLATE_WARMUP': 'false'},
+    'bytecode': {'FLASK_TEMPLATE_WARMUP': 'false'},
+    'warmup': {'FLASK_TEMPLATE_WARMUP': 'true'},
+}
+
+def child():
+    """子进程：加载应用，再 fork 一个“worker”请求 FIRST_URLS，结果 (JSON) 打印到标准输出"""
+    started = time.perf_counter()
+    sys.path.insert(0, ROOT)
+    from app import app
+    import_ms = (time.perf_counter() - started) * 1000
+
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        client = app.test_client()
+        timings = {}
+        for url in FIRST_URLS:
+            result = []
+            for _ in range(2):
+                t = time.perf_counter()
+                response = client.get(url)
+                response.get_data()
+                result.append((time.perf_counter() - t) * 1000)
+            timings[url] = {'status': response.status_code, 'first': result[0], 'second': result[1]}
+        with os.fdopen(write_fd, 'w') as f:
+            json.dump(timings, f)
+        os._exit(0)
+    os.close(write_fd)
+    with os.fdopen(read_fd) as f:
+        requests = json.load(f)
+    os.waitpid(pid, 0)
+    print(json.dumps({'import': import_ms, 'requests': requests}))
+
+def run_once(config, env):
+    out = subprocess.run([sys.executable, '-m', 'benchmarks.bench_startup', '--_child'], cwd=ROOT,
+                         env=dict(env, **CONFIGS[config]), capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+def measure(runs):
+    from benchmarks.bench_routes import build_corpus
+
+    db_path = build_corpus(1)
+    tmp = tempfile.mkdtemp(prefix='bench-startup-')
+    env = dict(os.environ, FLASK_SQLALCHEMY_DATABASE_URI=f'sqlite:///{db_path}', FLASK_CACHE_ENABLED='false',
+               FLASK_INSTRUMENTATION_ENABLED='false', FLASK_PRECOMPRESS_DIR=os.path.join(tmp, 'precompressed'),
+               FLASK_TEMPLATE_CACHE_DIR=json.dumps(os.path.join(tmp, 'jinja_cache')))
+    # 先跑一次生成字节码缓存 (bytecode / warmup 测的是缓存已经有了的情况)
+    run_once('bytecode', env)
+
+    results = {}
+    for config in CONFIGS:
+        samples = [run_once(config, env) for _ in range(runs)]
+        results[config] = {
+            'import': statistics.median(s['import'] for s in samples),
+            'requests': {url: {'status': samples[0]['requests'][url]['status'],
+                               'first': statistics.median(s['requests'][url]['first'] for s in samples),
+                               'second': statistics.median(s['requests'][url]['second'] for s in samples)}
+                         for url in FIRST_URLS},
+        }
+    return results
+
+def report(results):
+    print(f"\n{'':28s}" + ''.join(f'{config:>20s}' for config in results))
+    print(f"{'import app (ms)':28s}" + ''.join(f"{r['import']:20.0f}" for r in results.values()))
+    for url in FIRST_URLS:
+        cells = ''.join(f"{r['requests'][url]['first']:12.1f} / {r['requests'][url]['second']:5.1f}"
+                        for r in results.values())
+        print(f'{url:28s}{cells}')
+    print('(请求一栏：第一次 / 第二次，毫秒)')
+    for url, r in results['warmup']['requests'].items():
+        if r['status'] >= 500:
+            print(f"❌ {url} 返回 {r['status']} (样本数据库是不是还没用 init_db.py 重新导入？)")
+
+    warm = results['warmup']
+    slowest = max(warm['requests'].items(), key=lambda item: item[1]['first'])
+    ok = True
+    if warm['import'] > BUDGET_MS['import']:
+        print(f"⚠️ 加载应用 {warm['import']:.0f} ms，超出预算 {BUDGET_MS['import']} ms")
+        ok = False
+    if slowest[1]['first'] > BUDGET_MS['first_request']:
+        print(f"⚠️ 新 worker 第一次请求 {slowest[0]} 用了 {slowest[1]['first']:.0f} ms，"
+              f"超出预算 {BUDGET_MS['first_request']} ms")
+        ok = False
+    if ok:
+        print(f"✅ warmup：加载应用 {warm['import']:.0f} ms，新 worker 最慢的第一次请求 "
+              f"{slowest[0]} {slowest[1]['first']:.0f} ms，都在预算之内")
+    return ok
+
+def main():
+    parser = argparse.ArgumentParser(description='worker 冷启动测量')
+    parser.add_argument('--runs', type=int, default=3, help='每种配置跑几次 (取中位数)')
+    parser.add_argument('--out', help='结果存成 JSON')
+    parser.add_argument('--_child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args._child:
+        child()
+        return
+    results = measure(args.runs)
+    ok = report(results)
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump({'budget_ms': BUDGET_MS, 'results': results}, f, ensure_ascii=False, indent=2)
+    sys.exit(0 if ok else 1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+简繁转换微基准：一次检索要做多少次 zhconv 转换、花多少时间
+
+用法 (在项目根目录)：
+    python -m benchmarks.bench_zhconv [关键词] [结果条数]
+
+- 旧写法：creation() 转 2 次，每一行的 extract_sentence、highlight 过滤器各再转 2 次
+- 新写法：所有地方都走 zh_convert.keyword_forms()，同一个关键词只真正转换一次
+另外会用测试客户端真实请求一次检索页和文章页，统计 zhconv.convert 被调用的次数。
+"""
+import sys
+import time
+import warnings
+
+from zhconv import zhconv as _zhconv
+
+import zh_convert
+
+warnings.filterwarnings('ignore')
+
+def old_search(keyword, rows):
+    _zhconv.convert(keyword, 'zh-cn')
+    _zhconv.convert(keyword, 'zh-tw')
+    for _ in range(rows):
+        # extract_sentence + highlight(snippet) 各转换一次简、繁
+        for _ in range(2):
+            _zhconv.convert(keyword, 'zh-cn')
+            _zhconv.convert(keyword, 'zh-tw')
+
+def new_search(keyword, rows):
+    zh_convert.keyword_forms(keyword)
+    for _ in range(rows):
+        for _ in range(2):
+            zh_convert.keyword_forms(keyword)
+
+def count_calls(func, *args):
+    """统计 func 运行期间 zhconv.convert 真正被调用的次数"""
+    original = _zhconv.convert
+    calls = [0]
+
+    def counting(*a, **kw):
+        calls[0] += 1
+        return original(*a, **kw)
+
+    _zhconv.convert = counting
+    try:
+        func(*args)
+    finally:
+        _zhconv.convert = original
+    return calls[0]
+
+def timeit(func, *args, repeat=20):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(*args)
+    return (time.perf_counter() - start) / repeat * 1000
+
+def main():
+    keyword = sys.argv[1] if len(sys.argv) > 1 else '國家'
+    rows = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+    print(f'关键词: {keyword}  结果条数: {rows}')
+    print(f'旧写法: 每次检索 {count_calls(old_search, keyword, rows)} 次转换, {timeit(old_search, keyword, rows):.2f} ms')
+    zh_convert.convert.cache_clear()
+    zh_convert.keyword_forms.cache_clear()
+    print(f'新写法 (冷缓存): 每次检索 {count_calls(new_search, keyword, rows)} 次转换')
+    print(f'新写法 (热缓存): 每次检索 {count_calls(new_search, keyword, rows)} 次转换, {timeit(new_search, keyword, rows):.2f} ms')
+
+    # 真实请求 (关掉页面缓存，只看转换次数)
+    from app import app
+    app.config['CACHE_ENABLED'] = False
+    client = app.test_client()
+    zh_convert.convert.cache_clear()
+    zh_convert.keyword_forms.cache_clear()
+    for url in (f'/creation?mode=search&q={keyword}&per_page={rows}', f'/article/1?q={keyword}'):
+        print(f'{url}: {count_calls(client.get, url)} 次转换')
+    print(zh_convert.cache_info())
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,333 @@
+"""
+页面缓存 / 片段缓存
+
+网站的数据只有在重新运行 init_db.py / init_materials.py 时才会变，
+所以页面和查询结果都可以缓存起来，导入脚本运行后统一作废。
+
+- 内存缓存：LRU + 过期时间 + 总字节数上限 (每个 gunicorn worker 各一份)
+- 磁盘缓存 (可选)：存在 instance 目录下，所有 worker 共用；有总大小上限，
+  超出后按最近访问时间淘汰 (爬虫带着各种查询参数来也不会把磁盘写满)
+- 数据版本号：导入脚本调用 bump_data_version() 写入 instance/data_version，
+  版本号变了之后旧缓存全部作废
+"""
+import hashlib
+import os
+import pickle
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import request
+
+DATA_VERSION_FILE = 'data_version'
+
+# ============================================
+# 1. 数据版本号
+# ============================================
+
+def bump_data_version(instance_path):
+    """导入脚本写完数据库后调用：生成新的数据版本号"""
+    os.makedirs(instance_path, exist_ok=True)
+    path = os.path.join(instance_path, DATA_VERSION_FILE)
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        f.write(str(time.time_ns()))
+    os.replace(tmp, path)
+
+class DataVersion:
+    """读取数据版本号；只有文件 mtime 变了才重新读文件"""
+
+    def __init__(self, instance_path):
+        self.path = os.path.join(instance_path, DATA_VERSION_FILE)
+        self._mtime = None
+        self._value = '0'
+
+    def get(self):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            return '0'
+        if mtime != self._mtime:
+            with open(self.path) as f:
+                self._value = f.read().strip() or '0'
+            self._mtime = mtime
+        return self._value
+
+# ============================================
+# 2. 内存 LRU 缓存
+# ============================================
+
+class LRUCache:
+    """
+    功能：线程安全的 LRU 缓存，同时限制条数、总字节数和过期时间。
+    超出上限时从最久没用过的开始淘汰。
+    """
+
+    def __init__(self, max_entries=512, max_bytes=64 * 1024 * 1024, ttl=3600):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._data = OrderedDict() # key -> (过期时间, 字节数, 值)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            expires, size, value = item
+            if expires < time.monotonic():
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, size):
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (time.monotonic() + self.ttl, size, value)
+            self._bytes += size
+            while len(self._data) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._data)))
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def _remove(self, key):
+        _, size, _ = self._data.pop(key)
+        self._bytes -= size
+
+    def stats(self):
+        return {'entries': len(self._data), 'bytes': self._bytes,
+                'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+# ============================================
+# 3. 磁盘缓存 (多个 worker 共用)
+# ============================================
+
+class DiskCache:
+    """
+    功能：把缓存写成文件，按数据版本号分目录；版本号变了就删掉旧目录。
+    写入先写临时文件再 os.replace，多个进程同时读写也不会读到半个文件。
+    总大小超过 max_bytes 时删掉最久没访问的文件，删到上限的 90% (和 thumbnails.py 一样)。
+    “最近访问时间”记在文件的 atime 上 (命中时用 os.utime 显式写入，不依赖挂载选项)，
+    mtime 保持写入时间，用来判断过期 (ttl)。
+    """
+
+    def __init__(self, directory, ttl=3600, max_bytes=256 * 1024 * 1024):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._bytes = None # 当前版本目录的总大小 (第一次写入时统计)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _path(self, version, key):
+        name = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, version, name[:2], name)
+
+    def get(self, version, key):
+        path = self._path(version, key)
+        try:
+            st = os.stat(path)
+            if st.st_mtime + self.ttl < time.time():
+                self.misses += 1
+                return None
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+            # 记下访问时间 (淘汰用)，写入时间不变
+            os.utime(path, ns=(time.time_ns(), st.st_mtime_ns))
+        except (OSError, EOFError, pickle.UnpicklingError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value
+
+    def set(self, version, key, value):
+        path = self._path(version, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        try:
+            old_size = os.path.getsize(path)
+        except OSError:
+            old_size = 0
+        os.replace(tmp, path)
+        self._account(version, path, os.path.getsize(path) - old_size)
+
+    def _account(self, version, new_path, added):
+        """记账；总大小超出上限时按访问时间从旧到新删除 (刚写入的这个除外)"""
+        with self._lock:
+            if self._bytes is None:
+                self._bytes = sum(size for _, size, _ in self._scan(version))
+            else:
+                self._bytes += added
+            if self._bytes <= self.max_bytes:
+                return
+            # 其他 worker 也在写，重新统计一遍再淘汰
+            files = sorted(self._scan(version))
+            self._bytes = sum(size for _, size, _ in files)
+            target = self.max_bytes * 0.9
+            for _, size, path in files:
+                if self._bytes <= target:
+                    break
+                if path == new_path:
+                    continue
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                self._bytes -= size
+                self.evictions += 1
+
+    def _scan(self, version):
+        """当前版本目录里的缓存文件：(访问时间, 大小, 路径)；不含还没写完的临时文件"""
+        for root, _, files in os.walk(os.path.join(self.directory, version)):
+            for name in files:
+                if name.endswith('.tmp'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                yield st.st_atime, st.st_size, path
+
+    def prune(self, version):
+        """删掉其他版本号的缓存目录"""
+        with self._lock:
+            self._bytes = None
+        if not os.path.isdir(self.directory):
+            return
+        for name in os.listdir(self.directory):
+            if name != version:
+                shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'bytes': self._bytes, 'max_bytes': self.max_bytes}
+
+# ============================================
+# 4. Flask 集成
+# ============================================
+
+def request_args(ignored=()):
+    """
+    功能：缓存键里的请求参数。排序，保证 ?a=1&b=2 和 ?b=2&a=1 命中同一份缓存。
+    空值要保留：视图把 author= 当作真的筛选条件 (筛出 0 条)，不能和没有这个参数的请求共用缓存。
+    """
+    return tuple(sorted((k, v) for k, v in request.args.items(multi=True) if k not in ignored))
+
+class ResponseCache:
+    """
+    功能：页面缓存 + 片段缓存。
+    - @response_cache.view 装饰路由，按 路径 + 整理后的查询参数 缓存整页
+    - response_cache.memo(key, func) 缓存某个查询/计算的结果
+    配置项：CACHE_ENABLED, CACHE_TTL, CACHE_MAX_ENTRIES, CACHE_MAX_BYTES, CACHE_DIR, CACHE_DIR_MAX_BYTES
+    """
+
+    # 不影响页面内容的参数，不放进缓存键
+    IGNORED_ARGS = ('stream',)
+
+    def __init__(self, app):
+        self.app = app
+        config = app.config
+        self.version = DataVersion(app.instance_path)
+        self.memory = LRUCache(config['CACHE_MAX_ENTRIES'], config['CACHE_MAX_BYTES'], config['CACHE_TTL'])
+        self.disk = DiskCache(config['CACHE_DIR'], config['CACHE_TTL'],
+                              config.get('CACHE_DIR_MAX_BYTES', 256 * 1024 * 1024)) if config['CACHE_DIR'] else None
+        self._seen_version = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.app.config['CACHE_ENABLED']
+
+    def current_version(self):
+        """当前数据版本号；发现版本号变了就清空旧缓存"""
+        version = self.version.get()
+        if version != self._seen_version:
+            with self._lock:
+                if version != self._seen_version:
+                    self.memory.clear()
+                    if self.disk:
+                        self.disk.prune(version)
+                    self._seen_version = version
+        return version
+
+    def _lookup(self, key, size_of):
+        version = self.current_version()
+        value = self.memory.get(key)
+        if value is None and self.disk:
+            value = self.disk.get(version, key)
+            if value is not None:
+                self.memory.set(key, value, size_of(value))
+        return version, value
+
+    def _store(self, version, key, value, size):
+        self.memory.set(key, value, size)
+        if self.disk:
+            self.disk.set(version, key, value)
+
+    def memo(self, key, func, size=1024):
+        """
+        片段缓存：key 对应的结果不存在时调用 func() 计算并缓存。
+        size 是估计的大小 (字节)，也可以是根据结果算大小的函数。
+        """
+        if not self.enabled:
+            return func()
+        key = ('memo', key)
+        size_of = size if callable(size) else (lambda v: size)
+        version, value = self._lookup(key, size_of)
+        if value is None:
+            value = func()
+            self._store(version, key, value, size_of(value))
+        return value
+
+    @staticmethod
+    def request_key():
+        return ('view', request.path, request_args(ResponseCache.IGNORED_ARGS))
+
+    def view(self, func):
+        """页面缓存：只缓存 GET 的 200 非流式响应"""
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not self.enabled or request.method != 'GET' or request.args.get('stream') == '1':
+                return func(*args, **kwargs)
+
+            key = self.request_key()
+            version, cached = self._lookup(key, lambda v: len(v[0]))
+            if cached is not None:
+                body, status, mimetype = cached
+                return self.app.response_class(body, status=status, mimetype=mimetype)
+
+            response = self.app.make_response(func(*args, **kwargs))
+            if response.status_code == 200 and not response.is_streamed:
+                body = response.get_data()
+                self._store(version, key, (body, response.status_code, response.mimetype), len(body))
+            return response
+        return wrapper
+
+    def stats(self):
+        data = {'enabled': self.enabled, 'data_version': self.version.get(), 'memory': self.memory.stats()}
+        if self.disk:
+            data['disk'] = self.disk.stats()
+        return data
@@ -1,64 +1,187 @@
+import argparse
+import hashlib
 import os
-from PIL import Image
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from PIL import Image, ImageOps, features
+
+import image_variants
+from image_variants import FORMATS, MAX_WIDTH, VARIANTS_DIR, WIDTHS
 
 # ================= 配置区域 =================
 # 你的图片文件夹路径 (根据你的实际情况修改)
-TARGET_FOLDER = 'static' 
+TARGET_FOLDER = 'static'
+
+# 压缩质量 (1-100)。原图不再被覆盖，只影响生成的 WebP / AVIF
+WEBP_QUALITY = 75
+AVIF_QUALITY = 55
 
-# 压缩质量 (1-100)，建议 60-75。
-# 60 是 "瘦身极限"，肉眼几乎看不出区别，但体积会极其小。
-QUALITY = 60 
+# 处理图片的进程数 (编码 AVIF / WebP 很吃 CPU，用多进程)
+WORKERS = os.cpu_count() or 4
+
+# 每处理完这么多张就保存一次清单 (中途中断后，下次从这里接着做)
+SAVE_EVERY = 50
+
+IMAGE_EXTS = ('.jpg', '.jpeg', '.png', '.webp')
 # ===========================================
 
-def compress_images(directory):
-    total_saved = 0
-    count = 0
-    
-    print(f"🚀 开始在 [{directory}] 及其子文件夹中压缩图片...")
-    
-    # 遍历所有文件夹和子文件夹
-    for root, dirs, files in os.walk(directory):
+def file_hash(path):
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+def output_formats():
+    """当前 Pillow 支持的输出格式 (没有 AVIF 插件时只出 WebP)"""
+    return [fmt for fmt in FORMATS if features.check(fmt)]
+
+def target_widths(width):
+    """要生成的宽度：比原图窄的档位 + 一张“全尺寸” (不超过 MAX_WIDTH)"""
+    full = min(width, MAX_WIDTH)
+    return [w for w in WIDTHS if w < full] + [full]
+
+def outputs_exist(static_dir, entry):
+    return all(os.path.exists(os.path.join(static_dir, path))
+               for versions in entry['variants'].values() for _, path in versions)
+
+def process_image(static_dir, rel_path, formats, old_entry):
+    """
+    功能：(在子进程里运行) 算原图哈希，生成各宽度、各格式的版本，返回清单条目。
+    文件名里带内容哈希，内容没变时直接复用已有的输出，不重新编码。
+    """
+    src = os.path.join(static_dir, rel_path)
+    st = os.stat(src)
+    digest = file_hash(src)
+    if old_entry and old_entry.get('hash') == digest and outputs_exist(static_dir, old_entry) \
+            and set(old_entry['variants']) == set(formats):
+        return dict(old_entry, size=st.st_size, mtime_ns=st.st_mtime_ns), 0
+
+    with Image.open(src) as img:
+        img = ImageOps.exif_transpose(img)
+        if img.mode not in ('RGB', 'RGBA'):
+            img = img.convert('RGBA' if 'A' in img.getbands() or 'transparency' in img.info else 'RGB')
+        width, height = img.size
+
+        out_dir = os.path.join(VARIANTS_DIR, digest[:2])
+        os.makedirs(os.path.join(static_dir, out_dir), exist_ok=True)
+        variants = {fmt: [] for fmt in formats}
+        written = 0
+        for w in target_widths(width):
+            resized = img if w == width else img.resize((w, max(1, round(height * w / width))), Image.LANCZOS)
+            for fmt in formats:
+                rel_out = f'{out_dir}/{digest}-{w}.{fmt}'
+                out = os.path.join(static_dir, rel_out)
+                if not os.path.exists(out):
+                    # 内容一样的两张原图 (不同路径) 会在不同进程里写同一个输出，临时文件名不能只看输出名
+                    with tempfile.NamedTemporaryFile(dir=os.path.dirname(out), prefix=os.path.basename(out) + '.',
+                                                     suffix='.tmp', delete=False) as f:
+                        tmp = f.name
+                        try:
+                            if fmt == 'webp':
+                                resized.save(f, 'WEBP', quality=WEBP_QUALITY, method=6)
+                            else:
+                                resized.save(f, 'AVIF', quality=AVIF_QUALITY)
+                        except BaseException:
+                            f.close()
+                            os.remove(tmp)
+                            raise
+                    # NamedTemporaryFile 建的是 0600，nginx 等其他用户要能读
+                    os.chmod(tmp, 0o644)
+                    os.replace(tmp, out)
+                    written += os.path.getsize(out)
+                variants[fmt].append([w, rel_out])
+
+    entry = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'hash': digest,
+             'width': width, 'height': height, 'variants': variants}
+    return entry, written
+
+def find_images(static_dir):
+    """遍历 static/ 下所有原图 (跳过 variants 文件夹本身)，返回相对路径 -> os.stat"""
+    found = {}
+    for root, dirs, files in os.walk(static_dir):
+        if root == static_dir and VARIANTS_DIR in dirs:
+            dirs.remove(VARIANTS_DIR)
+        for file in files:
+            if file.lower().endswith(IMAGE_EXTS):
+                path = os.path.join(root, file)
+                found[os.path.relpath(path, static_dir).replace('\\', '/')] = os.stat(path)
+    return found
+
+def prune_outputs(static_dir, manifest):
+    """删掉清单里已经没有引用的衍生文件"""
+    used = {path for entry in manifest.values() for versions in entry['variants'].values() for _, path in versions}
+    removed = 0
+    for root, _, files in os.walk(os.path.join(static_dir, VARIANTS_DIR)):
         for file in files:
-            file_path = os.path.join(root, file)
-            file_ext = file.lower().split('.')[-1]
-            
-            # 只处理 jpg, jpeg, png
-            if file_ext in ['jpg', 'jpeg', 'png']:
+            rel = os.path.relpath(os.path.join(root, file), static_dir).replace('\\', '/')
+            if file != image_variants.MANIFEST_NAME and rel not in used:
+                os.remove(os.path.join(root, file))
+                removed += 1
+    return removed
+
+def compress_images(directory, workers=WORKERS, prune=False):
+    start = time.time()
+    print(f"🚀 开始在 [{directory}] 及其子文件夹中生成 WebP / AVIF 版本...")
+
+    formats = output_formats()
+    manifest_file = image_variants.manifest_path(directory)
+    old_manifest = image_variants.load_manifest(manifest_file)
+
+    # 1. 找出所有原图；大小和修改时间都没变、输出也都在的直接跳过 (不用读文件)
+    found = find_images(directory)
+    manifest = {}
+    todo = []
+    for rel_path, st in found.items():
+        entry = old_manifest.get(rel_path)
+        if entry and entry.get('size') == st.st_size and entry.get('mtime_ns') == st.st_mtime_ns \
+                and set(entry['variants']) == set(formats) and outputs_exist(directory, entry):
+            manifest[rel_path] = entry
+        else:
+            todo.append(rel_path)
+
+    print(f"📷 共 {len(found)} 张原图，需要处理 {len(todo)} 张 (格式: {', '.join(formats)}，进程数: {workers})")
+
+    # 2. 多进程处理；每完成 SAVE_EVERY 张保存一次清单
+    total_written = 0
+    count = 0
+    errors = 0
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(process_image, directory, rel_path, formats, old_manifest.get(rel_path)): rel_path
+                       for rel_path in todo}
+            for future in as_completed(futures):
+                rel_path = futures[future]
                 try:
-                    # 1. 获取原始大小
-                    original_size = os.path.getsize(file_path)
-                    
-                    # 2. 打开图片
-                    with Image.open(file_path) as img:
-                        # 如果是 PNG，检查是否需要转 JPG (PNG体积很大，如果不需要透明背景，转JPG能小几倍)
-                        # 这里为了安全，我们只压缩，不改格式，避免代码报错
-                        
-                        # 3. 压缩并覆盖保存
-                        # optimize=True 会自动去除多余元数据
-                        if file_ext == 'png':
-                            # PNG 压缩比较特殊
-                            img.save(file_path, optimize=True, quality=QUALITY)
-                        else:
-                            # JPG/JPEG 压缩
-                            img.save(file_path, optimize=True, quality=QUALITY)
-                    
-                    # 4. 计算节省了多少
-                    new_size = os.path.getsize(file_path)
-                    saved = original_size - new_size
-                    if saved > 0:
-                        total_saved += saved
-                        print(f"✅ 已压缩: {file} | 节省: {saved/1024:.2f} KB")
-                        count += 1
-                    else:
-                        print(f"➖ 跳过 (已是最优): {file}")
-                        
+                    entry, written = future.result()
                 except Exception as e:
-                    print(f"❌ 处理出错: {file} - {e}")
+                    print(f"❌ 处理出错: {rel_path} - {e}")
+                    errors += 1
+                    continue
+                manifest[rel_path] = entry
+                total_written += written
+                count += 1
+                if written:
+                    print(f"✅ 已生成: {rel_path} | {entry['width']}x{entry['height']} -> {written/1024:.2f} KB")
+                if count % SAVE_EVERY == 0:
+                    image_variants.save_manifest(manifest_file, manifest)
+    finally:
+        image_variants.save_manifest(manifest_file, manifest)
+
+    if prune:
+        print(f"🧹 清理了 {prune_outputs(directory, manifest)} 个不再使用的文件")
 
+    original = sum(st.st_size for st in found.values())
     print("="*30)
-    print(f"🎉 处理完成！共压缩 {count} 张图片。")
-    print(f"📉 总共为你节省了空间: {total_saved / 1024 / 1024:.2f} MB")
+    print(f"🎉 处理完成！本次处理 {count} 张图片，失败 {errors} 张，用时 {time.time() - start:.1f} 秒。")
+    print(f"📦 原图总大小: {original / 1024 / 1024:.2f} MB，本次新写入: {total_written / 1024 / 1024:.2f} MB")
     print("="*30)
 
 if __name__ == '__main__':
-    compress_images(TARGET_FOLDER)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='把 static/ 下的图片转成多个宽度的 WebP / AVIF (原图不动)')
+    parser.add_argument('--workers', type=int, default=WORKERS, help='进程数')
+    parser.add_argument('--prune', action='store_true', help='删除不再使用的衍生文件')
+    args = parser.parse_args()
+    compress_images(TARGET_FOLDER, workers=args.workers, prune=args.prune)
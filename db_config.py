@@ -0,0 +1,155 @@
+"""
+SQLite 连接设置
+
+- 读写模式 (默认)：WAL 日志，导入脚本写库时网站照样能读，读写互不阻塞
+- 只读模式 (DB_MODE=readonly)：网站 worker 用 mode=ro 打开数据库，不可能误写；导入照常进行
+- 不变模式 (DB_MODE=immutable)：告诉 SQLite 文件不会变，完全不加锁、不读 WAL。
+  只适合“在别处导入好，整个文件原子替换 (os.replace) 上线”的部署；
+  文件被替换后 (inode / mtime 变了) 连接池会自动重建；页面缓存仍然要靠 bump_data_version() 作废
+- 每个连接都设置 mmap_size / cache_size / temp_store
+- 连接池大小按 gunicorn 每个 worker 的线程数来定 (DB_POOL_SIZE)；
+  fork 出的子进程不沿用父进程的连接 (gunicorn --preload 时)
+
+模式和连接池也可以用环境变量 DB_MODE / DB_POOL_SIZE 指定，方便 gunicorn 启动时切换。
+"""
+import os
+
+import click
+from sqlalchemy import event, inspect, text
+from sqlalchemy.engine import make_url
+
+DB_MODES = ('readwrite', 'readonly', 'immutable')
+
+DEFAULTS = {
+    'DB_MODE': os.environ.get('DB_MODE', 'readwrite'),
+    'DB_POOL_SIZE': int(os.environ.get('DB_POOL_SIZE', 8)),  # 一般等于 gunicorn --threads
+    'DB_POOL_OVERFLOW': 4,
+    'DB_BUSY_TIMEOUT': 5,                     # 秒：写锁被占用时最多等多久
+    'DB_MMAP_SIZE': 256 * 1024 * 1024,        # 整个数据库映射进内存 (多个 worker 共用操作系统的页缓存)
+    'DB_CACHE_SIZE': 64 * 1024,               # 每个连接的页缓存 (KiB)
+}
+
+# ============================================
+# 1. 创建 SQLAlchemy 之前调用：连接地址 + 连接池参数
+# ============================================
+
+def configure(app):
+    """根据 DB_MODE 改写 SQLALCHEMY_DATABASE_URI，并设置 SQLALCHEMY_ENGINE_OPTIONS"""
+    for key, value in DEFAULTS.items():
+        app.config.setdefault(key, value)
+    mode = app.config['DB_MODE']
+    if mode not in DB_MODES:
+        raise ValueError(f"DB_MODE 只能是 {', '.join(DB_MODES)}，而不是 {mode!r}")
+
+    url = make_url(app.config['SQLALCHEMY_DATABASE_URI'])
+    if mode != 'readwrite' and url.get_backend_name() == 'sqlite' and not url.query.get('uri'):
+        # sqlite:///file:works.db?mode=ro&uri=true (相对路径仍然由 Flask-SQLAlchemy 放到 instance 目录)
+        params = {'uri': 'true', 'mode': 'ro'}
+        if mode == 'immutable':
+            params['immutable'] = '1'
+        url = url.set(database=f'file:{url.database}').update_query_dict(params)
+        app.config['SQLALCHEMY_DATABASE_URI'] = url.render_as_string(hide_password=False)
+
+    options = app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {})
+    options.setdefault('pool_size', app.config['DB_POOL_SIZE'])
+    options.setdefault('max_overflow', app.config['DB_POOL_OVERFLOW'])
+    options.setdefault('connect_args', {}).setdefault('timeout', app.config['DB_BUSY_TIMEOUT'])
+
+# ============================================
+# 2. 创建 SQLAlchemy 之后调用：每个连接的 PRAGMA、fork、文件替换
+# ============================================
+
+def init_app(app, db):
+    mode = app.config['DB_MODE']
+    mmap_size = app.config['DB_MMAP_SIZE']
+    cache_size = app.config['DB_CACHE_SIZE']
+
+    with app.app_context():
+        engine = db.engine
+
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_conn, _):
+        cursor = dbapi_conn.cursor()
+        if mode == 'readwrite':
+            # WAL 是写在数据库文件里的，设置一次以后一直有效；这里每次连接都确认一下
+            cursor.execute('PRAGMA journal_mode=WAL')
+            cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.execute(f'PRAGMA mmap_size={int(mmap_size)}')
+        cursor.execute(f'PRAGMA cache_size={-int(cache_size)}')
+        cursor.execute('PRAGMA temp_store=MEMORY')
+        cursor.close()
+
+    # gunicorn --preload：父进程里打开过的连接不能在子进程里用，子进程重新建连接池
+    if hasattr(os, 'register_at_fork'):
+        os.register_at_fork(after_in_child=lambda: engine.dispose(close=False))
+
+    if mode == 'immutable' and engine.url.database:
+        watcher = FileWatcher(engine.url.database.removeprefix('file:'))
+
+        @app.before_request
+        def reopen_replaced_database():
+            if watcher.changed():
+                engine.dispose()
+
+    app.cli.add_command(optimize_command(app, db))
+
+class FileWatcher:
+    """数据库文件被整个替换 (inode 或 mtime 变了) 时 changed() 返回 True"""
+
+    def __init__(self, path):
+        self.path = path
+        self._stamp = self._read()
+
+    def _read(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return st.st_ino, st.st_mtime_ns
+
+    def changed(self):
+        stamp = self._read()
+        if stamp == self._stamp:
+            return False
+        self._stamp = stamp
+        return True
+
+# ============================================
+# 3. 导入脚本 / flask optimize-db：索引 + 统计信息
+# ============================================
+
+def optimize(db, engine=None, tables=None):
+    """
+    功能：补建模型里声明的索引 (旧数据库里的表不会自动加索引)，切换到 WAL，
+    更新查询优化器用的统计信息，并把 WAL 里的内容写回数据库文件。
+    engine 默认是 db.engine (压测生成语料时传别的数据库)。返回新建的索引名列表。
+    """
+    engine = engine or db.engine
+    created = []
+    inspector = inspect(engine)
+    for table in tables or db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {ix['name'] for ix in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(engine)
+                created.append(index.name)
+    with engine.connect() as conn:
+        conn.execute(text('PRAGMA journal_mode=WAL'))
+        conn.execute(text('ANALYZE'))
+        conn.execute(text('PRAGMA optimize'))
+        conn.commit()
+        # 不变模式下的 worker 不读 WAL，所以导入完要把 WAL 全部写回数据库文件
+        conn.execute(text('PRAGMA wal_checkpoint(TRUNCATE)'))
+    return created
+
+def optimize_command(app, db):
+    @click.command('optimize-db')
+    def optimize_db():
+        """补建索引、切换到 WAL 并更新统计信息 (导入脚本结束时会自动做一次)"""
+        if app.config['DB_MODE'] != 'readwrite':
+            raise click.ClickException('DB_MODE 不是 readwrite，不能修改数据库')
+        created = optimize(db)
+        click.echo(f"✅ 新建索引 {len(created)} 个{': ' + ', '.join(created) if created else ''}，统计信息已更新")
+    return optimize_db
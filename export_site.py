@@ -0,0 +1,416 @@
+"""
+静态站点导出 (flask --app app export)
+
+网站的数据只有运行导入脚本时才会变，所以可以把所有页面预先生成成静态文件，交给 nginx 直接发送：
+- 从 Work / Material 表和史料文件夹推出所有地址：每篇文章、每个史料文件夹 (包括子文件夹)、
+  /creation 和 /materials 的各种筛选组合、所有静态页面；再顺着页面里的链接 (翻页、子文件夹) 继续抓取
+- 用测试客户端请求每个地址，页面里的站内链接改写成导出后的文件路径；
+  带参数的地址按参数排序后取哈希作为文件名，地址和文件的对应关系写在 _export/routes.json
+- 检索 (带 q 的 /creation、全站检索 /search) 没法预先生成，改由 search.html 在浏览器里用按作者分片的检索数据完成
+  (简繁折叠表也一起导出)；页面里的表单由 static/js/static-export.js 接管
+- 缩略图、static/ 目录一起导出 (static/ 尽量用硬链接，不占额外空间)
+- 增量：文章 / 史料页按 (模板和代码版本, 数据指纹) 判断要不要重新生成，
+  其他页面重新渲染但内容没变就不写文件；不再存在的页面会被删掉。--full 全部重新生成
+
+nginx 配置示例：
+    root /path/to/site;
+    location / {
+        try_files $uri $uri.html $uri/index.html =404;
+        gzip_static on;     # 页面旁边有预先压缩好的 .gz / .br
+        brotli_static on;   # (需要 ngx_brotli)
+    }
+"""
+import hashlib
+import html
+import json
+import os
+import re
+import shutil
+from collections import deque
+from urllib.parse import parse_qsl, quote, unquote, urlencode, urlsplit
+
+import click
+from flask import render_template
+from sqlalchemy import inspect
+
+import precompress
+import zh_convert
+
+# 参数取这些默认值时和不带这个参数一样
+DEFAULT_ARGS = {'author': 'all', 'genre': 'all', 'year': 'all', 'publication': 'all'}
+# 不影响页面内容的参数
+DROPPED_ARGS = ('stream',)
+# 不导出的地址
+# /search (全站检索) 要用数据库里的全文索引，不导出；指向它的链接改到浏览器端的 search.html
+SKIPPED_PATHS = ('/cache-stats', '/search')
+
+# 导出的 search.html 认识的参数 (见 static/js/static-export.js 的 runSearch)
+SEARCH_ARGS = ('q', 'author')
+
+EXTRA_DIR = '_export'
+MANIFEST_NAME = os.path.join(EXTRA_DIR, 'manifest.json')
+SHIM_TAG = '<script src="/static/js/static-export.js" defer></script>'
+# 预压缩文件的后缀 (nginx gzip_static / brotli_static 认的名字)
+SUFFIXES = {'br': 'br', 'gzip': 'gz'}
+
+_LINK = re.compile(r'(\b(?:href|src)=")(/[^"]*)(")')
+
+def _sha1(data):
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    return hashlib.sha1(data).hexdigest()
+
+# ============================================
+# 1. 地址 -> 文件
+# ============================================
+
+def canonical(url):
+    """
+    功能：把站内地址整理成统一的形式 (路径, 排好序的参数)。
+    去掉默认值和空值参数；文章页的 q 只影响高亮，也去掉。
+    """
+    parts = urlsplit(html.unescape(url))
+    path = unquote(parts.path)
+    args = []
+    for key, value in parse_qsl(parts.query, keep_blank_values=True):
+        if key in DROPPED_ARGS or value == '' or DEFAULT_ARGS.get(key) == value:
+            continue
+        if key == 'q' and path.startswith('/article/'):
+            continue
+        args.append((key, value))
+    return path, tuple(sorted(args))
+
+def route_key(path, args):
+    """routes.json 的键 (static-export.js 用同样的规则生成)"""
+    return path + ('?' + '&'.join(f'{k}={v}' for k, v in args) if args else '')
+
+def file_for(path, args):
+    """导出后的文件路径 (相对输出目录)；不能导出的地址返回 None"""
+    if path.startswith(('/static/', '/thumb/')) or path in SKIPPED_PATHS:
+        return None
+    if any(k == 'q' for k, _ in args):
+        return None
+    segments = [s for s in path.strip('/').split('/') if s]
+    if any(s in ('.', '..') for s in segments):
+        return None
+    name = '/'.join(segments) or 'index'
+    if name.endswith('.html'):
+        name = name[:-5]
+    if args:
+        name += '/_/' + _sha1(urlencode(args))[:16]
+    return name + '.html'
+
+def file_url(file):
+    return '/' + quote(file)
+
+# ============================================
+# 2. 导出
+# ============================================
+
+class SiteExporter:
+    def __init__(self, app, out_dir, full=False):
+        self.app = app
+        self.out_dir = out_dir
+        self.full = full
+        self.client = app.test_client()
+        self.old = self._load_manifest() if not full else {}
+        self.pages = {}    # 文件 -> {url, key, hash, links}
+        self.routes = {}   # route_key -> 文件地址
+        self.thumbs = {}   # 文件 -> etag
+        self.files = set() # 这次输出的所有文件
+        self.stats = {'rendered': 0, 'written': 0, 'skipped': 0, 'failed': 0, 'removed': 0}
+        self.site_version = self._site_version()
+        self.has_import_hash = None
+        self.has_material_file = None
+
+    def _load_manifest(self):
+        try:
+            with open(os.path.join(self.out_dir, MANIFEST_NAME), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _site_version(self):
+        """模板和代码的版本：任何一个文件改了，所有页面都要重新生成"""
+        app = self.app
+        paths = [os.path.join(app.root_path, name) for name in os.listdir(app.root_path) if name.endswith('.py')]
+        for root, _, names in os.walk(os.path.join(app.root_path, app.template_folder)):
+            paths += [os.path.join(root, name) for name in names if name.endswith('.html')]
+        return _sha1('|'.join(f'{path}:{os.stat(path).st_mtime_ns}' for path in sorted(paths)))
+
+    # ---------- 写文件 ----------
+
+    def write(self, rel, data, compress=False):
+        """内容没变就不写；compress=True 时旁边再放 .gz / .br (给 nginx 的 gzip_static 用)"""
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        path = os.path.join(self.out_dir, rel)
+        outputs = [(rel, None)]
+        if compress and len(data) >= precompress.MIN_SIZE:
+            outputs += [(f'{rel}.{SUFFIXES[enc]}', enc) for enc in precompress.available_encodings()]
+        changed = True
+        try:
+            with open(path, 'rb') as f:
+                changed = f.read() != data
+        except OSError:
+            pass
+        for out_rel, encoding in outputs:
+            self.files.add(out_rel)
+            out_path = os.path.join(self.out_dir, out_rel)
+            if not changed and os.path.exists(out_path):
+                continue
+            out_data = data if out_rel == rel else precompress.compress(data, encoding, precompress.BUILD_LEVELS[encoding])
+            precompress._write_atomic(out_path, out_data)
+            self.stats['written'] += 1
+
+    # ---------- 起点地址 ----------
+
+    def seed_urls(self):
+        from app import Material, Work, db, precompressed
+
+        # 静态页面：和网站用同一张路由表 (precompress.py)
+        urls = ['/']
+        urls += [f'/{page}' for page in sorted(precompressed.known_pages()) if page != 'index']
+
+        # 作品：每篇文章 + 作家标签页 + 检索框里 作家 / 年份 / 文类 的各种组合 (只要有结果的)
+        urls.append('/creation')
+        combos = set()
+        for author, genre, year in db.session.query(Work.author, Work.genre, Work.year).distinct():
+            year = str(year) if year else 'unknown'
+            urls.append(f"/creation?{urlencode({'author': author})}")
+            for a in (author, 'all'):
+                for g in (genre, 'all'):
+                    for y in (year, 'all'):
+                        combos.add((a, y, g))
+        for a, y, g in sorted(combos):
+            urls.append(f"/creation?{urlencode({'mode': 'search', 'author': a, 'year': y, 'genre': g})}")
+        urls += [f'/article/{work_id}' for work_id, in db.session.query(Work.id).order_by(Work.id)]
+
+        # 史料：筛选组合 + 每个史料文件夹 (子文件夹顺着页面里的链接抓取)
+        combos = set()
+        for author, publication in db.session.query(Material.author, Material.publication).distinct():
+            for a in (author, 'all'):
+                for p in (publication or 'all', 'all'):
+                    combos.add((a, p))
+        urls += [f"/materials?{urlencode({'author': a, 'publication': p})}" for a, p in sorted(combos)]
+        urls += [f'/material/{material_id}' for material_id, in db.session.query(Material.id).order_by(Material.id)]
+        return urls
+
+    # ---------- 数据指纹 (增量导出用) ----------
+
+    def data_key(self, path):
+        """文章 / 史料页的数据指纹；算不出来时返回 None (每次都重新渲染)"""
+        from app import Material, MaterialFile, Work, db
+
+        m = re.match(r'^/article/(\d+)$', path)
+        if m:
+            # 还没有重新导入过的旧数据库没有 import_hash 列，只能每次都渲染
+            if self.has_import_hash is None:
+                columns = inspect(db.engine).get_columns('work')
+                self.has_import_hash = any(c['name'] == 'import_hash' for c in columns)
+            if not self.has_import_hash:
+                return None
+            row = db.session.query(Work.import_hash).filter(Work.id == int(m.group(1))).first()
+            return _sha1(f'{self.site_version}|{row[0]}') if row and row[0] else None
+        m = re.match(r'^/material/(\d+)(?:/(.*))?$', path)
+        if m:
+            material = db.session.get(Material, int(m.group(1)))
+            if material is None:
+                return None
+            folder = os.path.join(self.app.static_folder, 'materials', material.author,
+                                  material.folder_name, m.group(2) or '')
+            try:
+                mtime = os.stat(folder).st_mtime_ns
+            except OSError:
+                return None
+            fields = (material.author, material.folder_name, material.publication,
+                      material.publish_time, material.source, material.sort_index)
+            # 页面里的文件地址带内容哈希 (?v=)，文件内容变了也要重新生成
+            # 还没运行过新版 init_materials.py 的旧数据库没有 material_file 表
+            if self.has_material_file is None:
+                self.has_material_file = inspect(db.engine).has_table('material_file')
+            hashes = []
+            if self.has_material_file:
+                hashes = [h for h, in db.session.query(MaterialFile.hash).filter_by(
+                    material_id=material.id, dir=(m.group(2) or '').strip('/')).order_by(MaterialFile.ordinal)]
+            return _sha1(f'{self.site_version}|{fields!r}|{mtime}|{hashes!r}')
+        return None
+
+    # ---------- 页面 ----------
+
+    def rewrite(self, body):
+        """把页面里的站内链接改成导出后的地址，返回 (新页面, 链到的页面地址列表)"""
+        links = []
+
+        def replace(m):
+            url = html.unescape(m.group(2))
+            path, args = canonical(url)
+            if path.startswith('/static/'):
+                return m.group(0)
+            if path.startswith('/thumb/'):
+                self.thumbs.setdefault(path[1:], None)
+                return m.group(1) + html.escape(quote(path)) + m.group(3)
+            if (path == '/creation' and any(k == 'q' for k, _ in args)) or path == '/search':
+                # 检索交给浏览器端的 search.html (全站检索也一样，只能检索作品)
+                if path == '/search':
+                    args = [(k, v) for k, v in args if k in SEARCH_ARGS]
+                return m.group(1) + html.escape('/search.html' + ('?' + urlencode(args) if args else '')) + m.group(3)
+            file = file_for(path, args)
+            if file is None:
+                return m.group(0)
+            links.append(url)
+            return m.group(1) + html.escape(file_url(file)) + m.group(3)
+
+        body = _LINK.sub(replace, body)
+        if '</body>' in body:
+            body = body.replace('</body>', SHIM_TAG + '\n</body>', 1)
+        return body, links
+
+    def export_page(self, url):
+        path, args = canonical(url)
+        file = file_for(path, args)
+        if file is None or file in self.pages:
+            return []
+        self.routes[route_key(path, args)] = file_url(file)
+
+        key = self.data_key(path)
+        old = self.old.get('pages', {}).get(file)
+        if key and old and old.get('key') == key and os.path.exists(os.path.join(self.out_dir, file)):
+            self.pages[file] = old
+            self.files.add(file)
+            self.files.update(f'{file}.{suffix}' for suffix in SUFFIXES.values()
+                              if os.path.exists(os.path.join(self.out_dir, f'{file}.{suffix}')))
+            self.thumbs.update({t: None for t in old.get('thumbs', ()) if t not in self.thumbs})
+            self.stats['skipped'] += 1
+            return old.get('links', [])
+
+        response = self.client.get(url)
+        if response.status_code != 200 or not response.mimetype == 'text/html':
+            self.stats['failed'] += 1
+            click.echo(f"   ⚠️ {url} -> {response.status_code}")
+            return []
+        self.stats['rendered'] += 1
+        before = set(self.thumbs)
+        body, links = self.rewrite(response.get_data(as_text=True))
+        self.write(file, body, compress=True)
+        self.pages[file] = {'url': url, 'key': key, 'hash': _sha1(body), 'links': links,
+                            'thumbs': sorted(set(self.thumbs) - before)}
+        return links
+
+    def crawl(self):
+        queue = deque(self.seed_urls())
+        while queue:
+            queue.extend(self.export_page(queue.popleft()))
+
+    # ---------- 缩略图 / static / 检索数据 ----------
+
+    def export_thumbs(self):
+        from app import thumbnails
+
+        old = self.old.get('thumbs', {})
+        for rel in sorted(self.thumbs):
+            _, size, filename = rel.split('/', 2)
+            found = thumbnails.get(filename, int(size))
+            if found is None:
+                continue
+            src, etag = found
+            self.thumbs[rel] = etag
+            self.files.add(rel)
+            target = os.path.join(self.out_dir, rel)
+            if old.get(rel) != etag or not os.path.exists(target):
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                shutil.copyfile(src, target)
+                self.stats['written'] += 1
+
+    def export_static(self):
+        """把 static/ 同步到输出目录 (能硬链接就硬链接)"""
+        static = self.app.static_folder
+        for root, _, names in os.walk(static):
+            for name in names:
+                src = os.path.join(root, name)
+                rel = os.path.join('static', os.path.relpath(src, static)).replace('\\', '/')
+                target = os.path.join(self.out_dir, rel)
+                self.files.add(rel)
+                st = os.stat(src)
+                try:
+                    tst = os.stat(target)
+                    if tst.st_size == st.st_size and tst.st_mtime_ns == st.st_mtime_ns:
+                        continue
+                    os.remove(target)
+                except OSError:
+                    pass
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                try:
+                    os.link(src, target)
+                except OSError:
+                    shutil.copy2(src, target)
+                self.stats['written'] += 1
+
+    def export_search(self):
+        """浏览器端检索用的数据：按作者分片的作品全文 + 简繁折叠表 + 检索页"""
+        from app import Work, db
+
+        shards = {}
+        rows = db.session.query(Work.id, Work.title, Work.author, Work.year, Work.genre, Work.content).order_by(Work.id)
+        for work_id, title, author, year, genre, content in rows:
+            shards.setdefault(author or 'unknown', []).append([work_id, title, year or 0, genre or '', content or ''])
+        index = {}
+        for author, works in sorted(shards.items()):
+            data = json.dumps({'author': author, 'works': works}, ensure_ascii=False, separators=(',', ':'))
+            rel = f'{EXTRA_DIR}/search/{author}.json'
+            self.write(rel, data, compress=True)
+            index[author] = {'url': file_url(rel), 'works': len(works), 'hash': _sha1(data)[:12]}
+        self.write(f'{EXTRA_DIR}/search/index.json', json.dumps(index, ensure_ascii=False), compress=True)
+
+        fold = {chr(code): ch for code, ch in zh_convert.FOLD_TABLE.items()}
+        self.write(f'{EXTRA_DIR}/search/fold.json',
+                   json.dumps(fold, ensure_ascii=False, separators=(',', ':')), compress=True)
+
+        with self.app.test_request_context('/search.html'):
+            body = render_template('export/search.html')
+        self.write('search.html', body, compress=True)
+
+    def remove_stale(self):
+        """删掉上次导出过、这次不再存在的文件"""
+        old_files = set(self.old.get('files', ()))
+        for rel in sorted(old_files - self.files):
+            try:
+                os.remove(os.path.join(self.out_dir, rel))
+                self.stats['removed'] += 1
+            except OSError:
+                pass
+
+    def run(self):
+        app = self.app
+        cache_enabled = app.config['CACHE_ENABLED']
+        # 逐页渲染一遍，没必要填满页面缓存
+        app.config['CACHE_ENABLED'] = False
+        try:
+            with app.app_context():
+                self.crawl()
+                self.export_thumbs()
+                self.export_search()
+        finally:
+            app.config['CACHE_ENABLED'] = cache_enabled
+        self.export_static()
+        self.write(f'{EXTRA_DIR}/routes.json', json.dumps(self.routes, ensure_ascii=False, sort_keys=True))
+        self.files.add(MANIFEST_NAME)
+        self.remove_stale()
+        manifest = {'site_version': self.site_version, 'pages': self.pages,
+                    'thumbs': self.thumbs, 'files': sorted(self.files)}
+        precompress._write_atomic(os.path.join(self.out_dir, MANIFEST_NAME),
+                                  json.dumps(manifest, ensure_ascii=False).encode('utf-8'))
+        return self.stats
+
+def export_command(app):
+    @click.command('export')
+    @click.option('--out', default=None, help='输出目录 (默认 EXPORT_DIR 配置项)')
+    @click.option('--full', is_flag=True, help='忽略上次的导出结果，全部重新生成')
+    def export(out, full):
+        """把整个网站导出成静态文件 (可以只用 nginx 提供服务)"""
+        out = out or app.config.get('EXPORT_DIR') or os.path.join(app.root_path, 'site')
+        click.echo(f"🚀 正在导出静态站点到 {out} ...")
+        stats = SiteExporter(app, out, full=full).run()
+        click.echo(f"✅ 渲染 {stats['rendered']} 页，跳过未变化的 {stats['skipped']} 页，"
+                   f"写入 {stats['written']} 个文件，删除 {stats['removed']} 个，失败 {stats['failed']} 页")
+    return export
@@ -0,0 +1,79 @@
+"""
+gunicorn 推荐配置 (gunicorn 会自动读取当前目录下的 gunicorn.conf.py)
+
+    gunicorn                      # 默认：uvicorn worker + asgi.py 的线程池
+    WORKER=gthread gunicorn       # 不装 uvicorn 时：gthread worker
+
+- 默认用 ASGI (uvicorn worker)：事件循环负责收发，Flask 视图在线程池里跑。
+  压测 (benchmarks/bench_routes.py 的 mixed_io 场景) 里，慢速客户端下载大扫描图的同时，
+  文章页的 p50 在 sync / gthread worker 下是 500 ms 以上，在 ASGI 下是 15 ms 左右
+- worker 数默认等于 CPU 核数：检索、模板渲染都要拿 GIL，多进程才能用满多核
+- 每个 worker 默认 8 个线程：慢请求 (大文件夹列表、长检索、大文件下载) 只占一个线程；
+  数据库连接池大小跟线程数一致 (DB_POOL_SIZE，见 db_config.py)
+- preload_app：先在主进程里加载好应用 (模板、简繁转换表 ...) 再 fork，子进程共用这部分内存；
+  父进程里的数据库连接不会带到子进程 (db_config.py 里处理)
+- 模板预热 (TEMPLATE_WARMUP)：主进程里编译好所有模板、渲染好静态页面，新 worker 的第一个请求不用再编译
+  map.html 这样的大模板；编译结果还会存进字节码缓存，下次启动更快 (见 template_cache.py)
+- 放在 nginx 后面时设置 FLASK_FILE_OFFLOAD=x-accel：PDF、扫描图、音频由 nginx 直接发送，
+  不再占用 worker 线程 (见 large_files.py)
+- 设置 FLASK_METRICS_DIR 时 (多个 worker 合计 /metrics，见 instrumentation.py)：启动时清空这个目录，
+  worker 退出前写下最新数据，退出后主进程把它并进 retired.json、删掉它自己的文件
+都可以用环境变量覆盖：BIND / WEB_WORKERS / WEB_THREADS / WORKER
+"""
+import json
+import multiprocessing
+import os
+
+bind = os.environ.get('BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('WEB_WORKERS', multiprocessing.cpu_count()))
+threads = int(os.environ.get('WEB_THREADS', 8))
+
+if os.environ.get('WORKER', 'asgi') == 'asgi':
+    worker_class = 'uvicorn_worker.UvicornWorker'
+    wsgi_app = 'asgi:application'
+    os.environ.setdefault('ASGI_THREADS', str(threads))
+else:
+    worker_class = 'gthread'
+    wsgi_app = 'app:app'
+
+os.environ.setdefault('DB_POOL_SIZE', str(threads))
+os.environ.setdefault('FLASK_TEMPLATE_WARMUP', 'true')
+preload_app = True
+
+timeout = 60
+graceful_timeout = 30
+keepalive = 5
+# 定期重启 worker，防止内存慢慢涨上去
+max_requests = 5000
+max_requests_jitter = 500
+
+# ============================================
+# /metrics 的共享目录 (FLASK_METRICS_DIR)
+# ============================================
+
+def _metrics_dir():
+    # 和 app.config.from_prefixed_env() 一样：能按 JSON 解析就解析，否则当作字符串
+    value = os.environ.get('FLASK_METRICS_DIR')
+    try:
+        value = json.loads(value) if value else None
+    except ValueError:
+        pass
+    return value or None
+
+def on_starting(server):
+    directory = _metrics_dir()
+    if directory:
+        import instrumentation
+        instrumentation.clear_metrics_dir(directory)
+
+def worker_exit(server, worker):
+    # 在 worker 进程里：把上次定期写入之后的数据也写下来
+    if _metrics_dir():
+        from app import instruments
+        instruments.flush()
+
+def child_exit(server, worker):
+    directory = _metrics_dir()
+    if directory:
+        import instrumentation
+        instrumentation.retire_worker(directory, worker.pid)
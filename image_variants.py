@@ -0,0 +1,118 @@
+"""
+图片衍生版本 (WebP / AVIF + 多个宽度的缩略图)
+
+compress_images.py 把 static/ 下的原图转成几个宽度的 WebP / AVIF，存在 static/variants/，
+并写一份清单 manifest.json：{原图相对路径: {大小, 修改时间, 内容哈希, 宽高, 各格式的版本}}。
+原图本身不再被覆盖。
+
+网站这边：
+- picture()：模板里用它代替 <img>，输出 <picture>，浏览器自己挑 AVIF / WebP 和合适的宽度；
+  清单里没有的图片原样输出 <img>
+- best_variant()：取不小于指定宽度的最小版本的地址 (没有就返回原图地址)
+清单文件按 mtime 重新加载，重新跑 compress_images.py 后不用重启网站。
+"""
+import json
+import os
+import tempfile
+import threading
+
+from flask import url_for
+from markupsafe import Markup, escape
+
+# 衍生文件都放在 static/ 下的这个文件夹里 (可以直接当静态文件访问)
+VARIANTS_DIR = 'variants'
+MANIFEST_NAME = 'manifest.json'
+
+# 缩略图宽度 (像素)；比原图宽的档位不生成，另外总会生成一张不超过 MAX_WIDTH 的“全尺寸”版本
+WIDTHS = (320, 640, 1024)
+MAX_WIDTH = 1600
+
+# 输出格式，按优先级排列 (浏览器从上往下挑第一个支持的)
+FORMATS = ('avif', 'webp')
+MIME_TYPES = {'avif': 'image/avif', 'webp': 'image/webp'}
+
+def manifest_path(static_folder):
+    return os.path.join(static_folder, VARIANTS_DIR, MANIFEST_NAME)
+
+def load_manifest(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_manifest(path, manifest):
+    """原子写入 (先写临时文件再替换)，中途被打断也不会留下写了一半的清单"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # 临时文件名每次不同：两个 compress_images.py 同时运行也不会互相覆盖写了一半的文件
+    with tempfile.NamedTemporaryFile('w', encoding='utf-8', dir=os.path.dirname(path),
+                                     prefix=os.path.basename(path) + '.', suffix='.tmp', delete=False) as f:
+        tmp = f.name
+        try:
+            json.dump(manifest, f, ensure_ascii=False, separators=(',', ':'))
+        except BaseException:
+            f.close()
+            os.remove(tmp)
+            raise
+    os.chmod(tmp, 0o644) # NamedTemporaryFile 建的是 0600，换上去之前改成普通文件的权限
+    os.replace(tmp, path)
+
+class ImageVariants:
+    """网站端：读取清单，给模板提供 picture() / best_variant()"""
+
+    def __init__(self, app=None):
+        self.path = None
+        self._mtime = None
+        self._manifest = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.path = manifest_path(app.static_folder)
+        app.add_template_global(self.picture, 'picture')
+        app.add_template_global(self.best_variant, 'best_variant')
+
+    def manifest(self):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except (OSError, TypeError):
+            return {}
+        if mtime != self._mtime:
+            with self._lock:
+                if mtime != self._mtime:
+                    self._manifest = load_manifest(self.path)
+                    self._mtime = mtime
+        return self._manifest
+
+    def get(self, filename):
+        """filename 是相对 static/ 的路径，例如 works/yingzi/xx/1.jpg"""
+        return self.manifest().get(filename.replace('\\', '/'))
+
+    def srcset(self, entry, fmt):
+        return ', '.join(f"{url_for('static', filename=path)} {w}w" for w, path in entry['variants'].get(fmt, ()))
+
+    def best_variant(self, filename, width=None, fmt='webp'):
+        """不小于 width 的最小版本 (width 为空时取最大的)；没有衍生版本时返回原图地址"""
+        entry = self.get(filename)
+        versions = entry['variants'].get(fmt) if entry else None
+        if not versions:
+            return url_for('static', filename=filename)
+        for w, path in versions:
+            if width is not None and w >= width:
+                return url_for('static', filename=path)
+        return url_for('static', filename=versions[-1][1])
+
+    def picture(self, filename, alt='', sizes='100vw', src=None, **attrs):
+        """
+        功能：输出 <picture>，里面按 FORMATS 的顺序给出各格式的 srcset，
+        最后的 <img> 指向 src (默认原图，老浏览器用)。attrs 原样加在 <img> 上 (例如 style、loading)。
+        """
+        img_attrs = ''.join(f' {name}="{escape(value)}"' for name, value in attrs.items())
+        img = Markup('<img src="%s" alt="%s"%s>') % (src or url_for('static', filename=filename), alt, Markup(img_attrs))
+        entry = self.get(filename)
+        if not entry:
+            return img
+        sources = [Markup('<source type="%s" srcset="%s" sizes="%s">') % (MIME_TYPES[fmt], self.srcset(entry, fmt), sizes)
+                   for fmt in FORMATS if entry['variants'].get(fmt)]
+        return Markup('<picture>') + Markup('').join(sources) + img + Markup('</picture>')
@@ -1,7 +1,16 @@
 import pandas as pd
-from app import db, Work, app
+from cache import bump_data_version
+from app import db, Work, WorkImage, app
+import aggregates
+import db_config
+import search_index
+import trends
+import argparse
+import hashlib
+import media_index
 import os
-import glob
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import insert, inspect, text, update
 
 # 配置
 excel_filename = '作品统计.xlsx'
@@ -10,131 +19,281 @@ excel_filename = '作品统计.xlsx'
 creations_root = os.path.join(app.root_path, 'static', 'works')
 
 author_mapping = {
-    '莹姿': 'yingzi', '冯伊湄': 'fengyimei', 
+    '莹姿': 'yingzi', '冯伊湄': 'fengyimei',
     '王映霞': 'wangyingxia', '王莹': 'wangying', '沈兹九': 'shenzijiu'
 }
-def get_folder_content(author_en, title):
+
+# 图片后缀 (统一按小写比较，兼容 .JPG 等大写后缀)
+IMAGE_EXTS = media_index.IMAGE_EXTS
+
+# 读文件夹 / txt 的线程数 (主要是磁盘 IO，线程就够了)
+IO_WORKERS = 8
+
+# 每批写入数据库的条数
+BATCH_SIZE = 200
+
+def scan_folder(author_en, title):
+    """
+    功能：用一次 os.scandir 找出作品文件夹里的 txt 和图片。
+    返回 (txt 路径或 None, 图片相对路径列表, 文件夹指纹)；
+    指纹由相关文件的 名字/大小/修改时间 组成，文件没变指纹就不变，不用读 txt 也能判断。
+    """
     work_dir = os.path.join(creations_root, author_en, title)
-    content_text = ""
-    image_rel_path = None
-
-    if os.path.exists(work_dir):
-        # 1. 找 txt
-        # 1. 找 txt (兼容大写 .TXT)
-        txt_files = glob.glob(os.path.join(work_dir, '*.txt'))
-        txt_files.extend(glob.glob(os.path.join(work_dir, '*.TXT')))
-        if txt_files:
-            try:
-                with open(txt_files[0], 'r', encoding='utf-8') as f:
-                    raw_text = f.read()
-                    # 【关键修改在此】
-                    # 1. replace(' ', '') 删除普通空格
-                    # 2. replace('\u3000', '') 删除中文全角空格
-                    # 3. replace('\t', '') 删除制表符
-                    # 注意：我们没有删 \n (换行符)，所以你的回车会被保留！
-                    content_text = raw_text.replace(' ', '').replace('\u3000', '').replace('\t', '')
-            except Exception as e:
-                print(f"  ❌ 读取txt失败 ({title}): {e}")
-
-        # 2. 找图片 (代码不变)
-        # 2. 找图片 (增加大写后缀，防止 Linux 服务器找不到)
-        img_patterns = [
-            '*.jpg', '*.png', '*.jpeg', '*.webp',
-            '*.JPG', '*.PNG', '*.JPEG', '*.WEBP'
-        ]
-        found_images = []
-        for pattern in img_patterns:
-            found_images.extend(glob.glob(os.path.join(work_dir, pattern)))
-        
-        if found_images:
-            # 【新增这一行：去重并排序，防止 Windows 重复抓取】
-            found_images = sorted(list(set(found_images)))
-            
-            # 把所有找到的图片路径，转换成相对路径
-            all_rel_paths = []
-            for img in found_images:
-                rel_path = os.path.relpath(img, app.root_path).replace('\\', '/')
-                all_rel_paths.append(rel_path)
-            
-            # 用逗号把所有路径拼成一长串，存进数据库 (例如: "图1.jpg,图2.jpg")
-            image_rel_path = ",".join(all_rel_paths)
-            
-    return content_text, image_rel_path
-
-def init():
+    txt_files = []
+    found_images = []
+    fingerprint = []
+
+    try:
+        with os.scandir(work_dir) as entries:
+            for entry in entries:
+                if entry.name.startswith('.') or not entry.is_file():
+                    continue
+                ext = os.path.splitext(entry.name)[1].lower()
+                if ext == '.txt':
+                    txt_files.append(entry.path)
+                elif ext in IMAGE_EXTS:
+                    found_images.append(entry.path)
+                else:
+                    continue
+                st = entry.stat()
+                fingerprint.append(f'{entry.name}:{st.st_size}:{st.st_mtime_ns}')
+    except OSError:
+        return None, [], ''
+
+    # 排序，保证每次扫描顺序一致
+    txt_files.sort()
+    found_images.sort()
+    fingerprint.sort()
+
+    # 把所有找到的图片路径，转换成相对 static/ 的路径
+    all_rel_paths = [os.path.relpath(img, app.static_folder).replace('\\', '/') for img in found_images]
+    return (txt_files[0] if txt_files else None), all_rel_paths, '|'.join(fingerprint)
+
+def read_text(txt_path, title):
+    if not txt_path:
+        return ""
+    try:
+        with open(txt_path, 'r', encoding='utf-8') as f:
+            raw_text = f.read()
+    except Exception as e:
+        print(f"  ❌ 读取txt失败 ({title}): {e}")
+        return ""
+    # 【关键修改在此】
+    # 1. replace(' ', '') 删除普通空格
+    # 2. replace('\u3000', '') 删除中文全角空格
+    # 3. replace('\t', '') 删除制表符
+    # 注意：我们没有删 \n (换行符)，所以你的回车会被保留！
+    return raw_text.replace(' ', '').replace('\u3000', '').replace('\t', '')
+
+def read_excel_rows():
+    """
+    功能：读出 Excel 里所有作者的作品行。
+    返回 [(键, 字段字典)]，键是 (作者, 标题, 同名序号)，同一作者下重名的作品按出现顺序编号。
+    """
+    xls = pd.ExcelFile(excel_filename)
+    rows = []
+    for sheet_name in xls.sheet_names:
+        author_id = None
+        for cn, en in author_mapping.items():
+            if cn in sheet_name:
+                author_id = en
+                break
+
+        if not author_id:
+            continue
+
+        df = pd.read_excel(xls, sheet_name=sheet_name)
+        seen = {}
+        for row in df.to_dict('records'):
+            # 去除标题前后的空格，保证干净
+            title = str(row.get('标题', '无标题')).strip()
+            try: year = int(float(row.get('年份', 0)))
+            except: year = 0
+
+            n = seen.get(title, 0)
+            seen[title] = n + 1
+            rows.append(((author_id, title, n), {
+                'title': title,
+                'author': author_id,
+                'year': year,
+                'date_display': str(row.get('时间', '')).strip(),
+                'publication': str(row.get('发行', '未知')).strip(),
+                'genre': str(row.get('文类', '未分类')).strip(),
+                'source': str(row.get('来源', '')).strip(),
+            }))
+    return rows
+
+def row_hash(fields, fingerprint):
+    data = repr(sorted(fields.items())) + '\n' + fingerprint
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+def ensure_schema():
+    """旧数据库里没有 import_hash (或 image_path) 列时补上 (不用删表重建)"""
+    db.create_all()
+    columns = {c['name'] for c in inspect(db.engine).get_columns('work')}
+    with db.engine.begin() as conn:
+        if 'import_hash' not in columns:
+            conn.execute(text('ALTER TABLE work ADD COLUMN import_hash VARCHAR(40)'))
+        if 'image_path' not in columns:
+            conn.execute(text('ALTER TABLE work ADD COLUMN image_path VARCHAR(300)'))
+
+def existing_works():
+    """数据库里已有的作品：{(作者, 标题, 同名序号): (id, import_hash)}"""
+    existing = {}
+    seen = {}
+    for work_id, author, title, h in db.session.query(Work.id, Work.author, Work.title, Work.import_hash).order_by(Work.id):
+        n = seen.get((author, title), 0)
+        seen[(author, title)] = n + 1
+        existing[(author, title, n)] = (work_id, h)
+    return existing
+
+def describe_image(rel_path):
+    """配图的尺寸 / 大小 / 内容哈希；读不了时只记路径"""
+    try:
+        return media_index.describe(os.path.join(app.static_folder, rel_path))
+    except OSError as e:
+        print(f"  ❌ 读取图片失败 ({rel_path}): {e}")
+        return {'bytes': None, 'hash': None, 'width': None, 'height': None}
+
+def init(full=False):
     print(f"🚀 正在扫描数据库... (目标文件夹: {creations_root})")
-    
+
     if not os.path.exists(creations_root):
         print(f"❌ 错误：找不到根目录 {creations_root}")
         return
 
     with app.app_context():
-        # 重置数据库
-        Work.__table__.drop(db.engine, checkfirst=True)
-        db.create_all()
-
         if not os.path.exists(excel_filename):
             print(f"❌ 找不到 {excel_filename}")
             return
 
-        xls = pd.ExcelFile(excel_filename)
-        success_count = 0
-        fail_count = 0
-        
-        for sheet_name in xls.sheet_names:
-            author_id = None
-            for cn, en in author_mapping.items():
-                if cn in sheet_name:
-                    author_id = en
-                    break
-            
-            if not author_id:
-                continue
-
-            print(f"\n📖 正在处理作者: {sheet_name} ({author_id})")
-            df = pd.read_excel(xls, sheet_name=sheet_name)
-            
-            for index, row in df.iterrows():
-                # 去除标题前后的空格，保证干净
-                title = str(row.get('标题', '无标题')).strip()
-                
-                # 去文件夹找
-                folder_text, folder_img = get_folder_content(author_id, title)
-                
-                # --- 核心修改：增加失败提示 ---
-                if not folder_text and not folder_img:
+        if full:
+            # 重置数据库 (表结构有变化时用 --full)
+            print("   🔨 重建数据库表...")
+            WorkImage.__table__.drop(db.engine, checkfirst=True)
+            Work.__table__.drop(db.engine, checkfirst=True)
+        ensure_schema()
+
+        rows = read_excel_rows()
+        print(f"📖 表格中共 {len(rows)} 篇作品")
+
+        with ThreadPoolExecutor(max_workers=IO_WORKERS) as pool:
+            # 1. 并行扫描所有作品文件夹 (每个文件夹一次 scandir)
+            scans = list(pool.map(lambda r: scan_folder(r[1]['author'], r[1]['title']), rows))
+
+            # 2. 和数据库比对：字段 + 文件夹指纹的哈希没变的就跳过
+            existing = existing_works()
+            # 已经有配图记录的作品 (旧数据库升级后第一次导入时为空，没变化的作品也要补上配图记录)
+            indexed = {work_id for work_id, in db.session.query(WorkImage.work_id).distinct()}
+            changed = []
+            backfill = []
+            success_count = 0
+            fail_count = 0
+            for (key, fields), (txt_path, images, fingerprint) in zip(rows, scans):
+                if not txt_path and not images:
                     # 如果文和图都没找到，打印出来！
-                    expected_path = os.path.join(creations_root, author_id, title)
-                    print(f"   ⚠️ 关联失败: 【{title}】")
-                    # print(f"      -> 程序试图寻找: {expected_path}") 
+                    print(f"   ⚠️ 关联失败: 【{fields['title']}】")
                     fail_count += 1
                 else:
-                    # 成功了
-                    status = []
-                    if folder_text: status.append("文")
-                    if folder_img: status.append("图")
-                    print(f"   ✅ 成功: {title} ({','.join(status)})")
                     success_count += 1
+                h = row_hash(fields, fingerprint)
+                old = existing.pop(key, None)
+                if old is None or old[1] != h:
+                    changed.append((old[0] if old else None, fields, txt_path, images, h))
+                elif images and old[0] not in indexed:
+                    backfill.append((old[0], images))
+
+            # 3. 只读取有变化的作品的 txt (并行)
+            texts = list(pool.map(lambda c: read_text(c[2], c[1]['title']), changed))
+
+            # 配图的宽高、大小、内容哈希 (同样只算有变化的作品)
+            image_paths = sorted({p for c in changed for p in c[3]} | {p for _, images in backfill for p in images})
+            described = dict(zip(image_paths, pool.map(describe_image, image_paths)))
+
+        removed_ids = [work_id for work_id, _ in existing.values()]
+        print(f"\n🔄 新增/修改 {len(changed)} 篇，删除 {len(removed_ids)} 篇，"
+              f"未变化 {len(rows) - len(changed)} 篇")
+
+        # 4. 在一个事务里批量写入；提交之前网站读到的一直是旧数据
+        inserts = []
+        updates = []
+        insert_images = []
+        image_rows = []
+        for (work_id, fields, _, images, h), content in zip(changed, texts):
+            # image_path 是旧格式 (static/...，逗号分隔)，只给还没有 work_image 表的旧代码 / 旧数据库用
+            mapping = dict(fields, content=content, image_path=','.join('static/' + p for p in images) or None,
+                           import_hash=h)
+            if work_id is None:
+                inserts.append(mapping)
+                insert_images.append(images)
+            else:
+                updates.append(dict(mapping, id=work_id))
+                image_rows += [dict(described[p], work_id=work_id, ordinal=i, path=p) for i, p in enumerate(images)]
+        for work_id, images in backfill:
+            image_rows += [dict(described[p], work_id=work_id, ordinal=i, path=p) for i, p in enumerate(images)]
+
+        # 删掉的、有变化的作品的旧配图记录
+        stale_ids = removed_ids + [m['id'] for m in updates]
+        for i in range(0, len(stale_ids), BATCH_SIZE):
+            db.session.query(WorkImage).filter(WorkImage.work_id.in_(stale_ids[i:i + BATCH_SIZE])).delete(synchronize_session=False)
+        if removed_ids:
+            db.session.query(Work).filter(Work.id.in_(removed_ids)).delete(synchronize_session=False)
+        for i in range(0, len(updates), BATCH_SIZE):
+            db.session.execute(update(Work), updates[i:i + BATCH_SIZE])
+        new_works = []
+        for i in range(0, len(inserts), BATCH_SIZE):
+            batch = [Work(**m) for m in inserts[i:i + BATCH_SIZE]]
+            db.session.add_all(batch)
+            db.session.flush() # 批量 INSERT，拿到新作品的 id
+            new_works.extend(batch)
+
+        # 配图：一张图一行 (第几张、路径、宽高、大小、哈希)
+        for work, images in zip(new_works, insert_images):
+            image_rows += [dict(described[p], work_id=work.id, ordinal=i, path=p) for i, p in enumerate(images)]
+        for i in range(0, len(image_rows), BATCH_SIZE):
+            db.session.execute(insert(WorkImage), image_rows[i:i + BATCH_SIZE])
+        if image_rows:
+            print(f"\n🖼️ 配图记录: {len(image_rows)} 张")
+
+        # 5. 更新全文检索索引：没有索引 (或 --full) 时整个重建，否则只改有变化的作品
+        if full or not search_index.has_index(db.session):
+            rows = db.session.query(Work.id, Work.title, Work.content).all()
+            indexed = search_index.rebuild(db.session, rows)
+            print(f"\n🔎 全文索引已重建: {indexed} 篇")
+        else:
+            touched = [(m['id'], m['title'], m['content']) for m in updates]
+            touched += [(w.id, w.title, w.content) for w in new_works]
+            search_index.update(db.session, touched, removed_ids)
+            print(f"\n🔎 全文索引已更新: {len(touched)} 篇")
+
+        # 关键词趋势的计数矩阵 (见 trends.py)：有变化 (或还没有) 时整个重建
+        # 先写到临时文件，事务提交之后才换上去 (提交失败时网站用的还是和数据库一致的旧矩阵)
+        trends_path = app.config['TRENDS_FILE'] or os.path.join(app.instance_path, trends.FILE_NAME)
+        trends_tmp = None
+        if full or changed or removed_ids or not os.path.exists(trends_path):
+            trends_tmp, works, grams = trends.rebuild(db.session, trends_path)
+
+        try:
+            # 6. 统计表 (作家 / 文类 / 年份 的篇数) 和数据在同一个事务里更新
+            aggregates.refresh(db.session)
+
+            db.session.commit()
+        except BaseException:
+            if trends_tmp:
+                trends.discard(trends_tmp)
+            raise
+
+        if trends_tmp:
+            trends.publish(trends_tmp, trends_path)
+            print(f"📈 关键词趋势矩阵已重建: {works} 篇 × {grams} 个片段")
+
+        # 7. 补建索引 (旧数据库)、更新统计信息，WAL 写回数据库文件
+        db_config.optimize(db)
+
+        # 数据变了，让网站的页面缓存全部作废
+        if changed or removed_ids or backfill:
+            bump_data_version(app.instance_path)
 
-                # 存入数据库
-                final_content = folder_text if folder_text else ""
-                try: year = int(float(row.get('年份', 0)))
-                except: year = 0
-
-                work = Work(
-                    title=title,
-                    author=author_id,
-                    year=year,
-                    date_display=str(row.get('时间', '')).strip(),
-                    publication=str(row.get('发行', '未知')).strip(),
-                    genre=str(row.get('文类', '未分类')).strip(),
-                    source=str(row.get('来源', '')).strip(),
-                    content=final_content,
-                    image_path=folder_img
-                )
-                db.session.add(work)
-
-        db.session.commit()
         print("\n" + "="*40)
         print(f"📊 统计报告：")
         print(f"✅ 成功关联: {success_count} 篇")
@@ -142,4 +301,6 @@ def init():
         print("="*40)
 
 if __name__ == '__main__':
-    init()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='从 Excel 和 static/works 导入作品')
+    parser.add_argument('--full', action='store_true', help='删表重建 (默认只更新有变化的作品)')
+    init(full=parser.parse_args().full)
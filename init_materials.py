@@ -1,6 +1,13 @@
 import pandas as pd
 import os
-from app import db, Material, app
+import aggregates
+import db_config
+import media_index
+import site_search
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import insert
+from cache import bump_data_version
+from app import db, Material, MaterialDoc, MaterialFile, app, natural_sort_key
 
 excel_filename = '史料统计.xlsx'
 
@@ -13,15 +20,70 @@ author_mapping = {
     '沈兹九': 'shenzijiu'
 }
 
+# 算文件哈希的线程数 (主要是磁盘 IO)
+IO_WORKERS = 8
+BATCH_SIZE = 500
+
+def index_files(materials):
+    """
+    功能：扫描每条史料的文件夹 (包括子文件夹)，记下每个文件的 类型、宽高、大小、内容哈希。
+    返回写入的行 (dict)。
+    """
+    jobs = []
+    for m in materials:
+        folder = os.path.join(app.static_folder, 'materials', m.author, m.folder_name)
+        for sub, name, ordinal, path in media_index.scan_material_folder(folder, natural_sort_key):
+            rel = os.path.relpath(path, app.static_folder).replace('\\', '/')
+            jobs.append(dict(material_id=m.id, dir=sub, name=name, ordinal=ordinal,
+                             kind=media_index.file_kind(name), path=rel, full_path=path))
+
+    def describe(job):
+        try:
+            info = media_index.describe(job.pop('full_path'))
+        except OSError as e:
+            print(f"  ❌ 读取文件失败 ({job['path']}): {e}")
+            info = {'bytes': None, 'hash': None, 'width': None, 'height': None}
+        return dict(job, **info)
+
+    with ThreadPoolExecutor(max_workers=IO_WORKERS) as pool:
+        rows = list(pool.map(describe, jobs))
+    for i in range(0, len(rows), BATCH_SIZE):
+        db.session.execute(insert(MaterialFile), rows[i:i + BATCH_SIZE])
+    return rows
+
+def index_docs(materials, files):
+    """
+    功能：全站检索用的史料文档 (见 site_search.py)：每条史料一条 (文件夹名 + 刊物、出版时间、来源)，
+    每个 txt / pdf 文件一条 (抽出来的文字)；然后重建 material_fts。返回 (文档数, 抽到文字的文件数)。
+    """
+    by_id = {m.id: m for m in materials}
+    rows = [dict(material_id=m.id, kind='material', dir='', name=None, path=None, hash=None,
+                 title=m.folder_name, author=m.author, publication=m.publication,
+                 content=site_search.material_record_text(m))
+            for m in materials]
+    jobs = [f for f in files if f['kind'] in site_search.TEXT_KINDS]
+
+    def extract(f):
+        return site_search.extract_text(os.path.join(app.static_folder, f['path']), f['kind'])
+
+    with ThreadPoolExecutor(max_workers=IO_WORKERS) as pool:
+        texts = list(pool.map(extract, jobs))
+    for f, content in zip(jobs, texts):
+        m = by_id[f['material_id']]
+        rows.append(dict(material_id=m.id, kind=f['kind'], dir=f['dir'], name=f['name'], path=f['path'],
+                         hash=f['hash'], title=f"{m.folder_name} · {f['name']}", author=m.author,
+                         publication=m.publication, content=content))
+    for i in range(0, len(rows), BATCH_SIZE):
+        db.session.execute(insert(MaterialDoc), rows[i:i + BATCH_SIZE])
+
+    docs = db.session.query(MaterialDoc.id, MaterialDoc.title, MaterialDoc.content)
+    site_search.rebuild_index(db.session, docs.all())
+    return len(rows), sum(1 for content in texts if content)
+
 def init():
     print("🚀 开始导入史料目录 (按表格物理顺序)...")
     with app.app_context():
-        # 1. 强制重建表结构 (为了加入 publish_time 字段)
-        print("   🔨 重建数据库表...")
-        Material.__table__.drop(db.engine, checkfirst=True)
-        db.create_all()
-        
-        # 2. 检查文件
+        # 1. 检查文件 (还没动数据库)
         if not os.path.exists(excel_filename):
             print(f"❌ 找不到 {excel_filename}")
             return
@@ -32,7 +94,19 @@ def init():
             print(f"❌ 读取 Excel 失败: {e}")
             return
 
+        # 2. 重建表结构 (为了加入 publish_time 字段)：删表、建表、写入、建索引都在同一个事务里，
+        #    提交之前网站读到的一直是旧表和旧数据，中途出错整个回滚
+        #    (SQLite 的建表 / 删表可以回滚；但 Python 的 sqlite3 不会在 DDL 前自动开事务，所以显式 BEGIN)
+        print("   🔨 重建数据库表...")
+        conn = db.session.connection()
+        conn.exec_driver_sql('BEGIN')
+        MaterialDoc.__table__.drop(conn, checkfirst=True)
+        MaterialFile.__table__.drop(conn, checkfirst=True)
+        Material.__table__.drop(conn, checkfirst=True)
+        db.metadata.create_all(conn)
+
         total = 0
+        added = []
 
         for sheet_name in xls.sheet_names:
             author_id = None
@@ -84,9 +158,28 @@ def init():
                     sort_index=sort_idx   # 存入行号
                 )
                 db.session.add(m)
+                added.append(m)
                 total += 1
         
+        # 统计表 (作家 / 刊物 的条数) 和数据在同一个事务里更新
+        db.session.flush()
+        # 文件夹里的文件 (尺寸、大小、内容哈希)，史料详情页直接用
+        files = index_files(added)
+        print(f"🖼️ 史料文件记录: {len(files)} 个")
+        # 全站检索的索引 (史料这边)：导入时建好，查询时不用再扫文件夹
+        if site_search.PdfReader is None:
+            print("   ⚠️ 没有安装 pypdf，PDF 只能按文件名检索")
+        docs, with_text = index_docs(added, files)
+        print(f"🔎 全站检索文档: {docs} 条 (其中 {with_text} 个文件抽到了文字)")
+        aggregates.refresh(db.session)
+
         db.session.commit()
+
+        # 更新索引的统计信息，WAL 写回数据库文件
+        db_config.optimize(db)
+
+        # 数据变了，让网站的页面缓存全部作废
+        bump_data_version(app.instance_path)
         print(f"🎉 导入完成！共 {total} 条。")
 
 if __name__ == '__main__':
@@ -0,0 +1,494 @@
+"""
+请求计时 / 监控
+
+一次请求慢了，要能看出时间花在哪：SQLite 查询、检索、重新计数、简繁转换，还是 Jinja 里每一行的过滤器。
+
+- 分段计时：数据库 (每条 SQL 的耗时、条数和读出的行数)、模板渲染、模板里的过滤器 / 函数 (次数 + 耗时)，
+  以及代码里用 stage('名称') 标出来的阶段 (检索、排序、摘录、筛选项计数、简繁转换 ...)
+- 每个响应带 Server-Timing 头，浏览器开发者工具的 Network 面板里直接能看到
+- /metrics：Prometheus 文本格式 (请求数、耗时分布、各阶段累计耗时 ...)；
+  设置 METRICS_DIR 后各 gunicorn worker 定期把自己的数据写到这个目录，任何一个 worker 都能返回合计。
+  gunicorn 启动时清空这个目录，worker 退出后它的数据并进 retired.json (见 gunicorn.conf.py)，文件不会越积越多
+- /metrics 只对 METRICS_ALLOW 里的地址开放 (默认只有本机)，其他地址返回 404；
+  经过反向代理时 X-Forwarded-For 里的地址也要在名单里，外面的请求不会因为代理在本机就被放进来
+- 慢请求采样 (默认关闭)：PROFILE_SLOW_MS 设成毫秒数后，后台线程每隔 PROFILE_INTERVAL_MS 采一次
+  正在处理请求的线程的调用栈，超过阈值的请求把采样结果存成折叠栈格式 (flamegraph.pl / speedscope 可以直接打开)
+
+平时的开销只是每段几次 perf_counter()，可以一直开着。
+"""
+import contextvars
+import glob
+import inspect
+import ipaddress
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import Response, abort, before_render_template, g, request, template_rendered
+from jinja2.defaults import DEFAULT_FILTERS, DEFAULT_NAMESPACE
+from sqlalchemy import event
+
+# 请求耗时分布的分桶 (秒)
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# 各 worker 写共享目录的最短间隔 (秒)
+FLUSH_INTERVAL = 10
+# 采样时每个调用栈最多记多少层
+MAX_STACK_DEPTH = 64
+# 已经退出的 worker 的累计数据 (METRICS_DIR 下)
+RETIRED_FILE = 'retired.json'
+
+_current = contextvars.ContextVar('request_timings', default=None)
+
+# ============================================
+# 1. 单个请求的计时
+# ============================================
+
+class Timings:
+    """一个请求里各阶段的累计耗时和次数"""
+    __slots__ = ('start', 'stages', 'rows', 'calls', 'samples', 'template_starts')
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stages = {}  # 阶段 -> [秒, 次数]
+        self.rows = 0     # 数据库读出的行数
+        self.calls = {}   # 模板过滤器 / 函数 -> [秒, 次数]
+        self.samples = None
+        self.template_starts = []
+
+    def add(self, name, seconds, table=None):
+        table = self.stages if table is None else table
+        entry = table.get(name)
+        if entry is None:
+            table[name] = [seconds, 1]
+        else:
+            entry[0] += seconds
+            entry[1] += 1
+
+@contextmanager
+def stage(name):
+    """把一段代码的耗时记到当前请求的 name 阶段 (不在请求里时什么也不做)"""
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, time.perf_counter() - start)
+
+def _timed_template_function(name, func):
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        timings = _current.get()
+        if timings is None:
+            return func(*args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            timings.add(name, time.perf_counter() - start, timings.calls)
+    return wrapper
+
+# ============================================
+# 2. 进程内的累计数据 (/metrics)
+# ============================================
+
+class Registry:
+    """按 endpoint 累计的计数器和耗时分布；snapshot() / merge() 用于多个 worker 合计"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = {}      # (endpoint, method, status) -> 次数
+        self.durations = {}     # endpoint -> [各分桶次数..., 总次数, 总秒数]
+        self.stages = {}        # (endpoint, 阶段) -> [秒, 次数]
+        self.rows = {}          # endpoint -> 行数
+        self.calls = {}         # 模板过滤器 / 函数 -> [秒, 次数]
+        self.slow = {}          # endpoint -> 慢请求次数
+
+    def record(self, endpoint, method, status, elapsed, timings, slow):
+        with self._lock:
+            key = (endpoint, method, str(status))
+            self.requests[key] = self.requests.get(key, 0) + 1
+            hist = self.durations.get(endpoint)
+            if hist is None:
+                hist = self.durations[endpoint] = [0] * len(BUCKETS) + [0, 0.0]
+            for i, bound in enumerate(BUCKETS):
+                if elapsed <= bound:
+                    hist[i] += 1
+            hist[-2] += 1
+            hist[-1] += elapsed
+            for name, (seconds, count) in timings.stages.items():
+                entry = self.stages.setdefault((endpoint, name), [0.0, 0])
+                entry[0] += seconds
+                entry[1] += count
+            self.rows[endpoint] = self.rows.get(endpoint, 0) + timings.rows
+            for name, (seconds, count) in timings.calls.items():
+                entry = self.calls.setdefault(name, [0.0, 0])
+                entry[0] += seconds
+                entry[1] += count
+            if slow:
+                self.slow[endpoint] = self.slow.get(endpoint, 0) + 1
+
+    _FIELDS = ('requests', 'durations', 'stages', 'rows', 'calls', 'slow')
+
+    def snapshot(self):
+        """JSON 可以保存的形式 (元组键拆成列表)"""
+        with self._lock:
+            return {field: [[list(k) if isinstance(k, tuple) else k, v] for k, v in getattr(self, field).items()]
+                    for field in self._FIELDS}
+
+    def merge(self, snapshot):
+        """把另一个 worker 的数据加进来 (用于汇总，在新建的 Registry 上调用)"""
+        for field in self._FIELDS:
+            table = getattr(self, field)
+            for key, value in snapshot.get(field, ()):
+                key = tuple(key) if isinstance(key, list) else key
+                old = table.get(key)
+                if old is None:
+                    table[key] = list(value) if isinstance(value, list) else value
+                elif isinstance(value, list):
+                    table[key] = [a + b for a, b in zip(old, value)]
+                else:
+                    table[key] = old + value
+
+    def render(self):
+        """Prometheus 文本格式"""
+        out = []
+
+        def labels(**kw):
+            return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in kw.items()) + '}'
+
+        out.append('# TYPE app_requests_total counter')
+        for (endpoint, method, status), n in sorted(self.requests.items()):
+            out.append(f'app_requests_total{labels(endpoint=endpoint, method=method, status=status)} {n}')
+
+        out.append('# TYPE app_request_duration_seconds histogram')
+        for endpoint, hist in sorted(self.durations.items()):
+            for bound, n in zip(BUCKETS, hist):
+                out.append(f'app_request_duration_seconds_bucket{labels(endpoint=endpoint, le=str(bound))} {n}')
+            out.append(f'app_request_duration_seconds_bucket{labels(endpoint=endpoint, le="+Inf")} {hist[-2]}')
+            out.append(f'app_request_duration_seconds_count{labels(endpoint=endpoint)} {hist[-2]}')
+            out.append(f'app_request_duration_seconds_sum{labels(endpoint=endpoint)} {hist[-1]:.6f}')
+
+        out.append('# TYPE app_stage_seconds_total counter')
+        for (endpoint, name), (seconds, _) in sorted(self.stages.items()):
+            out.append(f'app_stage_seconds_total{labels(endpoint=endpoint, stage=name)} {seconds:.6f}')
+        out.append('# TYPE app_stage_calls_total counter')
+        for (endpoint, name), (_, count) in sorted(self.stages.items()):
+            out.append(f'app_stage_calls_total{labels(endpoint=endpoint, stage=name)} {count}')
+
+        out.append('# TYPE app_db_rows_total counter')
+        for endpoint, n in sorted(self.rows.items()):
+            out.append(f'app_db_rows_total{labels(endpoint=endpoint)} {n}')
+
+        out.append('# TYPE app_template_function_seconds_total counter')
+        for name, (seconds, _) in sorted(self.calls.items()):
+            out.append(f'app_template_function_seconds_total{labels(function=name)} {seconds:.6f}')
+        out.append('# TYPE app_template_function_calls_total counter')
+        for name, (_, count) in sorted(self.calls.items()):
+            out.append(f'app_template_function_calls_total{labels(function=name)} {count}')
+
+        out.append('# TYPE app_slow_requests_total counter')
+        for endpoint, n in sorted(self.slow.items()):
+            out.append(f'app_slow_requests_total{labels(endpoint=endpoint)} {n}')
+        return '\n'.join(out) + '\n'
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _read_snapshot(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def clear_metrics_dir(directory):
+    """gunicorn 主进程启动时调用：删掉上次运行留下的各 worker 数据"""
+    for path in glob.glob(os.path.join(directory, '*.json')) + glob.glob(os.path.join(directory, '*.tmp')):
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+def retire_worker(directory, pid):
+    """
+    gunicorn 主进程在 worker 退出后调用：把这个 worker 的数据并进 RETIRED_FILE，删掉它自己的文件。
+    计数器不会因为 worker 重启 (max_requests) 变小，目录里的文件数也不会一直涨。
+    """
+    path = os.path.join(directory, f'{pid}.json')
+    snapshot = _read_snapshot(path)
+    if snapshot is not None:
+        retired_path = os.path.join(directory, RETIRED_FILE)
+        total = Registry()
+        total.merge(_read_snapshot(retired_path) or {})
+        total.merge(snapshot)
+        tmp = f'{retired_path}.{os.getpid()}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(total.snapshot(), f)
+        os.replace(tmp, retired_path)
+    for leftover in [path] + glob.glob(f'{path}.*.tmp'):
+        try:
+            os.unlink(leftover)
+        except FileNotFoundError:
+            pass
+
+# ============================================
+# 3. 慢请求采样
+# ============================================
+
+class Sampler:
+    """
+    功能：后台线程定时采样正在处理请求的线程的调用栈。
+    采样结果记在各请求的 Timings.samples 里：{折叠后的调用栈: 次数}
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._active = {}  # 线程 id -> Timings
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def begin(self, timings):
+        timings.samples = {}
+        self._active[threading.get_ident()] = timings
+        # fork 之后后台线程不会跟过来，每个进程各启动一个
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._pid = os.getpid()
+                    threading.Thread(target=self._run, name='slow-request-sampler', daemon=True).start()
+
+    def end(self):
+        self._active.pop(threading.get_ident(), None)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            if not self._active:
+                continue
+            frames = sys._current_frames()
+            for ident, timings in list(self._active.items()):
+                frame = frames.get(ident)
+                if frame is not None:
+                    key = _collapse(frame)
+                    timings.samples[key] = timings.samples.get(key, 0) + 1
+
+def _collapse(frame):
+    names = []
+    while frame is not None and len(names) < MAX_STACK_DEPTH:
+        code = frame.f_code
+        names.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+# ============================================
+# 4. 挂到 Flask 上
+# ============================================
+
+class Instrumentation:
+    """
+    功能：请求计时、Server-Timing、/metrics、慢请求采样。
+    配置项：INSTRUMENTATION_ENABLED, SERVER_TIMING, METRICS_DIR (多 worker 合计用的目录，默认只看本进程),
+    METRICS_ALLOW (可以访问 /metrics 的地址 / 网段列表，空列表表示关闭),
+    PROFILE_SLOW_MS (慢请求阈值，None 表示不采样), PROFILE_INTERVAL_MS, PROFILE_DIR (默认 instance/profiles)
+    """
+
+    def __init__(self, app=None, db=None):
+        self.app = None
+        self.registry = Registry()
+        self.sampler = None
+        self._wrapped = False
+        self._last_flush = 0.0
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        self.app = app
+        config = app.config
+        config.setdefault('INSTRUMENTATION_ENABLED', True)
+        config.setdefault('SERVER_TIMING', True)
+        config.setdefault('METRICS_DIR', None)
+        config.setdefault('METRICS_ALLOW', ['127.0.0.1', '::1'])
+        config.setdefault('PROFILE_SLOW_MS', None)
+        config.setdefault('PROFILE_INTERVAL_MS', 5)
+        config.setdefault('PROFILE_DIR', None)
+        if not config['INSTRUMENTATION_ENABLED']:
+            return
+
+        self.metrics_allow = [ipaddress.ip_network(net, strict=False) for net in config['METRICS_ALLOW']]
+        if config['PROFILE_SLOW_MS'] is not None:
+            self.sampler = Sampler(config['PROFILE_INTERVAL_MS'] / 1000)
+        self.profile_dir = config['PROFILE_DIR'] or os.path.join(app.instance_path, 'profiles')
+
+        with app.app_context():
+            self._listen_db(db.engine)
+        before_render_template.connect(self._before_render, app)
+        template_rendered.connect(self._after_render, app)
+        app.before_request(self._begin)
+        app.after_request(self._finish)
+        app.teardown_request(self._teardown)
+        app.add_url_rule('/metrics', 'metrics', self.metrics_view)
+
+    # --- 数据库 ---
+
+    def _listen_db(self, engine):
+        @event.listens_for(engine, 'before_cursor_execute')
+        def before(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+        @event.listens_for(engine, 'after_cursor_execute')
+        def after(conn, cursor, statement, parameters, context, executemany):
+            start = conn.info['query_start'].pop()
+            timings = _current.get()
+            if timings is not None:
+                timings.add('db', time.perf_counter() - start)
+
+        @event.listens_for(engine, 'connect')
+        def count_rows(dbapi_conn, _):
+            # sqlite3 每读出一行调用一次 row_factory，顺便计数 (原样返回这一行)
+            if hasattr(dbapi_conn, 'row_factory'):
+                dbapi_conn.row_factory = _count_row
+
+    # --- 模板 ---
+
+    def _before_render(self, app, template, context, **extra):
+        timings = _current.get()
+        if timings is not None:
+            timings.template_starts.append(time.perf_counter())
+
+    def _after_render(self, app, template, context, **extra):
+        timings = _current.get()
+        if timings is not None and timings.template_starts:
+            timings.add('template', time.perf_counter() - timings.template_starts.pop())
+
+    def _wrap_template_functions(self):
+        """给项目自己注册的过滤器和模板函数套上计时 (Jinja 自带的不管)"""
+        env = self.app.jinja_env
+        for name, func in list(env.filters.items()):
+            if name not in DEFAULT_FILTERS:
+                env.filters[name] = _timed_template_function(f'filter:{name}', func)
+        for name, func in list(env.globals.items()):
+            if name not in DEFAULT_NAMESPACE and (inspect.isfunction(func) or inspect.ismethod(func)):
+                env.globals[name] = _timed_template_function(name, func)
+        self._wrapped = True
+
+    # --- 请求 ---
+
+    def _begin(self):
+        if not self._wrapped:
+            self._wrap_template_functions()
+        timings = Timings()
+        g._timings_token = _current.set(timings)
+        if self.sampler is not None:
+            self.sampler.begin(timings)
+
+    def _finish(self, response):
+        timings = _current.get()
+        if timings is None:
+            return response
+        elapsed = time.perf_counter() - timings.start
+        endpoint = request.url_rule.endpoint if request.url_rule else 'not_found'
+        slow_ms = self.app.config['PROFILE_SLOW_MS']
+        slow = slow_ms is not None and elapsed * 1000 >= slow_ms
+
+        if self.app.config['SERVER_TIMING']:
+            response.headers['Server-Timing'] = server_timing(timings, elapsed)
+        if slow and timings.samples:
+            self._dump_profile(endpoint, elapsed, timings.samples)
+        self.registry.record(endpoint, request.method, response.status_code, elapsed, timings, slow)
+        self._maybe_flush()
+        return response
+
+    def _teardown(self, exc):
+        if self.sampler is not None:
+            self.sampler.end()
+        token = g.pop('_timings_token', None)
+        if token is not None:
+            _current.reset(token)
+
+    def _dump_profile(self, endpoint, elapsed, samples):
+        os.makedirs(self.profile_dir, exist_ok=True)
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{endpoint}-{int(elapsed * 1000)}ms.txt"
+        path = os.path.join(self.profile_dir, name)
+        with open(path, 'w') as f:
+            f.write(f'# {request.full_path} {elapsed * 1000:.1f} ms\n')
+            for stack, count in sorted(samples.items(), key=lambda item: -item[1]):
+                f.write(f'{stack} {count}\n')
+        self.app.logger.warning('慢请求 %s (%.0f ms)，调用栈采样已保存: %s', request.full_path, elapsed * 1000, path)
+
+    # --- /metrics ---
+
+    def _snapshot_path(self, pid=None):
+        return os.path.join(self.app.config['METRICS_DIR'], f'{pid or os.getpid()}.json')
+
+    def _maybe_flush(self, force=False):
+        if not self.app.config['METRICS_DIR']:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_flush < FLUSH_INTERVAL:
+            return
+        self._last_flush = now
+        path = self._snapshot_path()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f'{path}.{threading.get_ident()}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.registry.snapshot(), f)
+        os.replace(tmp, path)
+
+    def _metrics_allowed(self):
+        addresses = [request.remote_addr or '']
+        addresses += [a.strip() for a in request.headers.get('X-Forwarded-For', '').split(',') if a.strip()]
+        for address in addresses:
+            try:
+                ip = ipaddress.ip_address(address)
+            except ValueError:
+                return False
+            if not any(ip in net for net in self.metrics_allow):
+                return False
+        return True
+
+    def flush(self):
+        """马上把本进程的数据写到 METRICS_DIR (worker 退出前调用)"""
+        if self.app is not None and self.app.config.get('INSTRUMENTATION_ENABLED'):
+            self._maybe_flush(force=True)
+
+    def metrics_view(self):
+        if not self._metrics_allowed():
+            abort(404)
+        total = Registry()
+        if not self.app.config['METRICS_DIR']:
+            total.merge(self.registry.snapshot())
+        else:
+            # 所有 worker 合计：别的 worker 读共享目录里的文件，自己用内存里最新的数据
+            self._maybe_flush(force=True)
+            # 已经退出的 worker 的数据在 retired.json 里
+            for path in glob.glob(os.path.join(self.app.config['METRICS_DIR'], '*.json')):
+                snapshot = _read_snapshot(path)
+                if snapshot is not None:
+                    total.merge(snapshot)
+        return Response(total.render(), mimetype='text/plain; version=0.0.4')
+
+def _count_row(cursor, row):
+    timings = _current.get()
+    if timings is not None:
+        timings.rows += 1
+    return row
+
+def server_timing(timings, elapsed):
+    """Server-Timing 头：db;dur=3.2;desc="5 queries, 120 rows", search;dur=..., total;dur=..."""
+    parts = []
+    for name, (seconds, count) in timings.stages.items():
+        desc = f'{count} queries, {timings.rows} rows' if name == 'db' else f'{count}x'
+        parts.append(f'{name};dur={seconds * 1000:.2f};desc="{desc}"')
+    calls = sum(count for _, count in timings.calls.values())
+    if calls:
+        seconds = sum(s for s, _ in timings.calls.values())
+        parts.append(f'tplfunc;dur={seconds * 1000:.2f};desc="{calls} calls"')
+    parts.append(f'total;dur={elapsed * 1000:.2f}')
+    return ', '.join(parts)
@@ -0,0 +1,111 @@
+"""
+JSON 数据接口 (/api/v1/...)
+
+/creation、/materials 把图表数据和结果列表直接写在 HTML 里，换一个筛选条件就要整页重新加载，
+页面外壳也没法和数据分开缓存。这些接口只返回数据 (分页结果、筛选项计数、图表数据、旭日图)，
+前端可以只取变了的部分：
+- 地址带版本号 (/api/v1/)；返回格式有不兼容的改动时另开 v2，旧地址继续可用
+- 有 orjson 时用 orjson 序列化，没有时用标准库 json 的紧凑格式；中文都直接输出 UTF-8
+- ETag 由 数据版本号 (cache.py) + 请求 (路径和整理后的参数) 算出，不用先生成内容：
+  If-None-Match 对上了直接 304，连查询都不做
+- 结果按请求缓存 (ResponseCache.memo，数据版本变了自动作废)，连同压缩好的 gzip / br 一起存，
+  客户端支持时发送压缩版本 (压缩方式和 precompress.py 同一套)
+- Cache-Control: public, max-age=API_MAX_AGE，CDN 可以缓存一会儿；
+  地址里的 ?v= 等于当前数据版本 (返回内容里的 data_version) 时内容不会再变，缓存一年 (immutable)
+"""
+import hashlib
+import json
+from functools import wraps
+
+from flask import Response, request
+
+import precompress
+from cache import request_args
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+API_VERSION = 'v1'
+
+# 同一个 API_VERSION 下改了返回字段 (兼容的改动) 时加一，旧的 ETag 随之失效
+REVISION = 1
+
+# 带 ?v=<数据版本> 的地址缓存一年
+VERSIONED_MAX_AGE = 365 * 24 * 3600
+
+def dumps(obj):
+    """紧凑的 JSON (bytes)"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+class JsonApi:
+    """
+    功能：@json_api.view 装饰返回 dict 的路由：加上 api / data_version 字段，序列化、缓存、压缩，
+    ETag / 304 和缓存头。
+    配置项：API_MAX_AGE (秒，默认 60)
+    """
+
+    def __init__(self, app=None, response_cache=None):
+        self.app = None
+        self.cache = None
+        if app is not None:
+            self.init_app(app, response_cache)
+
+    def init_app(self, app, response_cache):
+        self.app = app
+        self.cache = response_cache
+        app.config.setdefault('API_MAX_AGE', 60)
+
+    @staticmethod
+    def request_key():
+        # 和页面缓存一样整理参数 (cache.request_args)；v 只影响缓存头，不影响内容
+        return ('api', request.path, request_args(('v',)))
+
+    @staticmethod
+    def etag(version, key):
+        return hashlib.sha1(repr((API_VERSION, REVISION, version, key)).encode('utf-8')).hexdigest()[:20]
+
+    @staticmethod
+    def encode(payload):
+        """返回 {压缩方式: 内容}，identity 是原文；太小的不压缩"""
+        body = dumps(payload)
+        bodies = {'identity': body}
+        if len(body) >= precompress.MIN_SIZE:
+            for encoding in precompress.available_encodings():
+                bodies[encoding] = precompress.compress(body, encoding, precompress.RUNTIME_LEVELS[encoding])
+        return bodies
+
+    def view(self, func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            version = self.cache.current_version()
+            key = self.request_key()
+            tag = self.etag(version, key)
+
+            if request.if_none_match.contains_weak(tag):
+                response = Response(status=304)
+            else:
+                def build():
+                    payload = func(*args, **kwargs)
+                    return self.encode(dict({'api': API_VERSION, 'data_version': version}, **payload))
+
+                bodies = self.cache.memo(key, build, size=lambda b: sum(len(v) for v in b.values()))
+                encoding = precompress.choose_encoding([e for e in bodies if e != 'identity'])
+                response = Response(bodies[encoding or 'identity'], mimetype='application/json')
+                if encoding:
+                    response.headers['Content-Encoding'] = encoding
+
+            # 不同压缩方式内容一样，用弱 ETag
+            response.set_etag(tag, weak=True)
+            response.vary.add('Accept-Encoding')
+            response.cache_control.public = True
+            if request.args.get('v') == version:
+                response.cache_control.max_age = VERSIONED_MAX_AGE
+                response.cache_control.immutable = True
+            else:
+                response.cache_control.max_age = self.app.config['API_MAX_AGE']
+            return response
+        return wrapper
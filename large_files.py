@@ -0,0 +1,100 @@
+"""
+大文件 (PDF、扫描图、bgm.mp3 ...) 的发送
+
+- 支持 Range (断点续传、音频 / PDF 拖动进度条时只下载需要的部分)，带 ETag / Last-Modified，支持 304
+- 在 gunicorn 下，整个文件和 Range 请求都走 sendfile (零拷贝，不经过 Python 读文件)；
+  其他服务器的 Range 请求由应用按范围截断
+- 放在 nginx / Apache 后面时可以把发送交给它们，Python 线程不用陪着慢速客户端传完整个文件：
+    FILE_OFFLOAD = 'x-accel'     nginx，需要配一个 internal 的 location：
+                                     location /_static/ { internal; alias /项目路径/static/; }
+    FILE_OFFLOAD = 'x-sendfile'  Apache (mod_xsendfile) / lighttpd
+  Range、缓存头都由前面的服务器处理
+小文件和可以压缩的文本文件仍然交给原来的 static 视图 (precompress.py)。
+"""
+import mimetypes
+import os
+from urllib.parse import quote
+
+from flask import Response, abort, request, send_file
+from werkzeug.security import safe_join
+from werkzeug.utils import send_file as werkzeug_send_file
+
+from precompress import COMPRESSIBLE_EXTS
+
+OFFLOAD_MODES = ('x-accel', 'x-sendfile')
+
+class LargeFiles:
+    """
+    功能：接管 static/ 下大文件的发送。
+    配置项：LARGE_FILE_MIN_SIZE, FILE_OFFLOAD (None / 'x-accel' / 'x-sendfile'), FILE_OFFLOAD_PREFIX (x-accel 的内部路径)
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._next = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.config.setdefault('LARGE_FILE_MIN_SIZE', 256 * 1024)
+        app.config.setdefault('FILE_OFFLOAD', None)
+        app.config.setdefault('FILE_OFFLOAD_PREFIX', '/_static/')
+        if app.config['FILE_OFFLOAD'] not in (None,) + OFFLOAD_MODES:
+            raise ValueError(f"FILE_OFFLOAD 只能是 None 或 {', '.join(OFFLOAD_MODES)}")
+        # 套在现有的 static 视图外面，小文件照旧交给它
+        self._next = app.view_functions['static']
+        app.view_functions['static'] = self.static_view
+
+    def static_view(self, filename):
+        app = self.app
+        if filename.lower().endswith(COMPRESSIBLE_EXTS):
+            return self._next(filename)
+        path = safe_join(app.static_folder, filename)
+        if path is None:
+            abort(404)
+        try:
+            size = os.stat(path).st_size
+        except OSError:
+            abort(404)
+        if size < app.config['LARGE_FILE_MIN_SIZE'] or not os.path.isfile(path):
+            return self._next(filename)
+        return self.send(path, filename)
+
+    def send(self, path, filename):
+        app = self.app
+        offload = app.config['FILE_OFFLOAD']
+        max_age = app.get_send_file_max_age(filename)
+
+        if offload == 'x-accel':
+            # 中文文件名要编码成 %XX 才能放进响应头，nginx 会解码回去
+            response = Response(mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+            response.headers['X-Accel-Redirect'] = app.config['FILE_OFFLOAD_PREFIX'] + quote(filename)
+            return response
+        if offload == 'x-sendfile':
+            return werkzeug_send_file(path, request.environ, use_x_sendfile=True, max_age=max_age)
+
+        response = send_file(path, conditional=True, etag=True, max_age=max_age)
+        if response.status_code == 206:
+            _sendfile_range(response, path)
+        return response
+
+def _sendfile_range(response, path):
+    """
+    werkzeug 处理 Range 时把文件包成 _RangeWrapper 逐块读，gunicorn 就不会用 sendfile 了。
+    这里换成定位到起点的文件 + wsgi.file_wrapper：gunicorn 从当前位置发送，并且最多只发 Content-Length 字节
+    (sendfile 和普通写入都会截断)，所以是零拷贝而且不会多发。
+    别的服务器的 wsgi.file_wrapper (比如 wsgiref) 不管 Content-Length，会把文件剩下的部分全发出去，
+    只在 gunicorn 下这样做；其他情况 (包括 ASGI、开发服务器) 保持 _RangeWrapper，由应用自己截断。
+    """
+    file_wrapper = request.environ.get('wsgi.file_wrapper')
+    if file_wrapper is None or response.content_range is None:
+        return
+    if not request.environ.get('SERVER_SOFTWARE', '').startswith('gunicorn/'):
+        return
+    start = response.content_range.start
+    f = open(path, 'rb')
+    f.seek(start)
+    response.response.close()
+    response.response = file_wrapper(f)
+    response.direct_passthrough = True
@@ -0,0 +1,128 @@
+"""
+作品配图 / 史料文件的索引
+
+导入脚本 (init_db.py / init_materials.py) 把每个文件的 尺寸、字节数、内容哈希 记到 work_image / material_file 表里，
+网站渲染页面时不用再碰文件：
+- describe()：读一个文件的大小、SHA-1，图片再读出宽高 (Pillow 只解析文件头，不解码整张图)
+- scan_material_folder()：史料文件夹 (包括子文件夹) 里的所有文件，按文件夹内自然排序编号
+- VersionedStatic：模板里的 static_url(路径, 哈希) 生成 /static/...?v=<哈希前 12 位>，
+  文件内容变了地址就变；v 和索引里的哈希一致时静态文件响应让浏览器长期缓存 (immutable)
+- display_size()：按页面上的最大宽高缩放出 <img> 的 width / height，图片没加载完页面也不会跳动
+"""
+import hashlib
+import os
+
+from PIL import Image, UnidentifiedImageError
+from flask import request, url_for
+
+# 图片后缀 (统一按小写比较)
+IMAGE_EXTS = ('.jpg', '.jpeg', '.png', '.webp')
+
+# 地址里的版本号长度
+VERSION_LENGTH = 12
+
+# 带版本号的静态文件缓存一年
+VERSIONED_MAX_AGE = 365 * 24 * 3600
+
+def file_kind(name):
+    ext = os.path.splitext(name)[1].lower()
+    if ext in IMAGE_EXTS:
+        return 'image'
+    if ext in ('.pdf', '.txt'):
+        return ext[1:]
+    return 'other'
+
+def describe(path):
+    """
+    功能：返回 {'bytes', 'hash', 'width', 'height'}；不是图片 (或者图片坏了) 时宽高为 None。
+    """
+    sha1 = hashlib.sha1()
+    size = 0
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            sha1.update(chunk)
+            size += len(chunk)
+    info = {'bytes': size, 'hash': sha1.hexdigest(), 'width': None, 'height': None}
+    if file_kind(path) == 'image':
+        try:
+            with Image.open(path) as img:
+                info['width'], info['height'] = img.size
+                # 手机拍的照片可能带旋转标记，显示出来宽高是反的
+                if img.getexif().get(0x0112) in (5, 6, 7, 8):
+                    info['width'], info['height'] = info['height'], info['width']
+        except (OSError, UnidentifiedImageError):
+            pass
+    return info
+
+def scan_material_folder(folder, sort_key):
+    """
+    功能：列出史料文件夹里的所有文件 (包括子文件夹，跳过隐藏文件)。
+    返回 [(子文件夹相对路径, 文件名, 文件夹内序号, 完整路径)]，子文件夹相对路径用 / 分隔，最外层是 ''。
+    """
+    found = []
+    for root, dirs, files in os.walk(folder):
+        dirs[:] = [d for d in dirs if not d.startswith('.')]
+        rel = os.path.relpath(root, folder).replace('\\', '/')
+        rel = '' if rel == '.' else rel
+        names = sorted((n for n in files if not n.startswith('.')), key=sort_key)
+        found.extend((rel, name, i, os.path.join(root, name)) for i, name in enumerate(names))
+    return found
+
+def display_size(width, height, max_width=None, max_height=None):
+    """等比缩小到不超过 max_width × max_height (不放大)；宽高未知时返回 (None, None)"""
+    if not width or not height:
+        return None, None
+    scale = min(1.0, max_width / width if max_width else 1.0, max_height / height if max_height else 1.0)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+class SizedFile:
+    """work_image / material_file 模型共用 (都有 width / height 列)"""
+
+    def display_size(self, max_width=None, max_height=None):
+        """页面上 <img> 的 width / height (宽高未知时为空字典，模板里直接 **展开)"""
+        width, height = display_size(self.width, self.height, max_width, max_height)
+        return {'width': width, 'height': height} if width else {}
+
+def static_url(filename, file_hash=None):
+    """带内容版本号的静态文件地址 (没有哈希时就是普通地址)"""
+    if not file_hash:
+        return url_for('static', filename=filename)
+    return url_for('static', filename=filename, v=file_hash[:VERSION_LENGTH])
+
+class VersionedStatic:
+    """
+    功能：模板里提供 static_url()；带 ?v= 的静态文件响应加上长期缓存头。
+    只有 ?v= 和索引里记的内容哈希 (hash_loader 注册的函数查) 对得上时才长期缓存；
+    对不上 (文件换过了、旧地址、随手写的 v) 按普通静态文件处理，免得浏览器把错的内容缓存一年。
+    """
+
+    def __init__(self, app=None):
+        self._hash_loader = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.add_template_global(static_url, 'static_url')
+        app.after_request(self._cache_headers)
+
+    def hash_loader(self, f):
+        """装饰器：注册 f(相对 static/ 的路径) -> 内容哈希 (不在索引里时返回 None)"""
+        self._hash_loader = f
+        return f
+
+    def is_current(self, filename, version):
+        """version 是不是这个文件当前内容的版本号"""
+        if self._hash_loader is None:
+            return False
+        file_hash = self._hash_loader(filename)
+        return bool(file_hash) and file_hash[:VERSION_LENGTH] == version
+
+    def _cache_headers(self, response):
+        version = request.args.get('v')
+        if (request.endpoint == 'static' and version and response.status_code in (200, 206, 304)
+                and self.is_current(request.view_args['filename'], version)):
+            response.cache_control.no_cache = None
+            response.cache_control.public = True
+            response.cache_control.max_age = VERSIONED_MAX_AGE
+            response.cache_control.immutable = True
+        return response
@@ -0,0 +1,243 @@
+"""
+预渲染 + 预压缩
+
+map.html (700 多 KB 的内联 SVG) 和各个 *-work-timeline.html 其实都是静态页面，
+没必要每次请求都过一遍 Jinja、每次都传未压缩的原文。
+
+- 静态页面：每个 worker 第一次请求时渲染一次，连同 gzip / brotli 版本一起留在内存里，
+  模板文件改了才重新渲染；ETag 取页面内容的哈希，带 Last-Modified，支持 304
+- static/ 下的文本类文件 (css / js / svg / json ...)：客户端支持时直接发送预先压缩好的 .br / .gz
+- 压缩结果存在 instance/precompressed/，所有 worker 共用；
+  部署时可以先运行 `flask --app app precompress` 用最高压缩级别全部生成好
+没装 brotli 库时只用 gzip。
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import threading
+from collections import namedtuple
+
+import click
+from flask import Response, abort, render_template, request, send_file
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# 值得压缩的文件类型 (图片、字体、音频本身已经压缩过了)
+COMPRESSIBLE_EXTS = ('.html', '.css', '.js', '.svg', '.json', '.txt', '.xml', '.geojson')
+# 太小的文件压缩了也省不了多少
+MIN_SIZE = 1024
+
+# 有自己路由 (需要参数) 的模板，不能当作静态页面直接渲染
+ROUTE_TEMPLATES = ('creation', 'article', 'materials', 'material_detail', 'site_search', 'trends')
+
+# 运行时顺手压缩用较快的级别；`flask precompress` 用最高级别
+RUNTIME_LEVELS = {'br': 5, 'gzip': 6}
+BUILD_LEVELS = {'br': 11, 'gzip': 9}
+
+Page = namedtuple('Page', ['template', 'body', 'encoded', 'etag', 'last_modified'])
+
+def available_encodings():
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+def compress(data, encoding, level):
+    if encoding == 'br':
+        return brotli.compress(data, quality=level)
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+def choose_encoding(encodings):
+    """按请求头 Accept-Encoding 选一种压缩方式 (都不支持时返回 None)"""
+    best = request.accept_encodings.best_match(list(encodings) + ['identity'])
+    return best if best in encodings else None
+
+def _write_atomic(path, data, mtime=None):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    if mtime is not None:
+        os.utime(tmp, ns=(mtime, mtime))
+    os.replace(tmp, path)
+
+class Precompressed:
+    """
+    功能：预渲染的静态页面 + static/ 的预压缩。
+    配置项：PRECOMPRESS_DIR (默认 instance/precompressed), PRERENDER_PAGES (`flask precompress` 预先生成的页面)
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.directory = None
+        self._pages = {}
+        self._known = (None, frozenset()) # (模板文件夹的 mtime, 静态页面名)
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.directory = app.config.get('PRECOMPRESS_DIR') or os.path.join(app.instance_path, 'precompressed')
+        # 替换 Flask 自带的 static 视图 (没有压缩版本时仍然交给原来的 send_static_file)
+        app.view_functions['static'] = self.static_view
+        app.cli.add_command(self.precompress_command())
+        # 启动时建好静态页面的路由表
+        self.known_pages()
+
+    # ============================================
+    # 1. 静态页面
+    # ============================================
+
+    def known_pages(self):
+        """
+        功能：静态页面的路由表 (templates/ 下除 ROUTE_TEMPLATES 以外的 *.html，不含子文件夹)。
+        每次只 stat 一下模板文件夹，增删模板后 mtime 变了才重新扫描。
+        """
+        folder = os.path.join(self.app.root_path, self.app.template_folder)
+        try:
+            mtime = os.stat(folder).st_mtime_ns
+        except OSError:
+            return frozenset()
+        if mtime != self._known[0]:
+            with os.scandir(folder) as entries:
+                names = frozenset(entry.name[:-5] for entry in entries
+                                  if entry.name.endswith('.html') and entry.is_file()
+                                  and entry.name[:-5] not in ROUTE_TEMPLATES)
+            self._known = (mtime, names)
+        return self._known[1]
+
+    def prerender(self, name):
+        """渲染并压缩好一个静态页面 (启动预热用，需要在请求上下文里调用)"""
+        self._get_page(name)
+
+    def page(self, name):
+        """
+        功能：返回预渲染好的页面 (带 ETag / Last-Modified，可能是 304 或压缩过的)。
+        模板不存在时抛出 jinja2.TemplateNotFound。
+        """
+        page = self._get_page(name)
+        encoding = choose_encoding(page.encoded)
+        if encoding:
+            response = Response(page.encoded[encoding], mimetype='text/html')
+            response.headers['Content-Encoding'] = encoding
+            response.set_etag(f'{page.etag}-{encoding}')
+        else:
+            response = Response(page.body, mimetype='text/html')
+            response.set_etag(page.etag)
+        response.vary.add('Accept-Encoding')
+        response.last_modified = page.last_modified
+        return response.make_conditional(request)
+
+    def _get_page(self, name, levels=RUNTIME_LEVELS):
+        template = self.app.jinja_env.get_template(f'{name}.html')
+        page = self._pages.get(name)
+        # 模板重新加载过 (文件改了) 就是另一个 Template 对象
+        if page is not None and page.template is template:
+            return page
+        with self._lock:
+            page = self._pages.get(name)
+            if page is None or page.template is not template:
+                page = self._pages[name] = self._build_page(name, template, levels)
+        return page
+
+    def _build_page(self, name, template, levels):
+        body = render_template(template).encode('utf-8')
+        etag = hashlib.sha1(body).hexdigest()
+        encoded = {}
+        for encoding in available_encodings():
+            # 同样内容的压缩结果存在磁盘上 (文件名是内容哈希)，其他 worker 直接读
+            path = os.path.join(self.directory, 'pages', f'{etag}.html.{encoding}')
+            try:
+                with open(path, 'rb') as f:
+                    encoded[encoding] = f.read()
+            except OSError:
+                encoded[encoding] = compress(body, encoding, levels[encoding])
+                _write_atomic(path, encoded[encoding])
+        try:
+            last_modified = os.path.getmtime(template.filename)
+        except (OSError, TypeError):
+            last_modified = None
+        return Page(template, body, encoded, etag, last_modified)
+
+    # ============================================
+    # 2. static/ 目录
+    # ============================================
+
+    def static_view(self, filename):
+        app = self.app
+        if not filename.lower().endswith(COMPRESSIBLE_EXTS):
+            return app.send_static_file(filename)
+        path = safe_join(app.static_folder, filename)
+        if path is None or not os.path.isfile(path):
+            abort(404)
+        st = os.stat(path)
+        if st.st_size < MIN_SIZE:
+            return app.send_static_file(filename)
+        encoding = choose_encoding(available_encodings())
+        compressed = self._static_variant(filename, path, st, encoding) if encoding else None
+        if compressed is None:
+            response = app.send_static_file(filename)
+            response.vary.add('Accept-Encoding')
+            return response
+
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        response = send_file(compressed, mimetype=mimetype, conditional=True, last_modified=st.st_mtime,
+                             etag=f'{st.st_mtime_ns:x}-{st.st_size:x}-{encoding}',
+                             max_age=app.get_send_file_max_age(filename))
+        response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+        return response
+
+    def _static_variant(self, filename, path, st, encoding, levels=RUNTIME_LEVELS):
+        """压缩版本的路径；不存在或比原文件旧时重新生成 (压缩文件的 mtime 和原文件保持一致)"""
+        target = os.path.join(self.directory, 'static', f'{filename}.{encoding}')
+        try:
+            if os.stat(target).st_mtime_ns == st.st_mtime_ns:
+                return target
+        except OSError:
+            pass
+        with open(path, 'rb') as f:
+            _write_atomic(target, compress(f.read(), encoding, levels[encoding]), st.st_mtime_ns)
+        return target
+
+    # ============================================
+    # 3. 部署时预先生成 (flask precompress)
+    # ============================================
+
+    def build(self):
+        """用最高压缩级别生成 PRERENDER_PAGES 里的页面和 static/ 下所有可压缩文件，返回 (页面数, 文件数)"""
+        app = self.app
+        with app.test_request_context('/'):
+            pages = app.config.get('PRERENDER_PAGES', ())
+            with self._lock:
+                self._pages.clear()
+            for name in pages:
+                template = app.jinja_env.get_template(f'{name}.html')
+                self._pages[name] = self._build_page(name, template, BUILD_LEVELS)
+
+        files = 0
+        for root, _, names in os.walk(app.static_folder):
+            for name in names:
+                path = os.path.join(root, name)
+                st = os.stat(path)
+                if not name.lower().endswith(COMPRESSIBLE_EXTS) or st.st_size < MIN_SIZE:
+                    continue
+                filename = os.path.relpath(path, app.static_folder).replace('\\', '/')
+                for encoding in available_encodings():
+                    target = os.path.join(self.directory, 'static', f'{filename}.{encoding}')
+                    with open(path, 'rb') as f:
+                        _write_atomic(target, compress(f.read(), encoding, BUILD_LEVELS[encoding]), st.st_mtime_ns)
+                files += 1
+        return len(pages), files
+
+    def precompress_command(self):
+        @click.command('precompress')
+        def precompress():
+            """预渲染静态页面，并把 static/ 下的文本文件压缩成 gzip / brotli"""
+            click.echo(f"🚀 正在预压缩 (格式: {', '.join(available_encodings())}) ...")
+            pages, files = self.build()
+            click.echo(f"✅ 页面 {pages} 个，静态文件 {files} 个，输出到 {self.directory}")
+        return precompress
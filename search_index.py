@@ -0,0 +1,362 @@
+"""
+全文检索索引 (SQLite FTS5)
+
+思路：
+1. 建索引时把标题/正文逐字做“简繁折叠”(统一转成简体 + 英文小写)，
+   折叠是逐字进行的，所以折叠前后每个字的下标完全一致。
+2. 再把每个字用空格隔开存进 FTS5 表，这样 unicode61 分词器会把每个汉字
+   当成一个词，关键词查询就变成 "南 洋" 这样的短语查询 (相邻字)。
+3. 查询时用 FTS5 自带的 highlight() 把命中位置标出来，一次查询就能拿到
+   命中的作品 id、每篇的命中次数和命中位置 (用来截取摘录)，
+   再用 FTS5 自带的 bm25() 按相关度排序 (词频、文档长度都是索引里预先存好的)。
+4. 检索语法 (AND / OR / NOT / 短语 / 字段筛选) 见 search_query.py。
+
+由 init_db.py 负责重建索引；如果数据库里还没有索引表，search() 返回 None，
+由调用方退回原来的 LIKE 查询。
+史料的索引 (material_fts，见 site_search.py) 用同一套建索引 / 查询函数，只是表名不同 (table 参数)。
+"""
+import re
+from collections import namedtuple
+
+from sqlalchemy import column, select, table, text
+
+import search_query
+import snippets
+from zh_convert import fold
+
+FTS_TABLE = 'work_fts'
+
+# 存放一次检索命中 id 的临时表 (每个数据库连接各自一份，见 hit_ids())
+HIT_TABLE = 'search_hit'
+
+# highlight() 用的标记符，正文里不会出现这两个控制字符
+_MARK_OPEN = '\x01'
+_MARK_CLOSE = '\x02'
+
+# 标题排序权重：bm25() 里标题命中比正文命中更重要
+TITLE_WEIGHT = 5.0
+
+# 一篇作品的命中信息：
+# title_spans / content_spans 是每次命中的 (起始下标, 长度)，下标对应原文；
+# score 是相关度 (bm25，越小越相关；没有索引时为 None)
+class Hit(namedtuple('Hit', ['title_spans', 'content_spans', 'score'])):
+    __slots__ = ()
+
+    @property
+    def count(self):
+        return len(self.title_spans) + len(self.content_spans)
+
+# ============================================
+# 1. 简繁折叠 (见 zh_convert.fold)
+# ============================================
+
+def _spaced(s):
+    # 原文第 i 个字 -> 存储文本的第 2i 个字符
+    return ' '.join(fold(s))
+
+# ============================================
+# 2. 建索引 (init_db.py 调用)
+# ============================================
+
+def create_index(conn, table=FTS_TABLE):
+    conn.execute(text(f'DROP TABLE IF EXISTS {table}'))
+    conn.execute(text(f"CREATE VIRTUAL TABLE {table} USING fts5(title, content, tokenize='unicode61')"))
+
+def index_work(conn, work_id, title, content, table=FTS_TABLE):
+    conn.execute(text(f'INSERT INTO {table}(rowid, title, content) VALUES (:id, :title, :content)'),
+                 {'id': work_id, 'title': _spaced(title or ''), 'content': _spaced(content or '')})
+
+def rebuild(conn, works, table=FTS_TABLE):
+    """
+    功能：清空并重建整个索引。works 是 (id, title, content) 的可迭代对象。
+    返回写入的篇数。
+    """
+    create_index(conn, table)
+    total = 0
+    for work_id, title, content in works:
+        index_work(conn, work_id, title, content, table)
+        total += 1
+    return total
+
+def update(conn, works, removed_ids=()):
+    """
+    功能：增量更新索引 —— 删掉已删除/有修改的作品，再写入有修改的作品。
+    works 是 (id, title, content) 的可迭代对象。
+    """
+    works = list(works)
+    stale = list(removed_ids) + [work_id for work_id, _, _ in works]
+    for i in range(0, len(stale), 500):
+        batch = stale[i:i + 500]
+        params = {f'id{j}': work_id for j, work_id in enumerate(batch)}
+        placeholders = ', '.join(f':{name}' for name in params)
+        conn.execute(text(f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})'), params)
+    for work_id, title, content in works:
+        index_work(conn, work_id, title, content)
+
+def has_index(conn, table=FTS_TABLE):
+    row = conn.execute(text("SELECT 1 FROM sqlite_master WHERE type='table' AND name=:name"),
+                       {'name': table}).first()
+    return row is not None
+
+# ============================================
+# 3. 查询
+# ============================================
+
+def _phrase(term):
+    # 只保留会被分词器当成词的字符 (字母、数字、汉字)，拼成 FTS5 短语
+    tokens = [c for c in fold(term) if c.isalnum()]
+    if not tokens:
+        return None
+    return '"' + ' '.join(tokens).replace('"', '""') + '"'
+
+def _fts_expr(expr):
+    """
+    功能：把语法树翻译成 FTS5 查询；FTS5 不支持的写法 (单独的 NOT 等) 返回 None。
+    FTS5 的 NOT 是二元的，所以 And 里的 NOT 项统一挂在正向项后面：(a AND b) NOT c。
+    """
+    if isinstance(expr, search_query.Term):
+        return _phrase(expr.text)
+    if isinstance(expr, search_query.Or):
+        parts = [_fts_expr(item) for item in expr.items]
+        return None if None in parts else '(' + ' OR '.join(parts) + ')'
+    if isinstance(expr, search_query.And):
+        positive = [_fts_expr(i) for i in expr.items if not isinstance(i, search_query.Not)]
+        negative = [_fts_expr(i.item) for i in expr.items if isinstance(i, search_query.Not)]
+        if not positive or None in positive or None in negative:
+            return None
+        return '(' + ' AND '.join(positive) + ''.join(' NOT ' + n for n in negative) + ')'
+    return None
+
+def terms_pattern(terms):
+    """所有正向检索词 (折叠后) 合成一个正则，长词优先"""
+    folded = sorted({fold(t) for t in terms if t}, key=len, reverse=True)
+    if not folded:
+        return None
+    return re.compile('|'.join(re.escape(t) for t in folded))
+
+def _spans(marked, pattern):
+    """
+    功能：从 highlight() 的结果里解析出检索词在原文里的位置 [(起始下标, 长度)]。
+    - 标记区间里取偶数位字符，就是折叠后的原文片段
+    - 短语匹配会跳过标点 (如 "南，洋")，所以要在片段里再精确找一遍检索词；
+      重叠命中 (如 "哈哈哈" 里找 "哈哈") 也会被合并成一个区间，在片段里按不重叠计数
+    """
+    spans = []
+    removed = 0 # 已经扫过的标记符数量
+    pos = marked.find(_MARK_OPEN)
+    while pos != -1:
+        end = marked.find(_MARK_CLOSE, pos)
+        if end == -1:
+            break
+        start = (pos - removed) // 2
+        segment = marked[pos + 1:end][::2]
+        for m in pattern.finditer(segment):
+            spans.append((start + m.start(), m.end() - m.start()))
+        removed += 2
+        pos = marked.find(_MARK_OPEN, end)
+    return spans
+
+def search(conn, parsed, table=FTS_TABLE):
+    """
+    功能：用索引执行检索 (parsed 是 search_query.parse() 的结果，简繁体都能命中)。
+    返回按相关度排好序的 {work_id: Hit}；没有正向检索词时返回 {}；
+    索引不存在时返回 None，由调用方改用 scan()。
+    """
+    rows = search_rows(conn, parsed, table)
+    if rows is None:
+        return None
+    return {row_id: hit for row_id, hit, _ in rows}
+
+def search_rows(conn, parsed, table=FTS_TABLE, source=None, columns=()):
+    """
+    功能：同 search()，但可以在同一条 SQL 里顺便取出 source 表 (id = 索引的 rowid) 的 columns 列。
+    返回按相关度排好序的 [(id, Hit, (列值 ...))]；不能用索引时返回 None。
+    """
+    if parsed.expr is None:
+        return None
+    pattern = terms_pattern(parsed.terms)
+    if pattern is None:
+        # 没有正向检索词 (只有 NOT / -词)：没有可以高亮、计数的命中，和 scan() 一样没有结果，不用查
+        return []
+    if not has_index(conn, table):
+        return None
+    expr = _fts_expr(parsed.expr)
+    keep = None
+    if expr is None:
+        keep = _term_sets(conn, parsed.expr, table)
+        if keep is None:
+            # 有只含标点的词，分词器不收录，只能 scan()
+            return None
+        # FTS5 写不出来的查询 (比如 OR 里的 NOT)：用所有正向词 OR 起来找候选，再按语法树过滤，
+        # 不退回读全部正文的 scan()
+        expr = '(' + ' OR '.join(_phrase(t) for t in parsed.terms) + ')'
+
+    extra = ''.join(f', {source}.{column}' for column in columns)
+    join = f' JOIN {source} ON {source}.id = {table}.rowid' if source else ''
+    rows = conn.execute(text(
+        f'SELECT {table}.rowid, highlight({table}, 0, :o, :c), highlight({table}, 1, :o, :c), '
+        f'bm25({table}, :tw, 1.0) AS score{extra} '
+        f'FROM {table}{join} WHERE {table} MATCH :expr ORDER BY score'),
+        {'o': _MARK_OPEN, 'c': _MARK_CLOSE, 'tw': TITLE_WEIGHT, 'expr': expr})
+
+    found = []
+    for row_id, title_marked, content_marked, score, *values in rows:
+        if keep is not None and not search_query.match(parsed.expr, lambda term: row_id in keep[term]):
+            continue
+        hit = Hit(_spans(title_marked or '', pattern), _spans(content_marked or '', pattern), score)
+        if hit.count:
+            found.append((row_id, hit, tuple(values)))
+    return found
+
+def _term_sets(conn, expr, table):
+    """
+    功能：语法树里每个词 (包括 NOT 里的) 命中的 rowid 集合 {词: set}，用索引查，不读正文。
+    有索引查不了的词 (只含标点) 时返回 None。
+    """
+    terms = []
+    stack = [expr]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, search_query.Term):
+            terms.append(node.text)
+        elif isinstance(node, (search_query.And, search_query.Or)):
+            stack.extend(node.items)
+        else:
+            stack.append(node.item)
+    out = {}
+    for term in terms:
+        if term in out:
+            continue
+        phrase = _phrase(term)
+        if phrase is None:
+            return None
+        out[term] = {row_id for row_id, in conn.execute(
+            text(f'SELECT rowid FROM {table} WHERE {table} MATCH :expr'), {'expr': phrase})}
+    return out
+
+def scan(rows, parsed):
+    """
+    功能：没有索引时的退路 —— 直接在折叠后的文本里判断、找检索词。
+    rows 是 (id, title, content)，每篇文本只折叠一次；返回值和 search() 一样，
+    按命中次数从多到少排序。
+    """
+    pattern = terms_pattern(parsed.terms)
+    hits = {}
+    for work_id, title, content in rows:
+        f_title, f_content = fold(title), fold(content)
+
+        def contains(term):
+            term = fold(term)
+            return term in f_title or term in f_content
+
+        if parsed.expr is not None and not search_query.match(parsed.expr, contains):
+            continue
+        if pattern is None:
+            continue
+        hit = Hit(_find_all(f_title, pattern), _find_all(f_content, pattern), None)
+        if hit.count:
+            hits[work_id] = hit
+    return dict(sorted(hits.items(), key=lambda item: -item[1].count))
+
+def _find_all(haystack, pattern):
+    return [(m.start(), m.end() - m.start()) for m in pattern.finditer(haystack)]
+
+# ============================================
+# 4. 检索结果 (每次请求只算一次)
+# ============================================
+
+def hit_ids(conn, ids):
+    """
+    功能：把命中的 id 写进当前连接的临时表，返回 SELECT id 子查询，用在 Work.id.in_(...) 里。
+    命中几万篇时，直接写 IN (?, ?, ...) 会超过 SQLite 的参数个数上限，这里一个参数也不占。
+    同一个连接上再调用会覆盖上一次的内容，拿到子查询后要在下一次调用之前用完。
+    """
+    conn.execute(text(f'CREATE TEMP TABLE IF NOT EXISTS {HIT_TABLE} (id INTEGER PRIMARY KEY)'))
+    conn.execute(text(f'DELETE FROM temp.{HIT_TABLE}'))
+    if ids:
+        conn.execute(text(f'INSERT INTO temp.{HIT_TABLE} (id) VALUES (:id)'), [{'id': i} for i in ids])
+    return select(column('id')).select_from(table(HIT_TABLE, schema='temp'))
+
+def snippet_windows(conn, points, span_len, radius, source='work'):
+    """
+    功能：用一条 SQL 截取正文里若干命中位置附近的窗口，不读整篇正文。
+    points 是 [(work_id, 命中下标)]，返回 {(work_id, 命中下标): (窗口起点, 窗口文本)}。
+    source 是正文所在的表 (有 id、content 两列)。
+    """
+    if not points:
+        return {}
+
+    params = {'n': radius * 2 + span_len}
+    values = []
+    for i, (work_id, offset) in enumerate(points):
+        values.append(f'(:id{i}, :o{i}, :s{i})')
+        params[f'id{i}'] = work_id
+        params[f'o{i}'] = offset
+        params[f's{i}'] = max(0, offset - radius)
+    rows = conn.execute(text(
+        f'WITH v(id, o, s) AS (VALUES {", ".join(values)}) '
+        f'SELECT {source}.id, v.o, v.s, substr({source}.content, v.s + 1, :n) FROM v JOIN {source} ON {source}.id = v.id'),
+        params)
+    return {(work_id, offset): (start, window or '') for work_id, offset, start, window in rows}
+
+class ResultEntry:
+    """一篇命中作品 (或史料文档，有 id / title 就行)：命中信息 + 已经高亮好的标题和摘录"""
+    __slots__ = ('work', 'hit', 'title_html', 'snippets')
+
+    def __init__(self, work, hit, windows, context):
+        """windows 是 [(命中下标, 窗口起点, 窗口文本)]，见 snippet_windows()"""
+        self.work = work
+        self.hit = hit
+        self.title_html = snippets.mark(work.title, hit.title_spans) if hit.title_spans else None
+        self.snippets = []
+        for offset, base, content in windows:
+            if not content:
+                continue
+            relative = [(o - base, n) for o, n in hit.content_spans if base <= o < base + len(content)]
+            self.snippets.append(snippets.make_snippet(content, offset - base, relative, context))
+
+class SearchResult:
+    """
+    功能：一次检索的全部结果。
+    hits 是筛选后所有命中作品的 {work_id: Hit} (按相关度排序)，titles 是 {work_id: 标题}。
+    命中位置只算一次：柱状图用全部命中，高亮标题和摘录只给当前页的作品生成
+    (摘录从 conn 按窗口截取，作品只需要列表字段，不读整篇正文)。
+    """
+
+    def __init__(self, keyword, hits, titles, source='work'):
+        self.keyword = keyword
+        self.hits = hits
+        self.titles = titles
+        self.source = source
+        self.entries = {}
+
+    def __len__(self):
+        return len(self.hits)
+
+    def ranked_ids(self):
+        """按相关度排序的作品 id"""
+        return list(self.hits)
+
+    def annotate(self, works, conn, limit=1, context=snippets.DEFAULT_CONTEXT):
+        """
+        功能：给当前页的作品生成高亮标题和摘录。
+        每篇最多 limit 段摘录，每段句子过长时保留检索词前后 context 字。
+        """
+        picked = {work.id: snippets.pick_offsets(self.hits[work.id].content_spans, limit, context)
+                  for work in works if work.id in self.hits}
+        points = [(work_id, offset) for work_id, offsets in picked.items() for offset in offsets]
+        span_len = max((n for work_id in picked for _, n in self.hits[work_id].content_spans), default=0)
+        windows = snippet_windows(conn, points, span_len, snippets.window_radius(context), self.source)
+        for work in works:
+            if work.id not in picked:
+                continue
+            work_windows = [(o,) + windows.get((work.id, o), (0, '')) for o in picked[work.id]]
+            self.entries[work.id] = ResultEntry(work, self.hits[work.id], work_windows, context)
+
+    def get(self, work_id):
+        return self.entries.get(work_id)
+
+    def chart(self, limit=20):
+        """返回命中次数最多的前 limit 篇 (标题列表, 次数列表)，给 Plotly 用"""
+        top = sorted(self.hits.items(), key=lambda item: item[1].count, reverse=True)[:limit]
+        return [self.titles[work_id] for work_id, _ in top], [hit.count for _, hit in top]
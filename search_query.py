@@ -0,0 +1,188 @@
+"""
+检索语法
+
+支持：
+- 多个词用空格隔开，表示同时出现 (AND)，也可以显式写 AND
+- OR：任意一个出现，例如  南洋 OR 新加坡
+- NOT 或 -：排除，例如  抗战 NOT 日记  /  抗战 -日记
+- 英文双引号包起来的短语 (可以含空格)，例如  "new york"，排除短语写 -"new york"
+- 括号分组，例如  (南洋 OR 星洲) 抗战
+- 字段筛选：author:莹姿 (或 author:yingzi)、genre:散文、year:1939、year:1938-1940
+  中文写法 作者: / 文类: / 年份: 也可以
+- has:图片 (或 has:image)：只看有配图的作品
+- 只有运算符、组不成查询的输入 (比如 AND、NOT) 按字面当作短语
+
+parse() 把查询解析成语法树，search_index.py 再把它翻译成 FTS5 查询 (或退回 LIKE)。
+"""
+import re
+from collections import namedtuple
+
+# 中文人名 -> 英文 ID (和导入脚本里的映射一致)
+AUTHOR_ALIASES = {
+    '莹姿': 'yingzi', '冯伊湄': 'fengyimei',
+    '王映霞': 'wangyingxia', '王莹': 'wangying', '沈兹九': 'shenzijiu'
+}
+
+FIELD_ALIASES = {
+    'author': 'author', '作者': 'author',
+    'genre': 'genre', '文类': 'genre',
+    'year': 'year', '年份': 'year',
+    'has': 'has', '有': 'has',
+}
+
+# has: 后面可以写的值
+HAS_IMAGES = ('image', 'images', '图', '图片', '配图')
+
+Term = namedtuple('Term', ['text'])
+And = namedtuple('And', ['items'])
+Or = namedtuple('Or', ['items'])
+Not = namedtuple('Not', ['item'])
+
+class ParsedQuery(namedtuple('ParsedQuery', ['expr', 'filters', 'terms'])):
+    """
+    expr：语法树 (没有检索词时为 None)
+    filters：字段筛选 {'author': ..., 'genre': ..., 'year': (起, 止), 'images': True}
+    terms：所有“正向”检索词 (不在 NOT 里的)，用来高亮、计数
+    """
+    __slots__ = ()
+
+_TOKEN = re.compile(r'(-?)"([^"]*)"?|(\()|(\))|([^\s()"]+)')
+
+def _tokenize(q):
+    tokens = []
+    for m in _TOKEN.finditer(q):
+        minus, phrase, lparen, rparen, word = m.groups()
+        if phrase is not None:
+            if phrase.strip():
+                if minus:
+                    tokens.append(('NOT', None))
+                tokens.append(('TERM', phrase.strip()))
+        elif lparen:
+            tokens.append(('(', None))
+        elif rparen:
+            tokens.append((')', None))
+        elif word in ('AND', 'OR', 'NOT'):
+            tokens.append((word, None))
+        elif word.startswith('-') and len(word) > 1:
+            tokens.append(('NOT', None))
+            tokens.append(('TERM', word[1:]))
+        else:
+            tokens.append(('TERM', word))
+    return tokens
+
+def _parse_filter(word, filters):
+    """author:xx 这类字段筛选，识别成功返回 True"""
+    field, sep, value = word.partition(':')
+    if not sep:
+        field, sep, value = word.partition('：')
+    field = FIELD_ALIASES.get(field.lower() if sep else None)
+    if not field or not value:
+        return False
+    if field == 'author':
+        filters['author'] = AUTHOR_ALIASES.get(value, value)
+    elif field == 'genre':
+        filters['genre'] = value
+    elif field == 'has':
+        if value.lower() not in HAS_IMAGES:
+            return False
+        filters['images'] = True
+    else:
+        start, _, end = value.partition('-')
+        try:
+            filters['year'] = (int(start), int(end or start))
+        except ValueError:
+            return False
+    return True
+
+class _Parser:
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.pos = 0
+
+    def peek(self):
+        return self.tokens[self.pos][0] if self.pos < len(self.tokens) else None
+
+    def take(self):
+        token = self.tokens[self.pos]
+        self.pos += 1
+        return token
+
+    def parse_or(self):
+        items = [self.parse_and()]
+        while self.peek() == 'OR':
+            self.take()
+            items.append(self.parse_and())
+        items = [i for i in items if i is not None]
+        if not items:
+            return None
+        return items[0] if len(items) == 1 else Or(items)
+
+    def parse_and(self):
+        items = []
+        while self.peek() not in (None, 'OR', ')'):
+            if self.peek() == 'AND':
+                self.take()
+                continue
+            item = self.parse_unary()
+            if item is not None:
+                items.append(item)
+        if not items:
+            return None
+        return items[0] if len(items) == 1 else And(items)
+
+    def parse_unary(self):
+        kind = self.peek()
+        if kind == 'NOT':
+            self.take()
+            item = self.parse_unary()
+            return Not(item) if item is not None else None
+        if kind == '(':
+            self.take()
+            item = self.parse_or()
+            if self.peek() == ')':
+                self.take()
+            return item
+        if kind == ')':
+            self.take()
+            return None
+        if kind is None:
+            # 末尾多出来的 NOT (比如 "南洋 NOT")
+            return None
+        return Term(self.take()[1])
+
+def _positive_terms(expr, out):
+    if isinstance(expr, Term):
+        if expr.text not in out:
+            out.append(expr.text)
+    elif isinstance(expr, (And, Or)):
+        for item in expr.items:
+            _positive_terms(item, out)
+    return out
+
+def parse(q):
+    """把检索框里的字符串解析成 ParsedQuery"""
+    filters = {}
+    tokens = []
+    for kind, value in _tokenize(q or ''):
+        if kind == 'TERM' and _parse_filter(value, filters):
+            continue
+        tokens.append((kind, value))
+
+    expr = _Parser(tokens).parse_or() if tokens else None
+    if expr is None and tokens:
+        # 只有运算符 (比如只输入了 AND、NOT、括号)：按字面当作一个短语来找，而不是变成“不限检索词”
+        expr = Term(' '.join(value if value is not None else kind for kind, value in tokens))
+    return ParsedQuery(expr, filters, _positive_terms(expr, []) if expr is not None else [])
+
+def match(expr, contains):
+    """
+    功能：不用索引时判断一篇作品是否满足语法树。
+    contains(词) 返回这个词是否出现。
+    """
+    if isinstance(expr, Term):
+        return contains(expr.text)
+    if isinstance(expr, And):
+        return all(match(item, contains) for item in expr.items)
+    if isinstance(expr, Or):
+        return any(match(item, contains) for item in expr.items)
+    return not match(expr.item, contains)
@@ -0,0 +1,238 @@
+"""
+全站检索 (/search)：作品和史料一起查
+
+- 作品：直接用 work_fts (init_db.py 维护，见 search_index.py)
+- 史料：init_materials.py 导入时给每条史料建一条“文档” (文件夹名 + 刊物、出版时间、来源)，
+  文件夹里的 txt / pdf 各建一条 (导入时抽出来的文字)，存在 material_doc 表，
+  全文索引 material_fts 和 work_fts 的建法完全一样 (简繁折叠、逐字分词)
+- 查询时只查这两个索引 (顺便 JOIN 出标题、作家、刊物)，不碰文件夹：
+  史料文件夹再多，查询的开销也只和命中条数有关
+- 结果带类型 (作品 / 史料)；两个索引的 bm25 分数各按自己的语料统计，不能直接比，
+  先各自换算成名次百分位 (最相关为 0) 再交错合并；
+  按 类型 / 作家 / 刊物 分面计数 (aggregates.facets，和 /materials 的筛选项计数同一套规则)
+PDF 抽文字要装 pypdf (没装时 PDF 只能按文件名找到)；扫描版 PDF 没有文字层，同样只有文件名。
+"""
+import html
+import re
+from collections import namedtuple
+
+from flask import url_for
+from sqlalchemy import text
+
+import aggregates
+import search_index
+import snippets
+from media_index import static_url
+
+try:
+    from pypdf import PdfReader
+except ImportError:
+    PdfReader = None
+
+MATERIAL_FTS = 'material_fts'
+
+# 抽文字的文件类型
+TEXT_KINDS = ('txt', 'pdf')
+# 每个文件最多取这么多字进索引 (整本的大 PDF 只取前面)
+MAX_TEXT_CHARS = 200_000
+
+# 分面的维度 (也是 /search 的筛选参数)
+FACETS = ('type', 'author', 'publication')
+
+# 每页条数
+PER_PAGE = 20
+
+_TAG = re.compile(r'<[^>]+>')
+
+# ============================================
+# 1. 导入时 (init_materials.py 调用)
+# ============================================
+
+def extract_text(path, kind):
+    """
+    功能：抽出 txt / pdf 里的文字；读不出来时返回空字符串。
+    pdf 一行一行抽出来的文字中间会断行 (竖排、分栏)，这里把换行去掉。
+    """
+    try:
+        if kind == 'txt':
+            with open(path, 'rb') as f:
+                raw = f.read()
+            for encoding in ('utf-8-sig', 'gb18030'):
+                try:
+                    text = raw.decode(encoding)
+                    break
+                except UnicodeDecodeError:
+                    continue
+            else:
+                text = raw.decode('utf-8', errors='replace')
+            text = text.replace('\r\n', '\n')
+        elif kind == 'pdf' and PdfReader is not None:
+            reader = PdfReader(path)
+            parts = []
+            size = 0
+            for page in reader.pages:
+                part = re.sub(r'\s*\n\s*', '', page.extract_text() or '')
+                parts.append(part)
+                size += len(part)
+                if size >= MAX_TEXT_CHARS:
+                    break
+            text = '\n'.join(parts)
+        else:
+            return ''
+    except Exception as e:
+        # pypdf 遇到损坏的 PDF 会抛各种异常，不能让一个文件拖垮整个导入
+        print(f"  ⚠️ 抽取文字失败 ({path}): {e}")
+        return ''
+    return text[:MAX_TEXT_CHARS]
+
+def material_record_text(material):
+    """史料本身的可检索文字：刊物、出版时间、来源 (来源里可能有 HTML 标签)"""
+    source = html.unescape(_TAG.sub(' ', material.source or ''))
+    parts = [material.publication, material.publish_time, source]
+    return '\n'.join(p for p in parts if p and p != '暂无')
+
+def rebuild_index(conn, docs):
+    """
+    功能：重建 material_fts。docs 是 (id, title, content) 的可迭代对象 (material_doc 表的行)。
+    返回写入的条数。
+    """
+    return search_index.rebuild(conn, docs, MATERIAL_FTS)
+
+# ============================================
+# 2. 查询
+# ============================================
+
+# 分面计数用的统计行 (aggregates.facets 要求有 n)
+FacetRow = namedtuple('FacetRow', ['type', 'author', 'publication', 'n'])
+
+class Entry:
+    """一条检索结果 (作品，或者史料 / 史料里的一个文件)"""
+    __slots__ = ('type', 'kind', 'id', 'title', 'author', 'publication', 'hit', 'extra', 'result')
+
+    def __init__(self, type, kind, id, title, author, publication, hit, extra=None):
+        self.type = type
+        self.kind = kind
+        self.id = id
+        self.title = title or ''
+        self.author = author
+        self.publication = publication
+        self.hit = hit
+        self.extra = extra or {}
+        self.result = None # 当前页才有：高亮标题、摘录 (search_index.ResultEntry)
+
+    def url(self, keyword):
+        if self.type == 'work':
+            return url_for('article', work_id=self.id, q=keyword)
+        return url_for('material_detail', id=self.extra['material_id'], subpath=self.extra['dir'] or None)
+
+    def file_url(self):
+        """史料文件的地址 (带内容版本号)；作品和史料本身没有"""
+        path = self.extra.get('path')
+        return static_url(path, self.extra.get('hash')) if path else None
+
+class SiteResult:
+    """
+    功能：一次全站检索的结果。
+    entries 是按当前筛选过滤、按相关度排好序的全部结果，facets 是 {维度: {值: 条数}}。
+    """
+
+    def __init__(self, keyword, entries, facets):
+        self.keyword = keyword
+        self.entries = entries
+        self.facets = facets
+
+    def __len__(self):
+        return len(self.entries)
+
+    def page(self, conn, start, per_page=PER_PAGE, limit=1, context=snippets.DEFAULT_CONTEXT):
+        """取一页结果，给这一页生成高亮标题和摘录 (摘录按窗口从 work / material_doc 表里截取)"""
+        entries = self.entries[start:start + per_page]
+        for source, type_ in (('work', 'work'), ('material_doc', 'material')):
+            picked = [e for e in entries if e.type == type_]
+            if not picked:
+                continue
+            result = search_index.SearchResult(self.keyword, {e.id: e.hit for e in picked}, {}, source)
+            result.annotate(picked, conn, limit, context)
+            for e in picked:
+                e.result = result.get(e.id)
+        return entries
+
+def _relative_scores(entries):
+    """
+    功能：一个索引的结果换算成名次百分位：0 是最相关，越往后越接近 1 (同分的名次相同)。
+    两边按百分位交错排列，不受各自分数分布 (语料统计) 的影响。返回 {Entry: 百分位}。
+    """
+    ranked = sorted(entries, key=lambda e: e.hit.score)
+    scores = {}
+    rank = 0
+    for i, e in enumerate(ranked):
+        if i and e.hit.score != ranked[i - 1].hit.score:
+            rank = i
+        scores[e] = rank / len(ranked)
+    return scores
+
+def _works_with_images(conn):
+    """有配图的作品 id (work_image 表还没建时看旧的 image_path 列)"""
+    if search_index.has_index(conn, 'work_image'):
+        rows = conn.execute(text('SELECT DISTINCT work_id FROM work_image'))
+    else:
+        rows = conn.execute(text("SELECT id FROM work WHERE image_path IS NOT NULL AND image_path != ''"))
+    return {work_id for work_id, in rows}
+
+def _materials_with_images(conn):
+    """文件夹里有图片的史料 id"""
+    rows = conn.execute(text("SELECT DISTINCT material_id FROM material_file WHERE kind = 'image'"))
+    return {material_id for material_id, in rows}
+
+def search(conn, parsed, filters, keyword=''):
+    """
+    功能：在作品和史料两个索引里检索。
+    filters 是 {'type' / 'author' / 'publication': 值 或 'all'}；检索框里的 author: 没有另外选作家时也算数，
+    genre: / year: 只有作品有，用了它们就只看作品；has:图片 只留下有配图的作品、文件夹里有图片的史料。
+    返回 SiteResult；两个索引都用不了时返回 None。
+    """
+    filters = dict(filters)
+    if filters.get('author', 'all') == 'all' and 'author' in parsed.filters:
+        filters['author'] = parsed.filters['author']
+    work_only = 'genre' in parsed.filters or 'year' in parsed.filters
+
+    work_rows = search_index.search_rows(conn, parsed, search_index.FTS_TABLE, 'work',
+                                         ('title', 'author', 'publication', 'genre', 'year'))
+    material_rows = None if work_only else search_index.search_rows(
+        conn, parsed, MATERIAL_FTS, 'material_doc',
+        ('title', 'author', 'publication', 'material_id', 'kind', 'dir', 'name', 'path', 'hash'))
+    if work_rows is None and material_rows is None:
+        return None
+
+    with_images = parsed.filters.get('images')
+    works = []
+    if work_rows and with_images:
+        illustrated = _works_with_images(conn)
+        work_rows = [row for row in work_rows if row[0] in illustrated]
+    for work_id, hit, (title, author, publication, genre, year) in work_rows or ():
+        if 'genre' in parsed.filters and genre != parsed.filters['genre']:
+            continue
+        if 'year' in parsed.filters and not (parsed.filters['year'][0] <= (year or 0) <= parsed.filters['year'][1]):
+            continue
+        works.append(Entry('work', 'work', work_id, title, author, publication, hit))
+    materials = []
+    if material_rows and with_images:
+        illustrated = _materials_with_images(conn)
+        material_rows = [row for row in material_rows if row[2][3] in illustrated]
+    for doc_id, hit, (title, author, publication, material_id, kind, dir_, name, path, file_hash) in material_rows or ():
+        materials.append(Entry('material', kind, doc_id, title, author, publication, hit,
+                               {'material_id': material_id, 'dir': dir_, 'name': name, 'path': path, 'hash': file_hash}))
+    # 两个索引的 bm25 分数不能直接比：各自换算成名次百分位再合在一起排 (相同时作品在前)
+    scores = _relative_scores(works) | _relative_scores(materials)
+    entries = sorted(works + materials, key=lambda e: scores[e])
+
+    counts = {}
+    for e in entries:
+        key = (e.type, e.author, e.publication)
+        counts[key] = counts.get(key, 0) + 1
+    rows = [FacetRow(*key, n) for key, n in counts.items()]
+    facets = aggregates.facets(rows, filters, {dim: (lambda row, dim=dim: getattr(row, dim)) for dim in FACETS})
+
+    selected = [e for e in entries
+                if all(filters.get(dim, 'all') in ('all', getattr(e, dim)) for dim in FACETS)]
+    return SiteResult(keyword, selected, facets)
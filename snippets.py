@@ -0,0 +1,145 @@
+"""
+高亮 / 摘录
+
+- highlight()：给文本里的关键词 (简繁体都算) 加高亮标签，正则按关键词缓存，只编译一次
+- sentence_bounds()：找命中位置所在的句子，用预编译的标点正则一次定位，不再逐字往前往后走
+- make_snippet() / pick_offsets()：一篇作品可以取多段摘录，前后保留的字数可以配置
+"""
+import re
+from functools import lru_cache
+
+from markupsafe import Markup, escape
+
+import search_query
+import zh_convert
+
+SENTENCE_DELIMS = '。！？\n!?'
+_NEXT_DELIM = re.compile('[' + re.escape(SENTENCE_DELIMS) + ']')
+_LAST_DELIM = re.compile('.*[' + re.escape(SENTENCE_DELIMS) + ']', re.S)
+
+# 句子太长时只保留关键词前后各 DEFAULT_CONTEXT 个字；句子最长 3 倍 (默认 150 字)
+DEFAULT_CONTEXT = 50
+
+_HIGHLIGHT = Markup('<span class="highlight">%s</span>')
+
+def max_sentence_len(context=DEFAULT_CONTEXT):
+    return context * 3
+
+def window_radius(context=DEFAULT_CONTEXT):
+    """判断句子边界需要看命中位置前后多少字 (从数据库截取窗口用)"""
+    return max_sentence_len(context) + 10
+
+# ============================================
+# 1. 高亮
+# ============================================
+
+@lru_cache(maxsize=1024)
+def keyword_pattern(keyword):
+    """
+    检索框里的内容 (可能带 AND / OR / 短语等语法) 中所有正向检索词的简体、繁体写法
+    合成一个正则 (不区分大小写)，按关键词缓存
+    """
+    forms = set()
+    for term in search_query.parse(keyword).terms:
+        forms.update(zh_convert.keyword_forms(term))
+    forms = sorted((f for f in forms if f), key=len, reverse=True)
+    if not forms:
+        return None
+    return re.compile('|'.join(re.escape(f) for f in forms), re.IGNORECASE)
+
+def mark(s, spans):
+    """把 s 里的 spans [(起始下标, 长度)] 包上高亮标签 (其余部分转义)"""
+    parts = []
+    last = 0
+    for start, length in spans:
+        if start < last:
+            continue
+        parts.append(escape(s[last:start]))
+        parts.append(_HIGHLIGHT % s[start:start + length])
+        last = start + length
+    parts.append(escape(s[last:]))
+    return Markup('').join(parts)
+
+def highlight(text, keyword):
+    """给文本中的关键词加上红色高亮标签"""
+    if not keyword or not text:
+        return text
+    pattern = keyword_pattern(keyword)
+    if pattern is None:
+        return escape(text)
+    parts = []
+    last = 0
+    for m in pattern.finditer(text):
+        parts.append(escape(text[last:m.start()]))
+        parts.append(_HIGHLIGHT % m.group())
+        last = m.end()
+    if not parts:
+        return escape(text)
+    parts.append(escape(text[last:]))
+    return Markup('').join(parts)
+
+# ============================================
+# 2. 摘录
+# ============================================
+
+def sentence_bounds(content, idx, context=DEFAULT_CONTEXT):
+    """
+    功能：取出下标 idx 所在的句子，返回 (start, end, 是否截断)。
+    句子超过 3 * context 字时只取关键词前后各 context 字。
+    只在 idx 附近有限的范围里找标点，文章再长也不影响速度。
+    """
+    max_len = max_sentence_len(context)
+    total_len = len(content)
+
+    lo = max(0, idx - max_len - 1)
+    m = _LAST_DELIM.match(content, lo, idx + 1)
+    start = m.end() if m else lo
+
+    m = _NEXT_DELIM.search(content, idx, idx + max_len + 1)
+    end = m.end() if m else min(total_len, idx + max_len + 1)
+
+    # 相当于 strip()，但保留下标
+    while start < end and content[start].isspace():
+        start += 1
+    while end > start and content[end - 1].isspace():
+        end -= 1
+
+    if end - start > max_len:
+        return max(0, idx - context), min(total_len, idx + context), True
+    return start, end, False
+
+def pick_offsets(spans, limit=1, context=DEFAULT_CONTEXT):
+    """
+    功能：从命中位置 [(起始下标, 长度)] 里挑出最多 limit 个起始下标做摘录。
+    后一个至少和前一个隔开一整句的长度，保证不会落在同一段摘录里。
+    """
+    gap = max_sentence_len(context) + 1
+    picked = []
+    for offset, _ in spans:
+        if not picked or offset >= picked[-1] + gap:
+            picked.append(offset)
+            if len(picked) >= limit:
+                break
+    return picked
+
+def make_snippet(content, idx, spans, context=DEFAULT_CONTEXT):
+    """
+    功能：以 content[idx] 处的命中为中心截一段摘录，并高亮其中所有命中 (spans 相对 content)。
+    返回 Markup；被截断的句子前后加省略号。
+    """
+    start, end, cut = sentence_bounds(content, idx, context)
+    inside = [(o - start, n) for o, n in spans if start <= o and o + n <= end]
+    snippet = mark(content[start:end], inside)
+    return Markup('...') + snippet + Markup('...') if cut else snippet
+
+def extract_sentence(content, keyword, context=DEFAULT_CONTEXT):
+    """在正文中找到关键词第一次出现的句子，返回纯文本 (找不到返回 None)"""
+    if not keyword or not content:
+        return None
+    pattern = keyword_pattern(keyword)
+    m = pattern.search(content) if pattern is not None else None
+    if m is None:
+        return None
+    start, end, cut = sentence_bounds(content, m.start(), context)
+    sentence = content[start:end]
+    return '...' + sentence + '...' if cut else sentence
@@ -0,0 +1,199 @@
+/* =========================================
+   静态导出版 (flask export) 的页面脚本
+   1. 接管 /creation、/materials 的筛选表单：按和 export_site.py 相同的规则
+      整理参数，到 /_export/routes.json 里查出对应的静态文件
+   2. 带关键词的检索跳到 /search.html，在浏览器里用 /_export/search/ 下的分片数据检索
+   ========================================= */
+var StaticExport = (function () {
+    var DEFAULT_ARGS = { author: 'all', genre: 'all', year: 'all', publication: 'all' };
+    var DROPPED_ARGS = { stream: true };
+    var routes = null;
+
+    function getJSON(url) {
+        return fetch(url).then(function (r) { return r.json(); });
+    }
+
+    function loadRoutes() {
+        if (!routes) routes = getJSON('/_export/routes.json');
+        return routes;
+    }
+
+    /* 和 export_site.canonical() / route_key() 一致 */
+    function routeKey(path, pairs) {
+        var args = pairs.filter(function (p) {
+            return !DROPPED_ARGS[p[0]] && p[1] !== '' && DEFAULT_ARGS[p[0]] !== p[1];
+        });
+        args.sort(function (a, b) {
+            return a[0] < b[0] ? -1 : a[0] > b[0] ? 1 : (a[1] < b[1] ? -1 : a[1] > b[1] ? 1 : 0);
+        });
+        if (!args.length) return path;
+        return path + '?' + args.map(function (p) { return p[0] + '=' + p[1]; }).join('&');
+    }
+
+    function formPairs(form) {
+        var pairs = [];
+        new FormData(form).forEach(function (value, key) { pairs.push([key, String(value).trim()]); });
+        return pairs;
+    }
+
+    function navigate(form) {
+        var path = form.getAttribute('action') || location.pathname;
+        var pairs = formPairs(form);
+        var hasQuery = pairs.some(function (p) { return p[0] === 'q' && p[1] !== ''; });
+        if (path === '/creation' && hasQuery) {
+            location.href = '/search.html?' + new URLSearchParams(pairs).toString();
+            return;
+        }
+        loadRoutes().then(function (table) {
+            // 没有导出的组合 (没有结果) 退回不带参数的页面
+            location.href = table[routeKey(path, pairs)] || table[path] || '/';
+        });
+    }
+
+    function handles(form) {
+        var action = form.getAttribute('action');
+        return action === '/creation' || action === '/materials';
+    }
+
+    document.addEventListener('submit', function (e) {
+        if (handles(e.target)) {
+            e.preventDefault();
+            navigate(e.target);
+        }
+    });
+
+    // onchange="this.form.submit()" 不会触发 submit 事件，这里一并接管
+    var nativeSubmit = HTMLFormElement.prototype.submit;
+    HTMLFormElement.prototype.submit = function () {
+        if (handles(this)) navigate(this);
+        else nativeSubmit.call(this);
+    };
+
+    /* =========================================
+       浏览器端检索
+       ========================================= */
+
+    function escapeHTML(s) {
+        return s.replace(/[&<>"']/g, function (c) {
+            return { '&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;' }[c];
+        });
+    }
+
+    /* 和 zh_convert.fold() 一样：逐字转简体 + 英文小写，长度不变 */
+    function makeFold(table) {
+        return function (s) {
+            var out = '';
+            for (var i = 0; i < s.length; i++) {
+                var c = s.charAt(i);
+                out += table[c] || c;
+            }
+            return out;
+        };
+    }
+
+    /* 空格分词，"短语" 当作一个词，-词 表示排除 */
+    function parseQuery(q, fold) {
+        var terms = [], excluded = [];
+        var re = /(-?)"([^"]*)"?|(-?)(\S+)/g, m;
+        while ((m = re.exec(q))) {
+            var neg = m[1] || m[3];
+            var text = fold((m[2] !== undefined ? m[2] : m[4]).trim());
+            if (!text || text === 'AND') continue;
+            (neg ? excluded : terms).push(text);
+        }
+        return { terms: terms, excluded: excluded };
+    }
+
+    function findAll(haystack, term) {
+        var out = [], i = haystack.indexOf(term);
+        while (i !== -1) {
+            out.push(i);
+            i = haystack.indexOf(term, i + term.length);
+        }
+        return out;
+    }
+
+    function mark(text, spans) {
+        spans.sort(function (a, b) { return a[0] - b[0]; });
+        var html = '', last = 0;
+        spans.forEach(function (s) {
+            if (s[0] < last) return;
+            html += escapeHTML(text.slice(last, s[0])) +
+                '<span class="highlight">' + escapeHTML(text.slice(s[0], s[0] + s[1])) + '</span>';
+            last = s[0] + s[1];
+        });
+        return html + escapeHTML(text.slice(last));
+    }
+
+    function snippet(content, folded, first, terms) {
+        var start = Math.max(0, first - 50), end = Math.min(content.length, first + 50);
+        var spans = [];
+        terms.forEach(function (t) {
+            findAll(folded.slice(start, end), t).forEach(function (i) { spans.push([i, t.length]); });
+        });
+        return mark(content.slice(start, end), spans);
+    }
+
+    function search(works, query, fold) {
+        var results = [];
+        works.forEach(function (w) {
+            var title = fold(w[1]), content = fold(w[4]);
+            var score = 0, titleSpans = [], first = -1;
+            for (var i = 0; i < query.terms.length; i++) {
+                var t = query.terms[i];
+                var inTitle = findAll(title, t), inContent = findAll(content, t);
+                if (!inTitle.length && !inContent.length) return;
+                // 标题里的命中权重高一些 (和 search_index.TITLE_WEIGHT 一致)
+                score += inTitle.length * 5 + inContent.length;
+                inTitle.forEach(function (p) { titleSpans.push([p, t.length]); });
+                if (inContent.length && (first === -1 || inContent[0] < first)) first = inContent[0];
+            }
+            for (var j = 0; j < query.excluded.length; j++) {
+                var x = query.excluded[j];
+                if (title.indexOf(x) !== -1 || content.indexOf(x) !== -1) return;
+            }
+            results.push({ work: w, score: score, titleHTML: mark(w[1], titleSpans),
+                           snippet: first === -1 ? '' : snippet(w[4], content, first, query.terms) });
+        });
+        results.sort(function (a, b) { return b.score - a.score || a.work[0] - b.work[0]; });
+        return results;
+    }
+
+    function render(results) {
+        document.getElementById('static-search-title').textContent = '—— 检索结果 (共 ' + results.length + ' 条) ——';
+        var box = document.getElementById('static-search-results');
+        if (!results.length) {
+            box.innerHTML = '<div class="no-result">未找到相关文章，请尝试其他关键词。</div>';
+            return;
+        }
+        box.innerHTML = results.map(function (r) {
+            return '<div class="work-line"><a href="/article/' + r.work[0] + '.html" class="work-title-link">' +
+                r.titleHTML + '</a>' +
+                (r.snippet ? '<div class="search-snippet"><span class="snippet-label">[摘录]</span> ...' +
+                             r.snippet + '...</div>' : '') + '</div>';
+        }).join('');
+    }
+
+    function runSearch() {
+        var params = new URLSearchParams(location.search);
+        var q = params.get('q') || '', author = params.get('author') || 'all';
+        var form = document.getElementById('static-search-form');
+        form.q.value = q;
+        form.author.value = author;
+        if (!q.trim()) return;
+
+        Promise.all([getJSON('/_export/search/fold.json'), getJSON('/_export/search/index.json')]).then(function (data) {
+            var fold = makeFold(data[0]), index = data[1];
+            var authors = author === 'all' ? Object.keys(index) : [author].filter(function (a) { return index[a]; });
+            return Promise.all(authors.map(function (a) {
+                return getJSON(index[a].url + '?v=' + index[a].hash);
+            })).then(function (shards) {
+                var works = [];
+                shards.forEach(function (s) { works = works.concat(s.works); });
+                render(search(works, parseQuery(q, fold), fold));
+            });
+        });
+    }
+
+    return { routeKey: routeKey, runSearch: runSearch };
+})();
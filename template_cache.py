@@ -0,0 +1,76 @@
+"""
+模板编译缓存 + 启动预热
+
+map.html 有 700 多 KB，Jinja 第一次用到时要花 100 多毫秒把它编译成 Python 代码，
+每个 gunicorn worker 都要编译一遍，刚启动 (或 max_requests 重启) 的 worker 接的第一批请求就会慢。
+
+- 编译结果 (字节码) 存到 instance/jinja_cache/ (TEMPLATE_CACHE_DIR)，所有 worker、重启之后都能直接用；
+  缓存键里有模板源码的校验和，模板改了自动重新编译
+- TEMPLATE_WARMUP 打开时，创建应用时就把所有模板编译好，并把静态页面渲染、压缩好 (precompress.py)；
+  配合 gunicorn 的 preload_app，这些都在主进程里做一次，fork 出来的 worker 直接共用
+- `flask --app app warm-templates`：部署时预先生成字节码缓存，并打印每个模板的编译时间
+启动和第一个请求的耗时见 benchmarks/bench_startup.py。
+"""
+import os
+import time
+
+import click
+from jinja2 import FileSystemBytecodeCache
+
+class TemplateCache:
+    """
+    功能：给 app.jinja_env 装上磁盘字节码缓存；可选的启动预热。
+    配置项：TEMPLATE_CACHE_DIR (默认 instance/jinja_cache，设成 False 关闭), TEMPLATE_WARMUP
+    """
+
+    def __init__(self, app=None, precompressed=None):
+        self.app = None
+        self.precompressed = None
+        self.directory = None
+        if app is not None:
+            self.init_app(app, precompressed)
+
+    def init_app(self, app, precompressed=None):
+        self.app = app
+        self.precompressed = precompressed
+        app.config.setdefault('TEMPLATE_CACHE_DIR', None)
+        app.config.setdefault('TEMPLATE_WARMUP', False)
+        directory = app.config['TEMPLATE_CACHE_DIR']
+        if directory is not False:
+            self.directory = directory or os.path.join(app.instance_path, 'jinja_cache')
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                app.jinja_env.bytecode_cache = FileSystemBytecodeCache(self.directory)
+            except OSError:
+                # 只读部署 (目录建不了) 时照常每个 worker 自己编译
+                self.directory = None
+        app.cli.add_command(self.warm_command())
+
+    def warm_up(self, pages=True):
+        """
+        功能：编译所有模板 (写入字节码缓存)；pages=True 时再把静态页面渲染好。
+        返回 {模板名: 毫秒}
+        """
+        env = self.app.jinja_env
+        timings = {}
+        for name in sorted(env.list_templates(extensions=('html',))):
+            started = time.perf_counter()
+            env.get_template(name)
+            timings[name] = (time.perf_counter() - started) * 1000
+        if pages and self.precompressed is not None:
+            with self.app.test_request_context('/'):
+                for name in self.precompressed.known_pages():
+                    self.precompressed.prerender(name)
+        return timings
+
+    def warm_command(self):
+        @click.command('warm-templates')
+        def warm_templates():
+            """编译所有模板并写入字节码缓存 (部署时运行一次)"""
+            if self.directory is None:
+                click.echo('⚠️ 没有开启字节码缓存 (TEMPLATE_CACHE_DIR=false)')
+            timings = self.warm_up(pages=False)
+            for name, ms in sorted(timings.items(), key=lambda item: -item[1]):
+                click.echo(f'   {name:40s} {ms:8.1f} ms')
+            click.echo(f'✅ {len(timings)} 个模板，共 {sum(timings.values()):.0f} ms -> {self.directory}')
+        return warm_templates
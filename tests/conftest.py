@@ -0,0 +1,31 @@
+"""
+测试共用的设置：导入 app 之前把数据库换成临时副本 (instance/works.db 不会被改动)，
+页面缓存用进程内的内存缓存，每个测试开始前清空。
+"""
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+_tmp = tempfile.mkdtemp(prefix='works-test-')
+atexit.register(shutil.rmtree, _tmp, ignore_errors=True)
+shutil.copy(os.path.join(ROOT, 'instance', 'works.db'), os.path.join(_tmp, 'works.db'))
+os.environ['FLASK_SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(_tmp, 'works.db')
+os.environ['FLASK_CACHE_DIR'] = 'null'
+os.environ['FLASK_TEMPLATE_WARMUP'] = 'false'
+
+@pytest.fixture
+def app():
+    from app import app, response_cache
+    response_cache.memory.clear()
+    return app
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
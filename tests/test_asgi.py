@@ -0,0 +1,140 @@
+"""
+asgi.py 在 uvicorn 下的端到端测试：起一个真正的 uvicorn 进程 (数据库用临时副本)，用 HTTP 请求检查
+
+    python -m pytest tests/test_asgi.py
+"""
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+pytest.importorskip('uvicorn')
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def _large_static_file():
+    """static/ 下一个够大、不会被压缩 (交给 large_files.py) 的文件"""
+    for dirpath, _, files in os.walk(os.path.join(ROOT, 'static', 'materials')):
+        for name in sorted(files):
+            path = os.path.join(dirpath, name)
+            if name.lower().endswith(('.pdf', '.jpg', '.png')) and os.path.getsize(path) > 300 * 1024:
+                return path
+    pytest.skip('static/materials 下没有大文件')
+
+@pytest.fixture(scope='module')
+def server(tmp_path_factory):
+    tmp = tmp_path_factory.mktemp('asgi')
+    db = tmp / 'works.db'
+    shutil.copy(os.path.join(ROOT, 'instance', 'works.db'), db)
+    port = _free_port()
+    env = dict(os.environ,
+               PYTHONPATH=ROOT,
+               ASGI_THREADS='4',
+               FLASK_SQLALCHEMY_DATABASE_URI=f'sqlite:///{db}',
+               FLASK_CACHE_ENABLED='false')
+    proc = subprocess.Popen([sys.executable, '-m', 'uvicorn', 'asgi:application',
+                             '--host', '127.0.0.1', '--port', str(port), '--log-level', 'warning'],
+                            cwd=ROOT, env=env)
+    base = f'http://127.0.0.1:{port}'
+    try:
+        for _ in range(100):
+            try:
+                urllib.request.urlopen(base + '/', timeout=2).read()
+                break
+            except (urllib.error.URLError, ConnectionError):
+                if proc.poll() is not None:
+                    pytest.fail('uvicorn 没有启动起来')
+                time.sleep(0.2)
+        else:
+            pytest.fail('uvicorn 启动超时')
+        yield base
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+
+def get(url, headers=None):
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, headers=headers or {}), timeout=30) as r:
+            return r.status, r.headers, r.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.headers, e.read()
+
+def test_pages(server):
+    status, headers, body = get(server + '/')
+    assert status == 200
+    assert headers['Content-Type'].startswith('text/html')
+    assert b'</html>' in body
+
+    status, _, body = get(server + '/creation?mode=search&q=' + quote('南洋'))
+    assert status == 200
+    assert '南洋'.encode('utf-8') in body
+
+    status, _, _ = get(server + '/no-such-page')
+    assert status == 404
+
+def test_query_string(server):
+    status, _, body = get(server + '/creation?author=yingzi')
+    assert status == 200
+    assert body
+
+def test_large_file_range(server):
+    path = _large_static_file()
+    url = server + '/static/' + quote(os.path.relpath(path, os.path.join(ROOT, 'static')).replace(os.sep, '/'))
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    status, headers, body = get(url)
+    assert status == 200
+    assert body == data
+
+    # Range 只发请求的那一段，不多发
+    status, headers, body = get(url, {'Range': 'bytes=1000-1999'})
+    assert status == 206
+    assert headers['Content-Range'] == f'bytes 1000-1999/{len(data)}'
+    assert body == data[1000:2000]
+
+    status, _, body = get(url, {'Range': f'bytes={len(data) - 10}-'})
+    assert status == 206
+    assert body == data[-10:]
+
+def test_too_many_duplicate_headers(server):
+    port = int(server.rsplit(':', 1)[1])
+    request = b'GET / HTTP/1.1\r\nHost: localhost\r\n' + b'X-Dup: 1\r\n' * 101 + b'Connection: close\r\n\r\n'
+    with socket.create_connection(('127.0.0.1', port), timeout=10) as s:
+        s.sendall(request)
+        reply = s.recv(64)
+    assert reply.startswith(b'HTTP/1.1 400')
+
+def test_concurrent_requests(server):
+    """检索和文章页同时进来，在线程池里并发执行，都能正常返回"""
+    urls = [server + '/creation?mode=search&q=' + quote('南洋')] * 4 + [server + '/article/1'] * 8
+    with ThreadPoolExecutor(max_workers=len(urls)) as pool:
+        statuses = [status for status, _, _ in pool.map(get, urls)]
+    assert statuses == [200] * len(urls)
+
+def test_repeated_cookie_headers():
+    """HTTP/2 等会把 Cookie 拆成多个头，拼回去要用 "; " (RFC 6265)，其他头用逗号"""
+    from werkzeug.wrappers import Request
+
+    import asgi
+
+    scope = {'type': 'http', 'method': 'GET', 'path': '/', 'query_string': b'', 'http_version': '2',
+             'headers': [(b'cookie', b'a=1'), (b'cookie', b'b=2; c=3'),
+                         (b'accept', b'text/html'), (b'accept', b'*/*')]}
+    environ = asgi.build_environ(scope, None)
+    assert environ['HTTP_COOKIE'] == 'a=1; b=2; c=3'
+    assert environ['HTTP_ACCEPT'] == 'text/html,*/*'
+    assert Request(environ).cookies.to_dict() == {'a': '1', 'b': '2', 'c': '3'}
@@ -0,0 +1,45 @@
+"""
+页面缓存 (cache.py)：缓存键、LRU 淘汰
+
+    python -m pytest tests/test_cache.py
+"""
+import re
+
+from cache import DiskCache, request_args
+
+def _work_count(html):
+    return len(re.findall(r'href="/article/\d+', html))
+
+def test_request_args_keeps_empty_values(app):
+    with app.test_request_context('/creation?b=2&a=1&author=&stream=1'):
+        assert request_args(('stream',)) == (('a', '1'), ('author', ''), ('b', '2'))
+    with app.test_request_context('/creation?a=1&b=2'):
+        assert request_args() == (('a', '1'), ('b', '2'))
+
+def test_empty_filter_does_not_share_cache(client):
+    # author= 是真的筛选条件 (0 条)，不能和不带 author 的页面共用缓存
+    empty = client.get('/creation?mode=search&author=').get_data(as_text=True)
+    plain = client.get('/creation?mode=search').get_data(as_text=True)
+    assert _work_count(empty) == 0
+    assert _work_count(plain) > 0
+
+    empty = client.get('/materials?author=').get_data(as_text=True)
+    plain = client.get('/materials').get_data(as_text=True)
+    assert empty != plain
+
+def test_argument_order_shares_cache(app, client):
+    from app import response_cache
+    client.get('/creation?mode=search&author=yingzi')
+    hits = response_cache.memory.hits
+    client.get('/creation?author=yingzi&mode=search')
+    assert response_cache.memory.hits == hits + 1
+
+def test_disk_cache_evicts_least_recently_used(tmp_path):
+    cache = DiskCache(str(tmp_path), ttl=3600, max_bytes=10_000)
+    cache.set('v1', 'hot', b'x' * 3000)
+    for i in range(6):
+        cache.get('v1', 'hot')
+        cache.set('v1', f'cold-{i}', b'y' * 3000)
+    assert cache.get('v1', 'hot') == b'x' * 3000
+    assert cache.evictions > 0
+    assert cache.stats()['bytes'] <= 10_000
@@ -0,0 +1,46 @@
+"""
+筛选项计数：aggregates.facets() 和 /creation 有检索词时的计数
+
+    python -m pytest tests/test_facets.py
+"""
+from urllib.parse import quote
+
+import aggregates
+import search_index
+from aggregates import WorkCount
+
+ROWS = [WorkCount('a', '诗', 1939, 3), WorkCount('a', '散文', 1940, 2),
+        WorkCount('b', '诗', 1939, 4), WorkCount('b', '诗', 0, 1)]
+KEYS = {'author': lambda row: row.author, 'genre': lambda row: row.genre,
+        'year': lambda row: aggregates.year_key(row.year)}
+
+def test_facets_without_filters():
+    facets = aggregates.facets(ROWS, {'author': 'all', 'genre': 'all', 'year': 'all'}, KEYS)
+    assert facets['author'] == {'a': 5, 'b': 5}
+    assert facets['genre'] == {'诗': 8, '散文': 2}
+    assert facets['year'] == {'1939': 7, '1940': 2, 'unknown': 1}
+
+def test_facets_ignore_own_dimension():
+    # 每个维度的计数只受其他维度的筛选影响
+    facets = aggregates.facets(ROWS, {'author': 'a', 'genre': '诗', 'year': 'all'}, KEYS)
+    assert facets['author'] == {'a': 3, 'b': 5}
+    assert facets['genre'] == {'诗': 3, '散文': 2}
+    assert facets['year'] == {'1939': 3}
+
+def _total(client, query):
+    return client.get('/api/v1/works?per_page=1&' + query).get_json()['total']
+
+def test_search_facets_match_result_totals(client):
+    q = quote('南洋')
+    facets = client.get(f'/api/v1/works/facets?q={q}').get_json()['facets']
+    assert sum(facets['author'].values()) == _total(client, f'q={q}')
+    for author, n in facets['author'].items():
+        assert n == _total(client, f'q={q}&author={author}')
+
+def test_creation_searches_once(client, monkeypatch):
+    calls = []
+    original = search_index.search
+    monkeypatch.setattr(search_index, 'search', lambda *a, **kw: calls.append(1) or original(*a, **kw))
+    response = client.get('/creation?mode=search&q=' + quote('星洲') + '&author=yingzi')
+    assert response.status_code == 200
+    assert len(calls) == 1
@@ -0,0 +1,31 @@
+"""
+JSON 接口 (/api/v1/...)：缓存键、ETag
+
+    python -m pytest tests/test_json_api.py
+"""
+
+def test_empty_filter_has_own_cache_entry_and_etag(client):
+    empty = client.get('/api/v1/works?author=')
+    plain = client.get('/api/v1/works')
+    assert empty.get_json()['total'] == 0
+    assert plain.get_json()['total'] > 0
+    assert empty.headers['ETag'] != plain.headers['ETag']
+
+    # 用空筛选的 ETag 去验证不带参数的地址，不能得到 304
+    response = client.get('/api/v1/works', headers={'If-None-Match': empty.headers['ETag']})
+    assert response.status_code == 200
+
+def test_etag_revalidation(client):
+    first = client.get('/api/v1/works/facets?author=yingzi')
+    assert first.status_code == 200
+    again = client.get('/api/v1/works/facets?author=yingzi', headers={'If-None-Match': first.headers['ETag']})
+    assert again.status_code == 304
+
+def test_version_argument_only_changes_cache_headers(client):
+    first = client.get('/api/v1/works')
+    version = first.get_json()['data_version']
+    pinned = client.get(f'/api/v1/works?v={version}')
+    assert pinned.get_json() == first.get_json()
+    assert pinned.headers['ETag'] == first.headers['ETag']
+    assert 'immutable' in pinned.headers['Cache-Control']
+    assert 'immutable' not in first.headers['Cache-Control']
@@ -0,0 +1,51 @@
+"""
+带版本号的静态文件 (media_index.VersionedStatic)：?v= 和索引里的哈希一致才长期缓存
+
+    python -m pytest tests/test_media_index.py
+"""
+import pytest
+from flask import Flask
+
+import media_index
+
+HASH = 'a' * 12 + 'b' * 28
+
+@pytest.fixture
+def client(tmp_path):
+    static = tmp_path / 'static'
+    (static / 'works').mkdir(parents=True)
+    (static / 'works' / '1.jpg').write_bytes(b'image')
+    (static / 'works' / 'other.jpg').write_bytes(b'image')
+    app = Flask(__name__, static_folder=str(static))
+    versioned = media_index.VersionedStatic(app)
+
+    @versioned.hash_loader
+    def file_hash(path):
+        return {'works/1.jpg': HASH}.get(path)
+
+    return app.test_client()
+
+def _immutable(response):
+    assert response.status_code == 200
+    return 'immutable' in response.headers.get('Cache-Control', '')
+
+def test_current_version_is_immutable(client):
+    response = client.get('/static/works/1.jpg?v=' + HASH[:media_index.VERSION_LENGTH])
+    assert _immutable(response)
+    assert response.cache_control.max_age == media_index.VERSIONED_MAX_AGE
+
+@pytest.mark.parametrize('url', [
+    '/static/works/1.jpg',
+    '/static/works/1.jpg?v=123',  # 旧的 / 随手写的版本号
+    '/static/works/1.jpg?v=' + HASH,  # 整个哈希也不算，地址里只有前 12 位
+    '/static/works/other.jpg?v=' + HASH[:media_index.VERSION_LENGTH],  # 不在索引里
+])
+def test_other_versions_are_not_pinned(client, url):
+    assert not _immutable(client.get(url))
+
+def test_without_hash_loader(tmp_path):
+    (tmp_path / 'static').mkdir()
+    (tmp_path / 'static' / 'a.txt').write_text('x')
+    app = Flask(__name__, static_folder=str(tmp_path / 'static'))
+    media_index.VersionedStatic(app)
+    assert not _immutable(app.test_client().get('/static/a.txt?v=' + HASH[:media_index.VERSION_LENGTH]))
@@ -0,0 +1,83 @@
+"""
+全文检索 (search_index.py)
+
+    python -m pytest tests/test_search_index.py
+"""
+import pytest
+from sqlalchemy import column, create_engine, select, table, text
+
+import search_index
+import search_query
+
+WORKS = [
+    (1, '南洋游记', '在南洋的日子，日记里写满了星洲。'),
+    (2, '星洲日记', '星洲的雨。抗战的消息传来。'),
+    (3, '抗战诗抄', '南洋华侨支援抗战，南洋南洋。'),
+    (4, '杂感', '今天什么也没有写。'),
+    (5, '南，洋', '標點隔開的南，洋；繁體的星洲與南洋。'),
+]
+
+@pytest.fixture(scope='module')
+def conn():
+    engine = create_engine('sqlite://')
+    with engine.connect() as conn:
+        search_index.rebuild(conn, WORKS)
+        yield conn
+
+def _same(a, b):
+    return set(a) == set(b) and all(a[k].count == b[k].count for k in a)
+
+@pytest.mark.parametrize('q', ['南洋', '星洲 抗战', '南洋 OR 星洲', '南洋 -日记', '"南洋南洋"',
+                               '南洋 OR -日记', '(南洋 OR NOT 星洲) 抗战', '星洲 OR NOT 南洋'])
+def test_index_matches_scan(conn, q):
+    parsed = search_query.parse(q)
+    hits = search_index.search(conn, parsed)
+    assert hits is not None # 有索引时不退回 scan()
+    assert _same(hits, search_index.scan(WORKS, parsed))
+
+@pytest.mark.parametrize('q', ['-日记', 'NOT 南洋', 'NOT (南洋 OR 星洲)'])
+def test_no_positive_terms(conn, q):
+    # 只有 NOT 的查询没有结果，也不退回 scan()
+    assert search_index.search(conn, search_query.parse(q)) == {}
+
+def test_punctuation_only_term_falls_back_to_scan(conn):
+    assert search_index.search(conn, search_query.parse('，')) is None
+
+def test_traditional_and_punctuation(conn):
+    hits = search_index.search(conn, search_query.parse('南洋'))
+    # 繁体、标点隔开的 "南，洋" 也算
+    assert 5 in hits
+    assert hits[3].count == 3
+
+def _marked(s):
+    # 和索引里存的一样：字之间隔一个空格，标记符用 search_index 的
+    return s.replace('[', search_index._MARK_OPEN).replace(']', search_index._MARK_CLOSE)
+
+@pytest.mark.parametrize('marked, terms, spans', [
+    ('在 [南 洋] 的', ['南洋'], [(1, 2)]),
+    ('[南 洋] [南 洋]', ['南洋'], [(0, 2), (2, 2)]),
+    ('[南 洋 南 洋]', ['南洋'], [(0, 2), (2, 2)]), # 相邻的命中合成一个区间
+    ('[哈 哈 哈]', ['哈哈'], [(0, 2)]), # 重叠的只算不重叠的
+    ('[南 ， 洋]', ['南洋'], []), # 短语跳过了标点，原文里其实不是这个词
+    ('[南 洋 华 侨]', ['南洋', '南洋华侨'], [(0, 4)]), # 长词优先
+    ('没 有 标 记', ['南洋'], []),
+])
+def test_spans(marked, terms, spans):
+    assert search_index._spans(_marked(marked), search_index.terms_pattern(terms)) == spans
+
+def test_hit_ids_has_no_parameter_limit():
+    engine = create_engine('sqlite://')
+    with engine.connect() as conn:
+        conn.execute(text('CREATE TABLE work (id INTEGER PRIMARY KEY)'))
+        conn.execute(text('INSERT INTO work (id) VALUES (:id)'), [{'id': i} for i in range(1, 100_001)])
+        ids = list(range(2, 100_001, 2)) # 50000 个，超过 SQLite 的参数个数上限 (32766)
+        work = table('work', column('id'))
+        count = conn.execute(select(text('COUNT(*)')).select_from(work)
+                             .where(work.c.id.in_(search_index.hit_ids(conn, ids)))).scalar()
+        assert count == len(ids)
+
+        # 再次调用覆盖上一次的内容；空列表也可以
+        assert conn.execute(select(text('COUNT(*)')).select_from(work)
+                            .where(work.c.id.in_(search_index.hit_ids(conn, [1, 3])))).scalar() == 2
+        assert conn.execute(select(text('COUNT(*)')).select_from(work)
+                            .where(work.c.id.in_(search_index.hit_ids(conn, [])))).scalar() == 0
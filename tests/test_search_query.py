@@ -0,0 +1,69 @@
+"""
+检索语法 (search_query.py)
+
+    python -m pytest tests/test_search_query.py
+"""
+import pytest
+
+import search_query
+from search_query import And, Not, Or, Term
+
+@pytest.mark.parametrize('q, expr', [
+    ('南洋', Term('南洋')),
+    ('南洋 抗战', And([Term('南洋'), Term('抗战')])),
+    ('南洋 AND 抗战', And([Term('南洋'), Term('抗战')])),
+    ('南洋 OR 星洲', Or([Term('南洋'), Term('星洲')])),
+    ('抗战 NOT 日记', And([Term('抗战'), Not(Term('日记'))])),
+    ('抗战 -日记', And([Term('抗战'), Not(Term('日记'))])),
+    ('(南洋 OR 星洲) 抗战', And([Or([Term('南洋'), Term('星洲')]), Term('抗战')])),
+    ('南洋 NOT', Term('南洋')),
+])
+def test_operators(q, expr):
+    assert search_query.parse(q).expr == expr
+
+def test_quoted_phrase():
+    parsed = search_query.parse('"new york" -"old town"')
+    assert parsed.expr == And([Term('new york'), Not(Term('old town'))])
+    assert parsed.terms == ['new york']
+    # 没有闭合的引号到结尾为止
+    assert search_query.parse('"new york').expr == Term('new york')
+
+def test_terms_are_positive_and_unique():
+    parsed = search_query.parse('南洋 OR (星洲 南洋) -日记')
+    assert parsed.terms == ['南洋', '星洲']
+
+@pytest.mark.parametrize('q', ['-日记', 'NOT 南洋', 'NOT (南洋 OR 星洲)'])
+def test_pure_not(q):
+    parsed = search_query.parse(q)
+    assert isinstance(parsed.expr, Not)
+    assert parsed.terms == []
+
+@pytest.mark.parametrize('q, text', [('AND', 'AND'), ('NOT', 'NOT'), ('OR', 'OR'), ('( )', '( )')])
+def test_operators_only_are_literal(q, text):
+    parsed = search_query.parse(q)
+    assert parsed.expr == Term(text)
+    assert parsed.terms == [text]
+
+@pytest.mark.parametrize('q', ['', '   ', '""'])
+def test_empty(q):
+    assert search_query.parse(q) == (None, {}, [])
+
+def test_filters():
+    parsed = search_query.parse('author:莹姿 文类:散文 year:1938-1940 has:图片 南洋')
+    assert parsed.expr == Term('南洋')
+    assert parsed.filters == {'author': 'yingzi', 'genre': '散文', 'year': (1938, 1940), 'images': True}
+    assert search_query.parse('年份：1939').filters == {'year': (1939, 1939)}
+
+@pytest.mark.parametrize('q', ['year:abc', 'has:音乐', 'foo:bar', 'author:'])
+def test_unknown_filters_are_terms(q):
+    parsed = search_query.parse(q)
+    assert parsed.filters == {}
+    assert parsed.expr == Term(q)
+
+def test_match():
+    words = {'南洋', '抗战'}
+    contains = words.__contains__
+    assert search_query.match(search_query.parse('南洋 抗战').expr, contains)
+    assert search_query.match(search_query.parse('星洲 OR 南洋').expr, contains)
+    assert not search_query.match(search_query.parse('南洋 -抗战').expr, contains)
+    assert search_query.match(search_query.parse('NOT 日记').expr, contains)
@@ -0,0 +1,100 @@
+"""
+全站检索 (site_search.py)：作品 + 史料两个索引
+
+    python -m pytest tests/test_site_search.py
+"""
+from collections import namedtuple
+
+import pytest
+from sqlalchemy import create_engine, text
+
+import search_index
+import search_query
+import site_search
+
+# (id, 标题, 作家, 刊物, 文类, 年份, 正文)
+WORKS = [
+    (1, '南洋游记', 'yingzi', '星洲日报', '散文', 1939, '在南洋的日子。南洋南洋。'),
+    (2, '星洲日记', 'wangying', '南洋商报', '散文', 1940, '星洲的雨。南洋的消息传来。'),
+    (3, '抗战诗抄', 'yingzi', '星洲日报', '新体诗', 1938, '今天什么也没有写。'),
+]
+# (id, 标题, 作家, 刊物, 史料 id, 类型, 目录, 文件名, 路径, 哈希, 正文)
+DOCS = [
+    (1, '南洋史料', 'yingzi', '星洲日报', 10, 'txt', '', 'a.txt', 'data/a.txt', 'h1', '南洋的报纸。'),
+    (2, '其他史料', 'shenzijiu', '南洋商报', 11, 'pdf', 'sub', 'b.pdf', 'data/sub/b.pdf', 'h2', '星洲与南洋。'),
+]
+ALL = {dim: 'all' for dim in site_search.FACETS}
+
+@pytest.fixture(scope='module')
+def conn():
+    engine = create_engine('sqlite://')
+    with engine.connect() as conn:
+        conn.execute(text('CREATE TABLE work (id INTEGER PRIMARY KEY, title, author, publication, genre, year, '
+                          'content, image_path)'))
+        conn.execute(text('CREATE TABLE work_image (work_id, path)'))
+        conn.execute(text('CREATE TABLE material_doc (id INTEGER PRIMARY KEY, title, author, publication, '
+                          'material_id, kind, dir, name, path, hash, content)'))
+        conn.execute(text('CREATE TABLE material_file (material_id, kind, path)'))
+        conn.execute(text('INSERT INTO work VALUES (:id, :title, :author, :pub, :genre, :year, :content, NULL)'),
+                     [dict(zip(('id', 'title', 'author', 'pub', 'genre', 'year', 'content'), w)) for w in WORKS])
+        conn.execute(text('INSERT INTO material_doc VALUES (:a, :b, :c, :d, :e, :f, :g, :h, :i, :j, :k)'),
+                     [dict(zip('abcdefghijk', d)) for d in DOCS])
+        conn.execute(text("INSERT INTO work_image VALUES (2, 'x.jpg')"))
+        conn.execute(text("INSERT INTO material_file VALUES (11, 'image', 'y.jpg')"))
+        search_index.rebuild(conn, [(w[0], w[1], w[6]) for w in WORKS])
+        site_search.rebuild_index(conn, [(d[0], d[1], d[10]) for d in DOCS])
+        yield conn
+
+def _search(conn, q, **filters):
+    return site_search.search(conn, search_query.parse(q), dict(ALL, **filters), q)
+
+def _ids(result):
+    return [(e.type, e.id) for e in result.entries]
+
+def test_both_indexes(conn):
+    result = _search(conn, '南洋')
+    assert sorted(_ids(result)) == [('material', 1), ('material', 2), ('work', 1), ('work', 2)]
+    assert result.facets['type'] == {'work': 2, 'material': 2}
+    assert result.facets['author'] == {'yingzi': 2, 'wangying': 1, 'shenzijiu': 1}
+    # 两边的第一名排在最前面 (同分时作品在前)
+    assert _ids(result)[:2] == [('work', 1), ('material', 1)]
+
+def test_filters(conn):
+    result = _search(conn, '南洋', type='material')
+    assert _ids(result) == [('material', 1), ('material', 2)]
+    # 分面计数不受自己这一维筛选的影响
+    assert result.facets['type'] == {'work': 2, 'material': 2}
+    assert _ids(_search(conn, '南洋', author='yingzi')) == [('work', 1), ('material', 1)]
+    # 检索框里的 author: 没有另外选作家时也算数
+    assert _ids(_search(conn, 'author:yingzi 南洋')) == [('work', 1), ('material', 1)]
+
+def test_work_only_filters(conn):
+    # genre: / year: 只有作品有，用了它们就不检索史料
+    assert _ids(_search(conn, '南洋 year:1940')) == [('work', 2)]
+    assert _ids(_search(conn, '星洲 genre:新体诗')) == []
+
+def test_has_images(conn):
+    assert sorted(_ids(_search(conn, '南洋 has:图片'))) == [('material', 2), ('work', 2)]
+
+def test_pure_not_has_no_results(conn):
+    assert _search(conn, '-南洋').entries == []
+
+def test_no_index():
+    engine = create_engine('sqlite://')
+    with engine.connect() as conn:
+        assert _search(conn, '南洋') is None
+
+def test_page_snippets(conn):
+    result = _search(conn, '雨')
+    entry, = result.page(conn, 0)
+    assert entry.result.snippets == ['星洲的<span class="highlight">雨</span>。']
+
+Hit = namedtuple('Hit', ['score'])
+
+def test_relative_scores():
+    entries = [site_search.Entry('work', 'work', i, '', None, None, Hit(score)) for i, score in
+               enumerate([-3.0, -1.0, -3.0, -2.0])]
+    scores = site_search._relative_scores(entries)
+    # bm25 越小越相关；同分的名次相同
+    assert [scores[e] for e in entries] == [0, 0.75, 0, 0.5]
+    assert site_search._relative_scores([]) == {}
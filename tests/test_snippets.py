@@ -0,0 +1,50 @@
+"""
+高亮 / 摘录 (snippets.py)
+
+    python -m pytest tests/test_snippets.py
+"""
+from markupsafe import Markup
+
+import snippets
+
+def test_highlight_escapes_and_marks_both_scripts():
+    out = snippets.highlight('<b>南洋</b>與南洋', '南洋 与')
+    assert isinstance(out, Markup)
+    assert out == ('&lt;b&gt;<span class="highlight">南洋</span>&lt;/b&gt;'
+                   '<span class="highlight">與</span><span class="highlight">南洋</span>')
+
+def test_highlight_ignores_excluded_terms():
+    assert snippets.highlight('南洋日记', '南洋 -日记') == '<span class="highlight">南洋</span>日记'
+    # 只有 NOT 的检索词不高亮任何东西，但仍然转义
+    assert snippets.highlight('<日记>', '-日记') == '&lt;日记&gt;'
+
+def test_mark_skips_overlapping_spans():
+    assert snippets.mark('abcd', [(0, 2), (1, 2), (3, 1)]) == (
+        '<span class="highlight">ab</span>c<span class="highlight">d</span>')
+
+def test_sentence_bounds():
+    content = '第一句。  在南洋的日子！第三句'
+    start, end, cut = snippets.sentence_bounds(content, content.index('南洋'))
+    assert (content[start:end], cut) == ('在南洋的日子！', False)
+    # 最后一句没有标点，到结尾为止
+    start, end, cut = snippets.sentence_bounds(content, content.index('第三'))
+    assert (content[start:end], cut) == ('第三句', False)
+
+def test_long_sentence_is_cut():
+    content = '长' * 200 + '南洋' + '长' * 200
+    idx = content.index('南洋')
+    assert snippets.sentence_bounds(content, idx, context=10) == (idx - 10, idx + 10, True)
+    snippet = snippets.make_snippet(content, idx, [(idx, 2)], context=10)
+    assert snippet == '...' + '长' * 10 + '<span class="highlight">南洋</span>' + '长' * 8 + '...'
+
+def test_pick_offsets_one_per_sentence():
+    gap = snippets.max_sentence_len(10) + 1
+    spans = [(0, 2), (5, 2), (gap, 2), (gap + 1, 2), (2 * gap + 3, 2)]
+    assert snippets.pick_offsets(spans, limit=3, context=10) == [0, gap, 2 * gap + 3]
+    assert snippets.pick_offsets(spans, limit=1, context=10) == [0]
+
+def test_extract_sentence():
+    content = '第一句。在南洋的日子！第三句'
+    assert snippets.extract_sentence(content, '南洋') == '在南洋的日子！'
+    assert snippets.extract_sentence(content, '星洲') is None
+    assert snippets.extract_sentence(content, '') is None
@@ -0,0 +1,93 @@
+"""
+缩略图：原图正常时生成 WebP，原图损坏时改发原图 (不报 500)
+
+    python -m pytest tests/test_thumbnails.py
+"""
+import errno
+import os
+import shutil
+
+import pytest
+from flask import Flask
+from PIL import Image
+
+from thumbnails import Thumbnails
+
+SIZE = 320
+
+@pytest.fixture
+def static_dir(tmp_path):
+    static = tmp_path / 'static'
+    (static / 'images').mkdir(parents=True)
+    Image.new('RGB', (1200, 800), (200, 120, 40)).save(static / 'images' / 'good.jpg', 'JPEG')
+    # 扩展名是 .jpg，内容不是图片
+    (static / 'images' / 'garbage.jpg').write_bytes(b'not an image at all' * 100)
+    # 真的 JPEG，但只剩前一半
+    with open(static / 'images' / 'good.jpg', 'rb') as f:
+        data = f.read()
+    (static / 'images' / 'truncated.jpg').write_bytes(data[:len(data) // 2])
+    return static
+
+@pytest.fixture
+def thumbs(static_dir, tmp_path):
+    app = Flask(__name__, static_folder=str(static_dir))
+    app.config['THUMB_DIR'] = str(tmp_path / 'thumbs')
+    with app.test_request_context():
+        yield Thumbnails(app)
+
+def test_good_image(thumbs):
+    path, etag = thumbs.get('images/good.jpg', SIZE)
+    assert etag
+    with Image.open(path) as img:
+        assert img.format == 'WEBP'
+        assert img.width == SIZE
+
+@pytest.mark.parametrize('name', ['images/garbage.jpg', 'images/truncated.jpg'])
+def test_broken_image_falls_back_to_original(thumbs, static_dir, name):
+    path, etag = thumbs.get(name, SIZE)
+    assert etag is None
+    assert os.path.samefile(path, static_dir / name)
+    assert thumbs.failures == 1
+    # 第二次不再重新尝试
+    assert thumbs.get(name, SIZE) == (path, None)
+    assert thumbs.failures == 1
+    # 缓存目录里没有留下临时文件
+    leftovers = [f for _, _, files in os.walk(thumbs.directory) for f in files]
+    assert leftovers == []
+
+def test_write_error_is_not_recorded_as_broken(thumbs, monkeypatch):
+    # 磁盘满 / 没有权限：报错，但不把原图记成坏的，空间腾出来以后照常生成
+    def disk_full(self, fp, *args, **kwargs):
+        raise OSError(errno.ENOSPC, 'No space left on device')
+    monkeypatch.setattr(Image.Image, 'save', disk_full)
+    with pytest.raises(OSError):
+        thumbs.get('images/good.jpg', SIZE)
+    assert thumbs.failures == 0
+    leftovers = [f for _, _, files in os.walk(thumbs.directory) for f in files]
+    assert leftovers == []
+
+    monkeypatch.undo()
+    path, etag = thumbs.get('images/good.jpg', SIZE)
+    assert etag is not None
+    assert path.endswith('.webp')
+
+def test_replaced_image_is_retried(thumbs, static_dir):
+    assert thumbs.get('images/garbage.jpg', SIZE)[1] is None
+    shutil.copy(static_dir / 'images' / 'good.jpg', static_dir / 'images' / 'garbage.jpg')
+    os.utime(static_dir / 'images' / 'garbage.jpg', ns=(1, 1))
+    path, etag = thumbs.get('images/garbage.jpg', SIZE)
+    assert etag is not None
+    assert path.endswith('.webp')
+
+def test_route_redirects_to_original(client, static_dir, monkeypatch):
+    from app import thumbnails
+    monkeypatch.setattr(thumbnails, 'static_folder', str(static_dir))
+    monkeypatch.setattr(thumbnails, 'directory', str(static_dir.parent / 'route-thumbs'))
+
+    response = client.get(f'/thumb/{SIZE}/images/garbage.jpg')
+    assert response.status_code == 302
+    assert response.headers['Location'].endswith('/static/images/garbage.jpg')
+
+    response = client.get(f'/thumb/{SIZE}/images/good.jpg')
+    assert response.status_code == 200
+    assert response.mimetype == 'image/webp'
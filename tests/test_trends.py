@@ -0,0 +1,58 @@
+"""
+关键词趋势 (trends.py)：计数和直接在正文里 re.findall (不重叠) 数出来的一样
+
+    python -m pytest tests/test_trends.py
+"""
+import re
+
+import pytest
+from sqlalchemy import create_engine
+
+import search_index
+import trends
+from zh_convert import fold
+
+# (id, 正文, 年份, 作家)
+ROWS = [
+    (1, '南洋的雨。哈哈哈，南洋南洋！', 1938, 'a'),
+    (2, '星洲  日记\n南 洋 (空白隔开的不算)。哈哈哈哈', 1938, 'b'),
+    (3, '繁體的南洋與星洲日記，星洲日记又一篇', 1939, 'a'),
+    (4, '', 0, 'b'),
+]
+
+@pytest.fixture(scope='module')
+def index():
+    return trends.TrendIndex(trends.build(ROWS))
+
+@pytest.fixture(scope='module')
+def conn():
+    engine = create_engine('sqlite://')
+    with engine.connect() as conn:
+        search_index.rebuild(conn, [(work_id, '', content) for work_id, content, _, _ in ROWS])
+        yield conn
+
+def _expected(keyword):
+    return [len(re.findall(re.escape(fold(keyword)), fold(content))) for _, content, _, _ in ROWS]
+
+@pytest.mark.parametrize('keyword', ['南洋', '南', '星洲', '日记', '日記', '洲日记', '雨'])
+def test_short_keywords_match_findall(index, keyword):
+    # 3 字以内、自身不重叠：直接查矩阵，不用全文索引
+    assert index.doc_counts(keyword).tolist() == _expected(keyword)
+
+@pytest.mark.parametrize('keyword', ['哈哈', '哈哈哈', '星洲日记', '南洋南洋'])
+def test_other_keywords_use_index(index, conn, keyword):
+    assert index.doc_counts(keyword) is None # 没有全文索引时不硬算
+    assert index.doc_counts(keyword, conn).tolist() == _expected(keyword)
+
+def test_trend_by_year(index):
+    result = index.trend(['南洋'], by='year')
+    assert result['labels'] == [1938, 1939]
+    counts = _expected('南洋')
+    assert result['series'][0]['counts'] == [counts[0] + counts[1], counts[2]]
+    assert result['series'][0]['works'] == [1, 1]
+    # 字数不算空白
+    assert result['sizes'][1] == len(re.sub(r'\s', '', ROWS[2][1]))
+
+def test_split_keywords():
+    assert trends.split_keywords('南洋，星洲 南洋、"日记"') == ['南洋', '星洲', '日记']
+    assert len(trends.split_keywords(' '.join(str(i) for i in range(20)))) == trends.MAX_KEYWORDS
@@ -0,0 +1,241 @@
+"""
+缩略图 (/thumb/<宽度>/<路径>)
+
+画廊里的扫描件原图动辄几 MB，页面上先显示缩略图，点开再看原图。
+- 第一次请求时用 Pillow 生成，存到 instance/thumbs/ (所有 worker 共用)
+- 磁盘缓存有总大小上限，超出后按最近访问时间 (文件 mtime，命中时会更新) 淘汰最久没用的
+- compress_images.py 已经生成过同宽度的 WebP 版本时直接用它，不再重新缩放
+- 同一张缩略图同时来了多个请求，只有一个线程去生成，其余的等它做完
+- 缓存键里带原图的大小和修改时间，原图换了缩略图自然失效；
+  模板里用 thumb_url() 生成的地址也带着原图修改时间，所以可以放心让浏览器长期缓存
+- 原图损坏、或者 Pillow 打不开 (格式不认识、像素数超限) 时不报 500，改为发原图 (浏览器也许能显示)；
+  这张图记下来，之后的请求不再重新尝试，直到原图被替换。写缓存失败 (磁盘满、没有权限) 不算坏图，照常报错
+"""
+import hashlib
+import logging
+import os
+import threading
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+from flask import url_for
+from werkzeug.security import safe_join
+
+import image_variants
+
+# 允许的宽度 (和 compress_images.py 的档位一致，避免被随便请求任意尺寸)
+THUMB_SIZES = image_variants.WIDTHS
+THUMB_QUALITY = 75
+IMAGE_EXTS = ('.jpg', '.jpeg', '.png', '.webp')
+
+# Pillow 解码不了原图时的异常 (格式不认识、文件损坏、像素数超过 Image.MAX_IMAGE_PIXELS)；
+# 文件被截断时 Pillow 抛的是普通 OSError，见 is_broken_image()
+BROKEN_IMAGE_ERRORS = (UnidentifiedImageError, Image.DecompressionBombError, SyntaxError)
+
+def is_broken_image(e):
+    """
+    功能：解码原图时的异常是不是原图本身的问题。
+    普通的 OSError 只有“文件被截断”算；读不了文件等其他 I/O 错误不算，不能把图永久记成坏的。
+    """
+    if isinstance(e, BROKEN_IMAGE_ERRORS):
+        return True
+    return isinstance(e, OSError) and 'truncated' in str(e).lower()
+
+logger = logging.getLogger(__name__)
+
+class Thumbnails:
+    """
+    功能：生成 / 缓存缩略图。
+    配置项：THUMB_DIR (默认 instance/thumbs), THUMB_CACHE_MAX_BYTES
+    """
+
+    def __init__(self, app=None, variants=None):
+        self.static_folder = None
+        self.directory = None
+        self.max_bytes = 0
+        self.variants = None
+        self._bytes = None # 缓存目录的总大小 (第一次用到时统计)
+        self._inflight = {} # 正在生成的缩略图：键 -> threading.Event
+        self._broken = set() # Pillow 打不开的原图 (缓存键)，不再重复尝试
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.failures = 0
+        if app is not None:
+            self.init_app(app, variants)
+
+    def init_app(self, app, variants=None):
+        self.static_folder = app.static_folder
+        self.directory = app.config.get('THUMB_DIR') or os.path.join(app.instance_path, 'thumbs')
+        self.max_bytes = app.config.get('THUMB_CACHE_MAX_BYTES', 512 * 1024 * 1024)
+        self.variants = variants
+        app.add_template_global(self.thumb_url, 'thumb_url')
+        app.add_template_global(self.thumb_srcset, 'thumb_srcset')
+
+    def thumb_url(self, filename, size):
+        """缩略图地址，带上原图的修改时间 (原图变了地址就变)"""
+        try:
+            version = os.stat(os.path.join(self.static_folder, filename)).st_mtime_ns
+        except OSError:
+            return url_for('static', filename=filename)
+        return url_for('thumbnail', size=size, filename=filename, v=version)
+
+    def thumb_srcset(self, filename, width=None):
+        """
+        各档缩略图的 srcset (<img srcset>)；知道原图宽度 (work_image / material_file 表) 时，
+        比原图还宽的档位按原图宽度标注 (缩略图不会放大)，重复的去掉
+        """
+        candidates = {}
+        for size in THUMB_SIZES:
+            w = min(size, width) if width else size
+            candidates.setdefault(w, self.thumb_url(filename, size))
+        return ', '.join(f'{url} {w}w' for w, url in candidates.items())
+
+    def source_path(self, filename):
+        """检查请求的路径：只允许 static/ 下的图片 (返回 None 表示不允许)"""
+        if not filename.lower().endswith(IMAGE_EXTS) or filename.startswith(image_variants.VARIANTS_DIR + '/'):
+            return None
+        path = safe_join(self.static_folder, filename)
+        return path if path and os.path.isfile(path) else None
+
+    def get(self, filename, size):
+        """
+        功能：返回 (缩略图文件路径, etag)；原图不存在或尺寸不允许时返回 None。
+        原图 Pillow 打不开时返回 (原图路径, None)，由调用方改发原图。
+        """
+        if size not in THUMB_SIZES:
+            return None
+        src = self.source_path(filename)
+        if src is None:
+            return None
+        st = os.stat(src)
+        etag = hashlib.sha1(f'{filename}\0{size}\0{st.st_size}\0{st.st_mtime_ns}'.encode('utf-8')).hexdigest()
+
+        # 已经有预先生成好的同宽度 WebP
+        prebuilt = self._prebuilt(filename, size, st)
+        if prebuilt:
+            return prebuilt, etag
+
+        if etag in self._broken:
+            return src, None
+
+        path = os.path.join(self.directory, etag[:2], etag + '.webp')
+        if self._touch(path):
+            self.hits += 1
+            return path, etag
+
+        # 合并并发请求：第一个请求负责生成，其余的等待
+        with self._lock:
+            event = self._inflight.get(etag)
+            owner = event is None
+            if owner:
+                event = self._inflight[etag] = threading.Event()
+        if not owner:
+            event.wait()
+            if os.path.exists(path):
+                return path, etag
+            if etag in self._broken:
+                return src, None
+        try:
+            self.misses += 1
+            img = self._decode(src, size)
+        except Exception as e:
+            if not is_broken_image(e):
+                raise
+            with self._lock:
+                self._broken.add(etag)
+                self.failures += 1
+            logger.warning('缩略图生成失败，改发原图: %s (%s)', filename, e)
+            return src, None
+        else:
+            # 写缓存失败 (磁盘满、没有权限) 直接报错，不记成坏图，下次请求再试
+            self._save(img, path)
+        finally:
+            if owner:
+                with self._lock:
+                    self._inflight.pop(etag, None)
+                event.set()
+        return path, etag
+
+    def _prebuilt(self, filename, size, st):
+        entry = self.variants.get(filename) if self.variants else None
+        if not entry or entry.get('size') != st.st_size or entry.get('mtime_ns') != st.st_mtime_ns:
+            return None
+        for w, path in entry['variants'].get('webp', ()):
+            if w == size:
+                full = os.path.join(self.static_folder, path)
+                return full if os.path.exists(full) else None
+        return None
+
+    def _touch(self, path):
+        """缓存命中时更新 mtime，作为“最近访问时间”"""
+        try:
+            os.utime(path)
+            return True
+        except OSError:
+            return False
+
+    def _decode(self, src, size):
+        """读原图并缩小 (解码都在这里完成，返回的图片已经在内存里)"""
+        with Image.open(src) as img:
+            img = ImageOps.exif_transpose(img)
+            if img.mode not in ('RGB', 'RGBA'):
+                img = img.convert('RGBA' if 'A' in img.getbands() or 'transparency' in img.info else 'RGB')
+            # thumbnail() 只缩小不放大，保持宽高比
+            img.thumbnail((size, size * 4), Image.LANCZOS)
+            img.load()
+            return img
+
+    def _save(self, img, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            img.save(tmp, 'WEBP', quality=THUMB_QUALITY, method=4)
+            os.replace(tmp, path)
+        except BaseException:
+            # 写了一半的临时文件不留在缓存目录里
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        self._account(path)
+
+    def _account(self, new_path):
+        """记账；总大小超出上限时删掉最久没访问的文件 (刚生成的这张除外)，删到上限的 90%"""
+        with self._lock:
+            if self._bytes is None:
+                self._bytes = sum(size for _, size, _ in self._scan())
+            else:
+                self._bytes += os.path.getsize(new_path)
+            if self._bytes <= self.max_bytes:
+                return
+            # 其他 worker 也在写，重新统计一遍再淘汰
+            files = sorted(self._scan())
+            self._bytes = sum(size for _, size, _ in files)
+            target = self.max_bytes * 0.9
+            for _, size, path in files:
+                if self._bytes <= target:
+                    break
+                if path == new_path:
+                    continue
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                self._bytes -= size
+                self.evictions += 1
+
+    def _scan(self):
+        """缓存目录里的所有文件：(mtime, 大小, 路径)"""
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith('.webp'):
+                    path = os.path.join(root, name)
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue
+                    yield st.st_mtime, st.st_size, path
+
+    def stats(self):
+        return {'bytes': self._bytes, 'max_bytes': self.max_bytes,
+                'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions, 'failures': self.failures}
@@ -0,0 +1,256 @@
+"""
+关键词趋势：一个词在各年份、各作家的作品里出现多少次 (按语料字数归一化)
+
+- init_db.py 导入时把所有作品的正文 (折叠成简体小写，见 zh_convert.fold) 切成 1~NGRAM_MAX 字的片段，
+  统计每篇作品里每个片段出现的次数，存成按列压缩的稀疏矩阵 (CSC：每个片段一列，列里是 作品下标 + 次数)，
+  连同每篇的年份、作家、字数写到 instance/ngrams.npz
+- 查询时只取关键词那一列，按年份 / 作家用 np.bincount 求和，再除以该组的总字数 (每万字多少次)，
+  不用读正文；几个关键词就取几列，放在同一张图里比较
+- 比 NGRAM_MAX 长的关键词没有对应的列，改用全文索引 (search_index) 数出每篇的次数，之后的汇总一样
+- 次数一律按不重叠的出现来数 (和检索结果的高亮、词频图一样，“哈哈哈”里的“哈哈”算 1 次)。
+  矩阵里的片段是重叠着数的，只有自身不会重叠的关键词 (开头和结尾没有相同的部分) 两种数法才一样，
+  其他关键词 (比如“哈哈”) 也改走全文索引
+只用 NumPy (不需要 SciPy)：稀疏矩阵就是三个数组 indptr / rows / counts。
+"""
+import os
+import re
+import tempfile
+import threading
+from collections import Counter
+
+import numpy as np
+
+import search_index
+import search_query
+from zh_convert import fold
+
+# 片段最长几个字 (3 字以内的关键词直接查矩阵)
+NGRAM_MAX = 3
+
+# 归一化：每多少字
+PER_CHARS = 10_000
+
+# 一次最多比较几个关键词
+MAX_KEYWORDS = 6
+
+FILE_NAME = 'ngrams.npz'
+
+_SPACE = re.compile(r'\s+')
+# 关键词之间用空格、逗号、顿号隔开
+_KEYWORD_SEP = re.compile(r'[\s,，、;；]+')
+
+def split_keywords(s):
+    """把输入拆成关键词列表 (去重，保持顺序，最多 MAX_KEYWORDS 个)"""
+    keywords = []
+    for k in _KEYWORD_SEP.split(s or ''):
+        k = k.strip('"“”')
+        if k and k not in keywords:
+            keywords.append(k)
+    return keywords[:MAX_KEYWORDS]
+
+# ============================================
+# 1. 导入时 (init_db.py 调用)
+# ============================================
+
+def build(rows):
+    """
+    功能：rows 是 (id, 正文, 年份, 作家)，返回写文件用的数组字典。
+    正文去掉空白后切片段 (片段不跨过空白)，字数也不算空白。
+    """
+    doc_ids, years, authors, sizes = [], [], [], []
+    per_doc = []
+    for work_id, content, year, author in rows:
+        chunks = _SPACE.split(fold(content or ''))
+        grams = Counter()
+        for chunk in chunks:
+            for n in range(1, NGRAM_MAX + 1):
+                grams.update(chunk[i:i + n] for i in range(len(chunk) - n + 1))
+        doc_ids.append(work_id)
+        years.append(year or 0)
+        authors.append(author or '')
+        sizes.append(sum(len(c) for c in chunks))
+        per_doc.append(grams)
+
+    # 片段按字符串排序，查询时用二分查找定位列
+    vocab = sorted({g for grams in per_doc for g in grams})
+    column = {g: j for j, g in enumerate(vocab)}
+    cols, doc_rows, counts = [], [], []
+    for i, grams in enumerate(per_doc):
+        for g, n in grams.items():
+            cols.append(column[g])
+            doc_rows.append(i)
+            counts.append(n)
+    cols = np.asarray(cols, dtype=np.int32)
+    order = np.argsort(cols, kind='stable') # 列内保持作品顺序
+    indptr = np.zeros(len(vocab) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(cols, minlength=len(vocab)), out=indptr[1:])
+    return {
+        'doc_ids': np.asarray(doc_ids, dtype=np.int64),
+        'years': np.asarray(years, dtype=np.int32),
+        'authors': np.asarray(authors, dtype=str),
+        'sizes': np.asarray(sizes, dtype=np.int64),
+        'vocab': np.asarray(vocab, dtype=f'<U{NGRAM_MAX}'),
+        'indptr': indptr,
+        'rows': np.asarray(doc_rows, dtype=np.int32)[order],
+        'counts': np.asarray(counts, dtype=np.int32)[order],
+    }
+
+def write_temp(path, arrays):
+    """写到 path 同一目录下的临时文件 (名字不会和别的导入冲突)，返回临时文件的路径"""
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=os.path.basename(path) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, **arrays)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    return tmp
+
+def rebuild(conn, path):
+    """
+    功能：从 work 表 (conn 当前事务里看到的数据) 重新生成 path 的内容，先写到临时文件。
+    返回 (临时文件, 作品数, 片段数)；调用方提交事务之后再 publish()，
+    事务失败 (回滚) 时 discard()，网站不会读到和数据库对不上的矩阵。
+    几百篇只要一两秒。
+    """
+    from sqlalchemy import text
+
+    rows = conn.execute(text('SELECT id, content, year, author FROM work ORDER BY id'))
+    arrays = build(rows)
+    return write_temp(path, arrays), len(arrays['doc_ids']), len(arrays['vocab'])
+
+def publish(tmp, path):
+    """把 rebuild() 写好的临时文件换上去 (原子替换，网站进程不会读到写了一半的文件)"""
+    os.replace(tmp, path)
+
+def discard(tmp):
+    """删掉没用上的临时文件"""
+    try:
+        os.unlink(tmp)
+    except FileNotFoundError:
+        pass
+
+# ============================================
+# 2. 查询
+# ============================================
+
+def self_overlapping(term):
+    """开头和结尾有相同的部分 (比如“哈哈”、“啊呀啊”)：连着出现时重叠着数和不重叠地数结果不同"""
+    return any(term[:k] == term[-k:] for k in range(1, len(term)))
+
+class TrendIndex:
+    """加载好的计数矩阵；trend() 算出一组关键词按年份 / 作家的趋势"""
+
+    def __init__(self, arrays):
+        self.doc_ids = arrays['doc_ids']
+        self.years = arrays['years']
+        self.authors = arrays['authors']
+        self.sizes = arrays['sizes']
+        self.vocab = arrays['vocab']
+        self.indptr = arrays['indptr']
+        self.rows = arrays['rows']
+        self.counts = arrays['counts']
+        self._row_of = {int(work_id): i for i, work_id in enumerate(self.doc_ids)}
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls({name: data[name] for name in data.files})
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    def doc_counts(self, keyword, conn=None):
+        """
+        功能：关键词在每篇作品里 (不重叠地) 出现的次数 (长度 = 作品数的数组)。
+        超过 NGRAM_MAX 字、或者自身会重叠时用全文索引 (conn) 数；没有 conn 或没有索引时返回 None。
+        """
+        term = fold(keyword)
+        result = np.zeros(len(self.doc_ids), dtype=np.int64)
+        if len(term) <= NGRAM_MAX and not self_overlapping(term):
+            j = int(np.searchsorted(self.vocab, term))
+            if j < len(self.vocab) and self.vocab[j] == term:
+                start, end = self.indptr[j], self.indptr[j + 1]
+                result[self.rows[start:end]] = self.counts[start:end]
+            return result
+
+        hits = search_index.search(conn, search_query.parse(f'"{keyword}"')) if conn is not None else None
+        if hits is None:
+            return None
+        for work_id, hit in hits.items():
+            i = self._row_of.get(work_id)
+            if i is not None:
+                result[i] = len(hit.content_spans)
+        return result
+
+    def groups(self, by):
+        """
+        功能：分组。返回 (组名列表, 每篇作品所在组的下标)；不属于任何组的作品下标为 -1。
+        by='year' 时不算年份未知的作品，by='author' 时作家按语料字数从多到少排。
+        """
+        if by == 'year':
+            labels = np.unique(self.years[self.years > 0])
+            index = np.where(self.years > 0, np.searchsorted(labels, self.years), -1)
+            return [int(y) for y in labels], index
+        labels, index = np.unique(self.authors, return_inverse=True)
+        order = np.argsort(-np.bincount(index, weights=self.sizes), kind='stable')
+        rank = np.empty_like(order)
+        rank[order] = np.arange(len(order))
+        return [str(a) for a in labels[order]], rank[index]
+
+    def trend(self, keywords, by='year', conn=None):
+        """
+        功能：几个关键词按 by (year / author) 分组的趋势。
+        返回 {'labels': 组名, 'sizes': 每组字数,
+              'series': [{'keyword', 'counts': 每组次数, 'works': 每组出现的篇数, 'rate': 每 PER_CHARS 字次数}]}
+        用不了的关键词 (长词又没有全文索引) 不在 series 里。
+        """
+        labels, index = self.groups(by)
+        kept = index >= 0
+        index = index[kept]
+        sizes = np.bincount(index, weights=self.sizes[kept], minlength=len(labels))
+        series = []
+        for keyword in keywords:
+            counts = self.doc_counts(keyword, conn)
+            if counts is None:
+                continue
+            counts = counts[kept]
+            totals = np.bincount(index, weights=counts, minlength=len(labels))
+            works = np.bincount(index, weights=counts > 0, minlength=len(labels))
+            rate = np.divide(totals * PER_CHARS, sizes, out=np.zeros_like(totals), where=sizes > 0)
+            series.append({'keyword': keyword, 'counts': totals.astype(int).tolist(),
+                           'works': works.astype(int).tolist(), 'rate': np.round(rate, 3).tolist()})
+        return {'labels': labels, 'sizes': sizes.astype(int).tolist(), 'series': series}
+
+class Trends:
+    """
+    功能：网站进程里的 TrendIndex (第一次用到时加载；init_db.py 重建文件后按修改时间自动重新加载)。
+    配置项：TRENDS_FILE (默认 instance/ngrams.npz)
+    """
+
+    def __init__(self, app=None):
+        self.path = None
+        self._lock = threading.Lock()
+        self._loaded = (None, None) # (mtime, TrendIndex)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('TRENDS_FILE', None)
+        self.path = app.config['TRENDS_FILE'] or os.path.join(app.instance_path, FILE_NAME)
+
+    def get(self):
+        """返回 TrendIndex；文件还没生成 (没运行过 init_db.py) 时返回 None"""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+        loaded_mtime, index = self._loaded
+        if loaded_mtime == mtime:
+            return index
+        with self._lock:
+            if self._loaded[0] != mtime:
+                self._loaded = (mtime, TrendIndex.load(self.path))
+            return self._loaded[1]
@@ -0,0 +1,57 @@
+"""
+简繁转换服务
+
+- convert() / keyword_forms()：带 LRU 缓存的 zhconv 转换，同一个关键词在进程里只真正转换一次
+  (页面上每一行的高亮、摘录都只是查缓存)
+- fold()：逐字的简繁折叠 (转简体 + 英文小写)，转换表在启动时一次性建好，
+  长度不变、不走 zhconv 的分词，适合导入时批量处理整篇文章 (见 search_index.py)
+"""
+from functools import lru_cache
+
+from zhconv import zhconv as _zhconv
+
+from instrumentation import stage
+
+# 缓存条数上限 (超出后淘汰最久没用的)
+CACHE_SIZE = 4096
+
+@lru_cache(maxsize=CACHE_SIZE)
+def convert(text, locale):
+    # 只有缓存没命中时才会走到这里，请求计时里的 zhconv 就是真正转换花的时间
+    with stage('zhconv'):
+        return _zhconv.convert(text, locale)
+
+@lru_cache(maxsize=CACHE_SIZE)
+def keyword_forms(keyword):
+    """返回关键词的 (简体, 繁体) 两种写法"""
+    return convert(keyword, 'zh-cn'), convert(keyword, 'zh-tw')
+
+def cache_info():
+    """转换缓存的命中情况 (供基准测试和监控使用)"""
+    return {'convert': convert.cache_info()._asdict(), 'keyword_forms': keyword_forms.cache_info()._asdict()}
+
+# ============================================
+# 逐字折叠表 (启动时建好)
+# ============================================
+
+def _build_fold_table():
+    """
+    功能：从 zhconv 的词典里挑出“单字 -> 单字”的映射，做成 str.translate 用的表。
+    只用单字映射，保证折叠后长度不变，下标可以直接对应回原文。
+    """
+    table = {}
+    for src, dst in _zhconv.getdict('zh-cn').items():
+        if len(src) == 1 and len(dst) == 1 and src != dst:
+            table[ord(src)] = dst
+    # 英文统一小写 (原来的高亮是 IGNORECASE)
+    for c in range(ord('A'), ord('Z') + 1):
+        table[c] = chr(c + 32)
+    return table
+
+FOLD_TABLE = _build_fold_table()
+
+def fold(s):
+    """把文本折叠成统一的检索形式 (简体 + 小写)，长度不变"""
+    if not s:
+        return ''
+    return s.translate(FOLD_TABLE)